@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from io import StringIO
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from fancy_ray_tracer import *
+from fancy_ray_tracer.camera import _render
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.parsers import WavefrontOBJ
+
+# Timings of the tracer phases, written as JSON to compare commits:
+#   python benchmark.py --output benchmark.json [--quick] [--only micro,parse]
+
+OBJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '3d_objects')
+MODELS = ('teapot-low', 'teapot_mild', 'teapot_refined',
+          'cow-nonormals', 'teddy', 'pumpkin_tall_10k')
+# the pure python renderer tests every triangle of a mesh, so only the small
+# teapot is rendered
+RENDER_MODELS = ('teapot-low',)
+PHASES = ('parse', 'build', 'render', 'parallel', 'native', 'micro')
+# (hsize, vsize) of the renders
+RESOLUTION = (96, 72)
+QUICK_RESOLUTION = (32, 24)
+MICRO_RAYS = 2000
+QUICK_MICRO_RAYS = 200
+
+
+def best_time(fn: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def read_model(name: str) -> str:
+    with open(os.path.join(OBJECTS_DIR, f'{name}.obj')) as f:
+        return f.read()
+
+
+def parse_model(data: str) -> Group:
+    return WavefrontOBJ(StringIO(data)).parse()
+
+
+def showcase_scene():
+    # the scene of main.py
+    floor = Plane()
+    floor.material = make_material()
+    floor.material.color = make_color(1, 0.9, 0.9)
+    floor.material.specular = 0.0
+    floor.material.pattern = ChessPattern(
+        make_color(0, 0, 0), make_color(1, 1, 1))
+
+    left_wall = Plane()
+    left_wall.set_transform(chain_ops(
+        [translation(0, 0, 5), rotY(-PI / 4), rotX(PI / 2)]))
+    left_wall.material = make_material()
+    left_wall.material.color = make_color(1, 0.9, 0.9)
+    left_wall.material.specular = 0.0
+    left_wall.material.pattern = ChessPattern(
+        make_color(0, 0, 0), make_color(1, 1, 1))
+
+    right_wall = Plane()
+    right_wall.set_transform(chain_ops(
+        [translation(0, 0, 5), rotY(PI / 4), rotX(PI / 2)]))
+    right_wall.material = left_wall.material
+
+    middle = Cube()
+    middle.set_transform(
+        chain_ops([translation(0, 1.8, -0.5), rotX(PI / 4), rotZ(PI / 4)]))
+    middle.material = make_material()
+    middle.material.color = make_color(0.8, 0, 0)
+    middle.material.diffuse = 0.7
+    middle.material.specular = 0.3
+    middle.material.reflective = 0.8
+
+    right = Cylinder(0, 2, closed=True)
+    right.set_transform(
+        chain_ops([translation(1.5, 1, -1.8), scaling(0.6, 0.5, 0.6), rotX(-PI / 8)]))
+    right.material = make_material()
+    right.material.color = make_color(0.5, 1, 0.1)
+    right.material.diffuse = 0.7
+    right.material.specular = 0.3
+    right.material.reflective = 0.2
+
+    left = Sphere()
+    left.set_transform(
+        chain_ops([translation(-1.5, 0.33, -0.75), scaling(0.33, 0.33, 0.33), ]))
+    left.material = make_material()
+    left.material.color = make_color(1, 0.8, 0.1)
+    left.material.diffuse = 0.7
+    left.material.specular = 0.3
+
+    other = Cone(-0.5, 0.5, closed=True)
+    other.set_transform(
+        chain_ops([translation(-2, 1.5, -0.75), rotX(PI / 6), rotZ(PI / 6)]))
+    other.material = make_material()
+    other.material.color = make_color(0, 0, 0.8)
+    other.material.diffuse = 0.7
+    other.material.specular = 0.3
+    other.material.reflective = 0.6
+
+    g = Group()
+    g.add_shape(middle)
+    g.add_shape(left)
+    g.add_shape(right)
+    g.add_shape(make_box(other))
+
+    world = World(Light(point(-10, 10, -10), make_color(1, 1, 1)))
+    world.add_object(floor)
+    world.add_object(left_wall)
+    world.add_object(right_wall)
+    world.add_object(g)
+    transform = view_transform(point(0, 2, -7), point(0, 1.5, 0), vector(0, 1, 0))
+    return world, transform
+
+
+def hexagon_scene():
+    # the scene of hexagon.py
+    hexagon = Group()
+    for i in range(6):
+        corner = Sphere()
+        corner.set_transform(
+            chain_ops([translation(0, 0, -1), scaling(0.25, 0.25, 0.25)]))
+        edge = Cylinder(0, 1)
+        edge.set_transform(chain_ops(
+            [translation(0, 0, -1), rotY(-PI / 6), rotZ(-PI / 2), scaling(0.25, 1, 0.25)]))
+        side = Group()
+        side.add_shape(corner)
+        side.add_shape(edge)
+        side = make_box(side)
+        side.set_transform(rotY(i * PI / 3))
+        hexagon.add_shape(side)
+
+    world = World(Light(point(-10, 10, -10), make_color(1, 1, 1)))
+    world.add_object(make_box(hexagon))
+    transform = view_transform(point(0, 3, -5), point(0, 0, 0), vector(0, 1, 0))
+    return world, transform
+
+
+def model_scene(name: str):
+    # the scene of obj.py for any of the bundled models
+    g = parse_model(read_model(name))
+    g.set_transform(chain_ops([rotX(4 * PI / 3), scaling(0.5, 0.5, 0.5)]))
+    world = World(Light(point(-10, 10, -10), make_color(1, 1, 1)))
+    world.add_object(make_box(g))
+    transform = view_transform(point(0, 2, -40), point(0, 1.5, 0), vector(0, 1, 0))
+    return world, transform
+
+
+def scenes() -> Dict[str, Callable]:
+    result = {'showcase': showcase_scene, 'hexagon': hexagon_scene}
+    for name in RENDER_MODELS:
+        result[name] = lambda name=name: model_scene(name)
+    return result
+
+
+def micro_rays(n: int, seed: int = 0) -> List[Ray]:
+    # rays from a shell around the origin aimed close to it
+    rng = np.random.default_rng(seed)
+    origins = rng.normal(size=(n, 3))
+    origins *= (5 / np.linalg.norm(origins, axis=1))[:, None]
+    targets = rng.uniform(-0.8, 0.8, (n, 3))
+    directions = targets - origins
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    return [Ray(point(*o), vector(*d)) for o, d in zip(origins, directions)]
+
+
+def micro_shapes() -> Dict[str, WorldObject]:
+    mesh = parse_model(read_model('teapot-low'))
+    mesh.set_transform(scaling(0.05, 0.05, 0.05))
+    sphere = Sphere()
+    group = Group([Sphere(), Cube()])
+    group.shapes[0].set_transform(translation(-0.5, 0, 0))
+    group.shapes[1].set_transform(chain_ops([translation(0.5, 0, 0), scaling(0.4, 0.4, 0.4)]))
+    return {
+        'sphere': sphere,
+        'plane': Plane(),
+        'cube': Cube(),
+        'cylinder': Cylinder(-1, 1, closed=True),
+        'cone': Cone(-1, 0, closed=True),
+        'triangle': Triangle(point(-1, -1, 0), point(1, -1, 0), point(0, 1, 0)),
+        'csg': make_csg(CSGOperation.difference, Sphere(), Cube()),
+        'group': group,
+        'bounding_box': make_box(Sphere()),
+        'mesh_teapot_low': mesh,
+    }
+
+
+class Suite:
+    def __init__(self, quick: bool, repeat: int, phases: List[str]) -> None:
+        self.resolution = QUICK_RESOLUTION if quick else RESOLUTION
+        self.micro_rays = QUICK_MICRO_RAYS if quick else MICRO_RAYS
+        self.repeat = repeat
+        self.phases = phases
+        self.results: List[Dict] = []
+
+    def record(self, phase: str, name: str, seconds: float, **params) -> None:
+        self.results.append({'phase': phase, 'name': name, 'seconds': seconds, 'params': params})
+        print(f'{phase:<10} {name:<28} {seconds:10.4f} s', file=sys.stderr)
+
+    def camera(self, transform: np.ndarray) -> Camera:
+        c = Camera(self.resolution[0], self.resolution[1], PI / 3)
+        c.set_transform(transform)
+        return c
+
+    def run(self) -> None:
+        if 'parse' in self.phases or 'build' in self.phases:
+            for name in MODELS:
+                data = read_model(name)
+                if 'parse' in self.phases:
+                    self.record('parse', name, best_time(lambda: parse_model(data), self.repeat),
+                                lines=data.count('\n'))
+                if 'build' in self.phases:
+                    g = parse_model(data)
+                    self.record('build', f'{name}_box', best_time(lambda: make_box(g), self.repeat))
+                    world = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [g])
+                    self.record('build', f'{name}_bvh',
+                                best_time(lambda: (world.invalidate(), world.compile()), self.repeat),
+                                primitives=len(world.compile()))
+                    self.record('build', f'{name}_refit', best_time(world.refit, self.repeat),
+                                primitives=len(world.compile()))
+
+        for name, make_scene in scenes().items():
+            world, transform = make_scene()
+            c = self.camera(transform)
+            canvas = Canvas(self.resolution)
+            size = list(self.resolution)
+            if 'render' in self.phases:
+                self.record('render', name, best_time(
+                    lambda: c.render_sequential(world, canvas), 1), resolution=size)
+            if 'parallel' in self.phases:
+                self.record('parallel', name, best_time(
+                    lambda: c.render(world, canvas), 1), resolution=size)
+            if 'native' in self.phases and _render is not None:
+                world.compile()
+                self.record('native', name, best_time(
+                    lambda: c.render_native(world, canvas), self.repeat), resolution=size)
+
+        if 'micro' in self.phases:
+            rays = micro_rays(self.micro_rays)
+            for name, shape in micro_shapes().items():
+                def run(shape=shape):
+                    for r in rays:
+                        r.intersect(shape)
+                self.record('micro', name, best_time(run, self.repeat), rays=len(rays))
+
+
+def metadata() -> Dict[str, Optional[str]]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'compiled': _render is not None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='fancy_ray_tracer benchmark suite')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--quick', action='store_true', help='smaller renders and fewer rays')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    parser.add_argument('--only', default=','.join(PHASES),
+                        help=f"comma separated phases out of {','.join(PHASES)}")
+    args = parser.parse_args(argv)
+
+    phases = [phase for phase in args.only.split(',') if phase]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        parser.error(f"unknown phases {', '.join(sorted(unknown))}")
+
+    suite = Suite(args.quick, args.repeat, phases)
+    suite.run()
+    with open(args.output, 'w') as f:
+        json.dump({'meta': {**metadata(), 'quick': args.quick, 'repeat': args.repeat},
+                   'results': suite.results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 from distutils.core import setup
 
 import numpy
@@ -12,6 +13,13 @@ def build_ext(path: str, use_numpy=True):
     if use_numpy:
         for ext in exts:
             ext.include_dirs = [numpy.get_include()]
+    for ext in exts:
+        # the tile renderer parallelizes with prange
+        if ext.name.endswith('_render'):
+            flag = '/openmp' if sys.platform == 'win32' else '-fopenmp'
+            ext.extra_compile_args.append(flag)
+            if sys.platform != 'win32':
+                ext.extra_link_args.append(flag)
     return exts
 
 
@@ -1,7 +1,8 @@
+from .animation import Animation, Chain, Keyframes, LookAt, Motion
 from .camera import Camera
-from .canvas import Canvas
+from .canvas import Canvas, TiledCanvas
 from .constants import PI, CSGOperation
-from .illumination import Light, lighting, reflect
+from .illumination import Light, RectangleLight, SphereLight, lighting, reflect
 from .materials import (
     ChessPattern,
     LinearGradient,
@@ -16,6 +17,7 @@ from .primitives import (
     Cube,
     Cylinder,
     Group,
+    Instance,
     Plane,
     Sphere,
     Triangle,
@@ -24,7 +26,16 @@ from .primitives import (
     make_csg,
 )
 from .protocols import WorldObject
-from .ray import Computations, Intersection, Ray, hit, hit_sorted, normal_at
+from .ray import (
+    Computations,
+    Intersection,
+    IntersectionBuffer,
+    Ray,
+    hit,
+    hit_sorted,
+    normal_at,
+)
+from .textures import ImagePattern, TextureCache
 from .tuples import make_color, normalize, point, vector
 from .utils import chain, chain_ops, equal
 from .world import World, schlick
@@ -0,0 +1,315 @@
+import os
+import pickle
+import subprocess
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import chain
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .camera import Camera
+from .canvas import Canvas, to_rgb8
+from .constants import ANIMATION_FPS, ANIMATION_RUNS_PER_PROCESS, REPROJECTION_RUN
+from .matrices import view_transform
+from .protocols import WorldObject
+from .reprojection import FrameHistory, render_reprojected
+from .utils import chain_ops
+from .world import World
+
+# Frame sequences: the transforms of objects and of the camera are tracks,
+# functions of the time in seconds returning a 4x4 matrix. Keyframes,
+# Motion, Chain and LookAt build them, any other callable works as long as
+# it pickles (a module level function does, a lambda doesn't) because the
+# scene and its tracks are sent once to every worker process, which then
+# renders whole frames and only gets frame numbers after that
+#
+#   spin = Motion(rotY, Keyframes([(0, 0), (2, 2 * PI)]))
+#   animation = Animation(world, camera, frames=48)
+#   animation.animate(teapot, Chain(translation(0, 1, 0), spin))
+#   animation.animate(camera, LookAt(Keyframes([(0, (0, 2, -6)), (2, (3, 2, -5))]), (0, 1, 0)))
+#   animation.render('out/frame_{:04d}.png', encoder=ffmpeg_command('out.mp4'))
+#
+# Frames already in the numbered images are not rendered again, so a run
+# that was interrupted resumes at the first missing frame. Delete the
+# images after changing the scene
+
+Track = Callable[[float], Any]
+Target = Union[WorldObject, Camera]
+
+EASINGS = {
+    'linear': lambda s: s,
+    'smooth': lambda s: s * s * (3 - 2 * s),
+    'step': lambda s: 0.0,
+}
+
+
+def _at(value: Any, t: float) -> Any:
+    return value(t) if callable(value) else value
+
+
+class Keyframes:
+    # value at time t of (time, value) keys, blended between two keys and
+    # held before the first and after the last one. Values are numbers or
+    # arrays, a matrix is blended entry by entry which is right for a
+    # translation or a scaling only, key the angle of a rotation instead
+    __slots__ = ("times", "values", "easing")
+
+    def __init__(self, keys: Sequence[Tuple[float, Any]], easing: str = 'linear') -> None:
+        if len(keys) == 0:
+            raise ValueError("keyframes need at least one key")
+        if easing not in EASINGS:
+            raise ValueError(f"unknown easing {easing}")
+        keys = sorted(keys, key=lambda key: key[0])
+        self.times: np.ndarray = np.array([key[0] for key in keys], dtype=np.float64)
+        self.values: List[np.ndarray] = [np.asarray(key[1], dtype=np.float64) for key in keys]
+        self.easing: str = easing
+
+    def __call__(self, t: float) -> Any:
+        i = int(np.searchsorted(self.times, t, side='right'))
+        if i == 0:
+            value = self.values[0]
+        elif i == len(self.times):
+            value = self.values[-1]
+        else:
+            t0, t1 = self.times[i - 1], self.times[i]
+            s = EASINGS[self.easing]((t - t0) / (t1 - t0))
+            v0, v1 = self.values[i - 1], self.values[i]
+            value = v0 + (v1 - v0) * s
+        return float(value) if value.ndim == 0 else value.copy()
+
+
+class Motion:
+    # op(*args) at time t, the arguments that are tracks are evaluated at
+    # t first: Motion(translation, Keyframes([(0, 0), (1, 5)]), 0, 0)
+    __slots__ = ("op", "args")
+
+    def __init__(self, op: Callable[..., np.ndarray], *args: Any) -> None:
+        self.op: Callable[..., np.ndarray] = op
+        self.args: Tuple[Any, ...] = args
+
+    def __call__(self, t: float) -> np.ndarray:
+        return self.op(*(_at(arg, t) for arg in self.args))
+
+
+class Chain:
+    # chain_ops of tracks and fixed matrices, the last one is applied first
+    __slots__ = ("ops",)
+
+    def __init__(self, *ops: Union[Track, np.ndarray]) -> None:
+        self.ops: Tuple[Union[Track, np.ndarray], ...] = ops
+
+    def __call__(self, t: float) -> np.ndarray:
+        return chain_ops([_at(op, t) for op in self.ops])
+
+
+class LookAt:
+    # view_transform of a camera at eye looking at to, each of them a
+    # track or a fixed (x, y, z)
+    __slots__ = ("eye", "to", "up")
+
+    def __init__(self, eye: Any, to: Any, up: Any = (0, 1, 0)) -> None:
+        self.eye: Any = eye
+        self.to: Any = to
+        self.up: Any = up
+
+    def __call__(self, t: float) -> np.ndarray:
+        eye = np.asarray(_at(self.eye, t), dtype=np.float64)[:3]
+        to = np.asarray(_at(self.to, t), dtype=np.float64)[:3]
+        up = np.asarray(_at(self.up, t), dtype=np.float64)[:3]
+        return view_transform(np.append(eye, 1.0), np.append(to, 1.0), np.append(up, 0.0))
+
+
+def ffmpeg_command(path: Union[str, os.PathLike], fps: float = ANIMATION_FPS) -> List[str]:
+    # encoder reading the frames as PPM images from its standard input
+    return ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'image2pipe', '-c:v', 'ppm',
+            '-framerate', f'{fps}', '-i', '-', '-pix_fmt', 'yuv420p', os.fspath(path)]
+
+
+def ppm_bytes(image: np.ndarray) -> bytes:
+    height, width = image.shape[:2]
+    return b'P6\n%d %d\n255\n' % (width, height) + np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+
+
+class Animation:
+    __slots__ = ("world", "camera", "frames", "fps", "tracks")
+
+    def __init__(self, world: World, camera: Camera, frames: int, fps: float = ANIMATION_FPS) -> None:
+        self.world: World = world
+        self.camera: Camera = camera
+        self.frames: int = frames
+        self.fps: float = fps
+        self.tracks: List[Tuple[Target, Track]] = []
+
+    def animate(self, target: Target, track: Track) -> None:
+        # target is an object of the world or the camera, its transform is
+        # track(t). An object inside a bounding box group keeps the box it
+        # had when the group was made, animate the box instead
+        self.tracks.append((target, track))
+
+    def time(self, frame: int) -> float:
+        return frame / self.fps
+
+    def apply(self, frame: int, native: bool = False) -> None:
+        # moves the targets to the given frame, with native the compiled
+        # snapshot of the world follows by a refit of its BVH
+        t = self.time(frame)
+        for target, track in self.tracks:
+            target.set_transform(np.asarray(track(t), dtype=np.float64))
+        if native:
+            self.world.refit()
+
+    def render_frame(self, frame: int, ray_budget: Optional[int] = None,
+                     native: bool = False) -> np.ndarray:
+        # (vsize, hsize, 3) bytes of one frame, rendered in this process
+        self.apply(frame, native)
+        camera = self.camera
+        if native:
+            colors = camera.render_native(self.world, Canvas((camera.hsize, camera.vsize)))
+        else:
+            colors = camera._render_tile(self.world, (0, 0, camera.hsize, camera.vsize), ray_budget)
+        return to_rgb8(colors)
+
+    def render_run(self, frames: Sequence[int], ray_budget: Optional[int] = None,
+                   native: bool = False, reproject: bool = False) -> List[np.ndarray]:
+        # consecutive frames, with reproject every frame reuses the shading
+        # of the one before
+        if not reproject:
+            return [self.render_frame(n, ray_budget, native) for n in frames]
+        images = []
+        history: Optional[FrameHistory] = None
+        for n in frames:
+            self.apply(n)
+            history = render_reprojected(self.world, self.camera, history, ray_budget)
+            images.append(to_rgb8(history.colors))
+        return images
+
+    def render(self, output: Optional[str] = None, encoder: Optional[Sequence[str]] = None,
+               processes: Optional[int] = None, ray_budget: Optional[int] = None,
+               native: bool = False, reproject: bool = False,
+               callback: Optional[Callable[[int, np.ndarray], None]] = None) -> int:
+        # renders the frames in parallel, processes of them at a time, and
+        # hands them over in order. output is a pattern like
+        # 'frames/{:04d}.png' the frame number is formatted into, encoder a
+        # command (see ffmpeg_command) the frames are written to as PPM.
+        # Returns the number of frames rendered, the ones found in output
+        # are read back instead of rendered. reproject is for walkthroughs,
+        # see reprojection.py, the workers get runs of REPROJECTION_RUN
+        # frames and only the first of a run is shaded in full
+        if output is None and encoder is None and callback is None:
+            raise ValueError("nothing to do with the frames, give output, encoder or callback")
+        if reproject and (native or any(target is not self.camera for target, _ in self.tracks)):
+            raise ValueError("reprojection needs the python renderer and a scene where only the camera moves")
+        done = set()
+        if output is not None:
+            directory = os.path.dirname(output.format(0))
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            done = {n for n in range(self.frames) if os.path.exists(output.format(n))}
+        missing = [n for n in range(self.frames) if n not in done]
+
+        pipe = None
+        if encoder is not None:
+            pipe = subprocess.Popen(list(encoder), stdin=subprocess.PIPE)
+        try:
+            # the frames on disk are only read back when something needs them
+            reread = encoder is not None or callback is not None
+            for n, image in self._frames(missing, done if reread else set(), output,
+                                         processes, ray_budget, native, reproject):
+                if output is not None and n not in done:
+                    _save_frame(output.format(n), image)
+                if pipe is not None:
+                    pipe.stdin.write(ppm_bytes(image))
+                if callback is not None:
+                    callback(n, image)
+        finally:
+            if pipe is not None:
+                pipe.stdin.close()
+                code = pipe.wait()
+        if pipe is not None and code != 0:
+            raise subprocess.CalledProcessError(code, list(encoder))
+        return len(missing)
+
+    def _frames(self, missing: List[int], done: set, output: Optional[str],
+                processes: Optional[int], ray_budget: Optional[int],
+                native: bool, reproject: bool) -> Iterator[Tuple[int, np.ndarray]]:
+        # the missing frames and the done ones read back, in order
+        runs = _runs(missing, REPROJECTION_RUN if reproject else 1)
+        rendered = iter(())
+        pool = None
+        if runs:
+            processes = os.cpu_count() if processes is None else processes
+            processes = min(processes, len(runs))
+            payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+            if processes == 1:
+                # a copy here too, the caller's scene stays where it was
+                animation = pickle.loads(payload)
+                images = (animation.render_run(run, ray_budget, native, reproject) for run in runs)
+            else:
+                pool = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(payload,))
+                images = _bounded_map(pool, _render_worker, runs, ANIMATION_RUNS_PER_PROCESS * processes,
+                                      ray_budget, native, reproject)
+            rendered = chain.from_iterable(images)
+        try:
+            for n in sorted(done.union(missing)):
+                if n in done:
+                    with Image.open(output.format(n)) as image:
+                        yield n, np.asarray(image.convert('RGB'))
+                else:
+                    yield n, next(rendered)
+        finally:
+            if pool is not None:
+                # cancels the runs not started yet
+                images.close()
+                pool.shutdown(wait=True)
+
+
+def _bounded_map(pool: Executor, fn: Callable, items: Iterable, window: int,
+                 *args: Any) -> Iterator:
+    # pool.map(fn, items) in order with at most window calls submitted at a
+    # time. Closing the iterator cancels the calls still waiting
+    pending: Deque[Future] = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(fn, item, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _runs(frames: List[int], length: int) -> List[List[int]]:
+    # consecutive frames in runs of at most length
+    runs: List[List[int]] = []
+    for n in frames:
+        if runs and runs[-1][-1] == n - 1 and len(runs[-1]) < length:
+            runs[-1].append(n)
+        else:
+            runs.append([n])
+    return runs
+
+
+def _save_frame(path: str, image: np.ndarray) -> None:
+    # written aside and renamed so an interrupted run leaves no half frame
+    root, ext = os.path.splitext(path)
+    tmp = f'{root}.{os.getpid()}.tmp{ext}'
+    Image.fromarray(image, mode='RGB').save(tmp)
+    os.replace(tmp, path)
+
+
+# the animation of the worker process, a copy of the caller's one
+_ANIMATION: Optional[Animation] = None
+
+
+def _init_worker(payload: bytes) -> None:
+    global _ANIMATION
+    _ANIMATION = pickle.loads(payload)
+
+
+def _render_worker(run: List[int], ray_budget: Optional[int], native: bool,
+                   reproject: bool) -> List[np.ndarray]:
+    return _ANIMATION.render_run(run, ray_budget, native, reproject)
@@ -3,20 +3,31 @@
 # Copyright (2017) Nicolas P. Rougier - BSD license
 # More information at https://github.com/rougier/numpy-book
 # -----------------------------------------------------------------------------
-import matplotlib.pyplot as plt
+import os
+from math import fmod, sin
+from typing import Dict, Optional, Tuple, Union
+
 import numpy as np
 
+from .utils import cache_directory
+
+# offsets of the cells at distance at most 2 of a cell, without the cell itself
+_NEIGHBORHOOD = [(i, j) for i in range(-2, 3)
+                 for j in range(-2, 3) if i != 0 or j != 0]
 
-def Bridson_sampling(width=1.0, height=1.0, radius=0.025, k=30):
+
+def Bridson_sampling(width=1.0, height=1.0, radius=0.025, k=30, seed=None):
     # References: Fast Poisson Disk Sampling in Arbitrary Dimensions
     #             Robert Bridson, SIGGRAPH, 2007
+    rng = np.random.default_rng(seed)
+
     def squared_distance(p0, p1):
         return (p0[0] - p1[0])**2 + (p0[1] - p1[1])**2
 
     def random_point_around(p, k=1):
         # WARNING: This is not uniform around p but we can live with it
-        R = np.random.uniform(radius, 2 * radius, k)
-        T = np.random.uniform(0, 2 * np.pi, k)
+        R = rng.uniform(radius, 2 * radius, k)
+        T = rng.uniform(0, 2 * np.pi, k)
         P = np.empty((k, 2))
         P[:, 0] = p[0] + R * np.sin(T)
         P[:, 1] = p[1] + R * np.cos(T)
@@ -25,21 +36,17 @@ def Bridson_sampling(width=1.0, height=1.0, radius=0.025, k=30):
     def in_limits(p):
         return 0 <= p[0] < width and 0 <= p[1] < height
 
-    def neighborhood(shape, index, n=2):
-        row, col = index
-        row0, row1 = max(row - n, 0), min(row + n + 1, shape[0])
-        col0, col1 = max(col - n, 0), min(col + n + 1, shape[1])
-        I = np.dstack(np.mgrid[row0:row1, col0:col1])
-        I = I.reshape(I.size // 2, 2).tolist()
-        I.remove([row, col])
-        return I
-
     def in_neighborhood(p):
         i, j = int(p[0] / cellsize), int(p[1] / cellsize)
         if M[i, j]:
             return True
-        for (i, j) in N[(i, j)]:
-            if M[i, j] and squared_distance(p, P[i, j]) < squared_radius:
+        # the neighbourhood is walked in place instead of caching the cell
+        # indices of every cell, that cache dominated the sampling time
+        for (di, dj) in _NEIGHBORHOOD:
+            ni = i + di
+            nj = j + dj
+            if 0 <= ni < rows and 0 <= nj < cols and M[ni, nj] \
+                    and squared_distance(p, P[ni, nj]) < squared_radius:
                 return True
         return False
 
@@ -60,16 +67,10 @@ def Bridson_sampling(width=1.0, height=1.0, radius=0.025, k=30):
     P = np.zeros((rows, cols, 2), dtype=np.float32)
     M = np.zeros((rows, cols), dtype=bool)
 
-    # Cache generation for neighborhood
-    N = {}
-    for i in range(rows):
-        for j in range(cols):
-            N[(i, j)] = neighborhood(M.shape, (i, j), 2)
-
     points = []
-    add_point((np.random.uniform(width), np.random.uniform(height)))
+    add_point((rng.uniform(0, width), rng.uniform(0, height)))
     while len(points):
-        i = np.random.randint(len(points))
+        i = rng.integers(len(points))
         p = points[i]
         del points[i]
         Q = random_point_around(p, k)
@@ -79,7 +80,115 @@ def Bridson_sampling(width=1.0, height=1.0, radius=0.025, k=30):
     return P[M]
 
 
+def spread_order(points: np.ndarray, k: int) -> np.ndarray:
+    # greedy farthest point ordering, any prefix of the first k points
+    # covers the sampled domain as evenly as possible
+    points = points.copy()
+    k = min(k, len(points))
+    if k == 0:
+        return points
+    first = np.argmin(((points - points.mean(axis=0))**2).sum(axis=1))
+    points[[0, first]] = points[[first, 0]]
+    dist = ((points - points[0])**2).sum(axis=1)
+    for i in range(1, k):
+        far = i + np.argmax(dist[i:])
+        points[[i, far]] = points[[far, i]]
+        dist[[i, far]] = dist[[far, i]]
+        dist = np.minimum(dist, ((points - points[i])**2).sum(axis=1))
+    return points
+
+
+def toroidal_shift(points: np.ndarray, shift: np.ndarray) -> np.ndarray:
+    # Cranley-Patterson rotation, keeps the poisson disk property on the torus
+    return np.fmod(points + shift, 1.0)
+
+
+def rotate(points: np.ndarray, angle: float) -> np.ndarray:
+    # rotation around the center of the unit square, meant for points that
+    # are mapped to a disk afterwards
+    c = np.cos(angle)
+    s = np.sin(angle)
+    centered = points - 0.5
+    rotated = np.empty_like(points)
+    rotated[:, 0] = centered[:, 0] * c - centered[:, 1] * s
+    rotated[:, 1] = centered[:, 0] * s + centered[:, 1] * c
+    return rotated + 0.5
+
+
+def hash_shift(x: float, y: float, z: float = 0.0) -> Tuple[float, float]:
+    # cheap deterministic hash of a position (or pixel) to a shift in the
+    # unit square, the same key gives the same shift in every process
+    h = sin(x * 12.9898 + y * 78.233 + z * 37.719) * 43758.5453
+    u = fmod(abs(h), 1.0)
+    h = sin(x * 39.3468 + y * 11.135 + z * 83.155) * 24634.6345
+    v = fmod(abs(h), 1.0)
+    return u, v
+
+
+# part of the cached file names, bumped whenever Bridson_sampling or
+# spread_order give other points for the same arguments
+SAMPLES_FORMAT = 1
+
+
+class PoissonDiskCache:
+    # poisson disk sets in the unit square generated once per
+    # (radius, k, count, seed) and persisted as .npy files
+
+    def __init__(self, directory: Optional[Union[str, os.PathLike]] = None) -> None:
+        if directory is None:
+            directory = cache_directory('samples')
+        self.directory: str = os.fspath(directory)
+        self._sets: Dict[Tuple[float, int, int, int], np.ndarray] = {}
+
+    def _path(self, key: Tuple[float, int, int, int]) -> str:
+        radius, k, count, seed = key
+        return os.path.join(self.directory, f'poisson_v{SAMPLES_FORMAT}_r{radius:.6g}_k{k}_n{count}_s{seed}.npy')
+
+    def get(self, radius: float, k: int = 30, count: int = 0, seed: int = 0) -> np.ndarray:
+        # count = 0 returns the whole set, otherwise at most count points
+        # in farthest point order
+        key = (float(radius), int(k), int(count), int(seed))
+        points = self._sets.get(key)
+        if points is not None:
+            return points
+
+        path = self._path(key)
+        try:
+            points = np.load(path)
+        except (OSError, ValueError):
+            points = Bridson_sampling(
+                radius=radius, k=k, seed=seed).astype(np.float64)
+            if count > 0:
+                points = spread_order(points, count)[:count]
+            self._save(path, points)
+
+        points.setflags(write=False)
+        self._sets[key] = points
+        return points
+
+    def _save(self, path: str, points: np.ndarray) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp.npy'
+            np.save(tmp, points)
+            os.replace(tmp, path)
+        except OSError:
+            # a read only cache only costs the generation time
+            pass
+
+    def clear(self) -> None:
+        self._sets.clear()
+
+
+SAMPLE_CACHE = PoissonDiskCache()
+
+
+def poisson_disk_samples(radius: float, k: int = 30, count: int = 0, seed: int = 0) -> np.ndarray:
+    return SAMPLE_CACHE.get(radius, k, count, seed)
+
+
 # if __name__ == '__main__':
+#     import matplotlib.pyplot as plt
 
 #     plt.figure()
 #     plt.subplot(1, 1, 1, aspect=1)
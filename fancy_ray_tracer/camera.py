@@ -1,12 +1,30 @@
 import multiprocessing
+import os
 from math import ceil, sqrt, tan
-from typing import Optional
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from joblib import Parallel, delayed
 
 from fancy_ray_tracer.protocols import CanvasP
 
+from .canvas import Tile, TiledCanvas
+
+try:
+    from .compiled import _render
+except ImportError:
+    _render = None
+from .constants import (
+    ADAPTIVE_CONTRAST_THRESHOLD,
+    ADAPTIVE_MAX_SAMPLES,
+    EPSILON,
+    PROGRESSIVE_START_STRIDE,
+    RAY_REFLECTION_LIMIT,
+    RENDER_TILE_SIZE,
+)
+from . import instrumentation
+from .hashing import scene_hash
 from .matrices import inverse
 from .ray import Ray
 from .world import World
@@ -43,9 +61,10 @@ class Camera:
         self.transform = transform
         self.inv_transform = inverse(transform)
 
-    def ray_for_pixel(self, px: int, py: int) -> Ray:
-        xoffset: float = (px + 0.5) * self.pixel_size
-        yoffset: float = (py + 0.5) * self.pixel_size
+    def ray_for_pixel(self, px: int, py: int, dx: float = 0.5, dy: float = 0.5) -> Ray:
+        # dx and dy are the sub pixel offsets of the ray inside the pixel
+        xoffset: float = (px + dx) * self.pixel_size
+        yoffset: float = (py + dy) * self.pixel_size
         world_x: float = self.half_width - xoffset
         world_y: float = self.half_height - yoffset
 
@@ -55,27 +74,301 @@ class Camera:
         direction: np.ndarray = pixel - origin
         nm: float = sqrt(direction.dot(direction))
         direction *= 1 / nm
-        return Ray(origin, direction)
+        # the cone of the pixel, pixel_size wide at distance nm
+        return Ray(origin, direction, 0.0, self.pixel_size / nm)
 
-    def render(self, world: World, canvas: CanvasP):
+    def render(self, world: World, canvas: CanvasP, ray_budget: Optional[int] = None):
         ncpu = ceil(multiprocessing.cpu_count() / 2)
         pp = Parallel(n_jobs=ncpu, verbose=10)
-        c = pp(delayed(self._render_y)(world, y) for y in range(self.vsize))
+        # every worker counts on its own copy of the world, the counters
+        # come back with the rows and are merged here
+        start = world.shadow_cache_stats()
+        collect = instrumentation.enabled()
+        rows = pp(delayed(self._render_y_stats)(world, y, ray_budget, collect)
+                  for y in range(self.vsize))
+        c = []
+        hits = 0
+        misses = 0
+        for row, stats, shadow_cache in rows:
+            c.append(row)
+            if stats is not None:
+                instrumentation.STATS.merge(stats)
+            hits += shadow_cache[0]
+            misses += shadow_cache[1]
+        world.merge_shadow_cache_stats(start, hits, misses)
         for y in range(self.vsize):
             for x in range(self.hsize):
                 canvas.set_pixelf(x, y, c[y][x])
 
-    def _render_y(self, world: World, y: int):
+    def _render_y(self, world: World, y: int, ray_budget: Optional[int] = None):
         cc = []
         for x in range(self.hsize):
             r = self.ray_for_pixel(x, y)
-            c = world.color_at(r)
+            c = world.trace(r, ray_budget)
             cc.append(c)
         return cc
 
-    def render_sequential(self, world: World, canvas: CanvasP):
+    def _render_y_stats(self, world: World, y: int, ray_budget: Optional[int] = None,
+                        collect: bool = True):
+        # the row with the shadow cache hits and misses it made and, with
+        # collect, its instrumentation counters
+        before = world.shadow_cache_stats()
+        if collect:
+            with instrumentation.collect() as stats:
+                row = self._render_y(world, y, ray_budget)
+        else:
+            stats = None
+            row = self._render_y(world, y, ray_budget)
+        after = world.shadow_cache_stats()
+        return row, stats, (after["hits"] - before["hits"], after["misses"] - before["misses"])
+
+    def render_tiles(self, world: World, canvas: TiledCanvas, ray_budget: Optional[int] = None,
+                     n_jobs: Optional[int] = None, batch: int = 4) -> None:
+        # renders the tiles the canvas misses, batch tiles per worker at a
+        # time so only those are held in memory before reaching the file.
+        # The canvas keeps the tiles of this scene and camera only, anything
+        # else on it is rendered again
+        canvas.bind(scene_hash(world, self, canvas.screen_size, ray_budget))
+        if n_jobs is None:
+            n_jobs = ceil(multiprocessing.cpu_count() / 2)
+        tiles = canvas.missing_tiles()
+        if n_jobs == 1:
+            for tile in tiles:
+                canvas.write_tile(tile, self._render_tile(world, tile, ray_budget))
+        else:
+            with Parallel(n_jobs=n_jobs) as pp:
+                step = n_jobs * batch
+                for start in range(0, len(tiles), step):
+                    chunk = tiles[start:start + step]
+                    colors = pp(delayed(self._render_tile)(world, tile, ray_budget) for tile in chunk)
+                    for tile, c in zip(chunk, colors):
+                        canvas.write_tile(tile, c)
+        canvas.checkpoint()
+
+    def render_resumable(self, world: World, canvas: CanvasP, checkpoint: Union[str, os.PathLike],
+                         ray_budget: Optional[int] = None, n_jobs: Optional[int] = None,
+                         tile_size: int = RENDER_TILE_SIZE) -> None:
+        # render_tiles through a TiledCanvas at the checkpoint path, run it
+        # again after a crash and only the missing tiles are rendered
+        tiled = TiledCanvas(canvas.screen_size, checkpoint, tile_size)
+        self.render_tiles(world, tiled, ray_budget, n_jobs)
+        for y, row in enumerate(tiled.rows(1)):
+            for x, color in enumerate(row[0]):
+                canvas.set_pixel(x, y, tuple(int(c) for c in color))
+
+    def _render_tile(self, world: World, tile: Tile, ray_budget: Optional[int] = None) -> np.ndarray:
+        x0, y0, x1, y1 = tile
+        colors = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float64)
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                colors[y - y0, x - x0] = world.trace(self.ray_for_pixel(x, y), ray_budget)[:3]
+        return colors
+
+    def render_sequential(self, world: World, canvas: CanvasP, ray_budget: Optional[int] = None):
         for y in range(self.vsize):
             for x in range(self.hsize):
                 r = self.ray_for_pixel(x, y)
-                c = world.color_at(r)
+                c = world.trace(r, ray_budget)
                 canvas.set_pixelf(x, y, c)
+
+    def render_progressive(self, world: World, start_stride: int = PROGRESSIVE_START_STRIDE,
+                           ray_budget: Optional[int] = None,
+                           n_jobs: int = 1) -> Iterator[np.ndarray]:
+        # yields (vsize, hsize, 3) frames, the first traces one pixel every
+        # start_stride and fills the blocks with it, every next pass halves
+        # the stride and traces only the new pixels, the last frame is the
+        # full render. Stop iterating (or close the generator) to cancel,
+        # the last frame received is the best image so far
+        if start_stride < 1 or start_stride & (start_stride - 1) != 0:
+            raise ValueError(f"start_stride must be a power of two, got {start_stride}")
+        return self._progressive(world, start_stride, ray_budget, n_jobs)
+
+    def _progressive(self, world: World, start_stride: int, ray_budget: Optional[int],
+                     n_jobs: int) -> Iterator[np.ndarray]:
+        frame = np.zeros((self.vsize, self.hsize, 3), dtype=np.float64)
+        pp = Parallel(n_jobs=n_jobs) if n_jobs != 1 else None
+        stride = start_stride
+        while stride >= 1:
+            rows = []
+            for y in range(0, self.vsize, stride):
+                if stride == start_stride or y % (2 * stride) != 0:
+                    xs = list(range(0, self.hsize, stride))
+                else:
+                    # the even pixels of this row were traced by the last pass
+                    xs = list(range(stride, self.hsize, 2 * stride))
+                if len(xs) != 0:
+                    rows.append((y, xs))
+
+            if pp is None:
+                colors = [self._trace_pixels(world, y, xs, ray_budget) for y, xs in rows]
+            else:
+                colors = pp(delayed(self._trace_pixels)(world, y, xs, ray_budget)
+                            for y, xs in rows)
+            for (y, xs), row in zip(rows, colors):
+                for x, c in zip(xs, row):
+                    frame[y:y + stride, x:x + stride] = c[:3]
+
+            yield frame.copy()
+            stride //= 2
+
+    def _trace_pixels(self, world: World, y: int, xs: Sequence[int],
+                      ray_budget: Optional[int] = None) -> List[np.ndarray]:
+        return [world.trace(self.ray_for_pixel(x, y), ray_budget) for x in xs]
+
+    def render_passes(self, world: World, canvas: CanvasP,
+                      callback: Optional[Callable[[np.ndarray, int], Optional[bool]]] = None,
+                      start_stride: int = PROGRESSIVE_START_STRIDE,
+                      ray_budget: Optional[int] = None, n_jobs: int = 1) -> np.ndarray:
+        # drives render_progressive, callback gets every frame and its pass
+        # number and cancels the render by returning False. The best frame
+        # reached is written to the canvas and returned
+        frames = self.render_progressive(world, start_stride, ray_budget, n_jobs)
+        frame = None
+        for n, frame in enumerate(frames):
+            if callback is not None and callback(frame, n) is False:
+                frames.close()
+                break
+
+        for y in range(self.vsize):
+            for x in range(self.hsize):
+                canvas.set_pixelf(x, y, frame[y, x])
+        return frame
+
+    def render_heatmap(self, world: World, canvas: Optional[CanvasP] = None,
+                       directory: Optional[Union[str, os.PathLike]] = None,
+                       ray_budget: Optional[int] = None) -> Dict[str, np.ndarray]:
+        # diagnostic render, per pixel rays traced, bounding box tests,
+        # primitive intersection tests and seconds spent. Sequential so the
+        # timings are not skewed by other workers, written as .npy and false
+        # colour .png files when directory is given
+        stats = instrumentation.STATS
+        maps = {name: np.zeros((self.vsize, self.hsize), dtype=np.float64)
+                for name in ('rays', 'bbox_tests', 'primitive_tests', 'time')}
+        was_enabled = instrumentation.enabled()
+        instrumentation.enable()
+        try:
+            for y in range(self.vsize):
+                for x in range(self.hsize):
+                    rays = stats.rays
+                    bbox_tests = stats.bbox_tests
+                    primitive_tests = stats.primitive_tests
+                    start = perf_counter()
+                    c = world.trace(self.ray_for_pixel(x, y), ray_budget)
+                    maps['time'][y, x] = perf_counter() - start
+                    maps['rays'][y, x] = stats.rays - rays
+                    maps['bbox_tests'][y, x] = stats.bbox_tests - bbox_tests
+                    maps['primitive_tests'][y, x] = stats.primitive_tests - primitive_tests
+                    if canvas is not None:
+                        canvas.set_pixelf(x, y, c)
+        finally:
+            if not was_enabled:
+                instrumentation.disable()
+
+        if directory is not None:
+            instrumentation.save_heatmaps(maps, directory)
+        return maps
+
+    def render_native(self, world: World, canvas: CanvasP, tile_size: int = 16,
+                      num_threads: int = 0) -> np.ndarray:
+        # renders the compiled snapshot of the world with the tile renderer,
+        # every thread of the process works on tiles with the GIL released.
+        # Refraction is not traced and area lights are taken at their center
+        if _render is None:
+            raise RuntimeError(
+                "the compiled renderer is not built, run python build.py build_ext --inplace")
+        colors = _render.render(world.compile(), np.ascontiguousarray(self.inv_transform, dtype=np.float64),
+                                self.half_width, self.half_height, self.pixel_size,
+                                self.hsize, self.vsize, tile_size, RAY_REFLECTION_LIMIT,
+                                world.min_contribution, EPSILON, num_threads)
+        for y in range(self.vsize):
+            for x in range(self.hsize):
+                canvas.set_pixelf(x, y, colors[y, x])
+        return colors
+
+    def render_adaptive(self, world: World, canvas: CanvasP,
+                        threshold: float = ADAPTIVE_CONTRAST_THRESHOLD,
+                        max_samples: int = ADAPTIVE_MAX_SAMPLES,
+                        ray_budget: Optional[int] = None,
+                        n_jobs: Optional[int] = None) -> np.ndarray:
+        # one ray per pixel first, then extra sub pixel rays only where
+        # neighbour pixels differ by more than threshold in some channel or
+        # hit different objects. Returns the number of samples of each pixel
+        if n_jobs is None:
+            n_jobs = ceil(multiprocessing.cpu_count() / 2)
+        pp = Parallel(n_jobs=n_jobs)
+
+        rows = pp(delayed(self._sample_y)(world, y, ray_budget)
+                  for y in range(self.vsize))
+        colors = np.array([row[0] for row in rows], dtype=np.float64)
+        ids = np.array([row[1] for row in rows], dtype=object)
+
+        edges = np.zeros((self.vsize, self.hsize), dtype=bool)
+        diff = (np.abs(colors[:, 1:] - colors[:, :-1]).max(axis=2) > threshold) | \
+            (ids[:, 1:] != ids[:, :-1])
+        edges[:, 1:] |= diff
+        edges[:, :-1] |= diff
+        diff = (np.abs(colors[1:] - colors[:-1]).max(axis=2) > threshold) | \
+            (ids[1:] != ids[:-1])
+        edges[1:] |= diff
+        edges[:-1] |= diff
+
+        samples = np.ones((self.vsize, self.hsize), dtype=np.int64)
+        todo = [(y, np.flatnonzero(edges[y]).tolist())
+                for y in range(self.vsize) if edges[y].any()]
+        refined = pp(delayed(self._refine_y)(world, y, xs, colors[y, xs], ids[y, xs],
+                                             threshold, max_samples, ray_budget)
+                     for y, xs in todo)
+        for (y, xs), row in zip(todo, refined):
+            for x, (color, count) in zip(xs, row):
+                colors[y, x] = color
+                samples[y, x] = count
+
+        for y in range(self.vsize):
+            for x in range(self.hsize):
+                canvas.set_pixelf(x, y, colors[y, x])
+
+        return samples
+
+    def _sample_y(self, world: World, y: int, ray_budget: Optional[int] = None):
+        cc = []
+        ids = []
+        for x in range(self.hsize):
+            r = self.ray_for_pixel(x, y)
+            c, cmp = world.trace_hit(r, ray_budget)
+            cc.append(c)
+            ids.append(None if cmp is None else cmp.object.id)
+        return cc, ids
+
+    def _refine_y(self, world: World, y: int, xs: Sequence[int],
+                  colors: np.ndarray, ids: Sequence[Optional[str]],
+                  threshold: float, max_samples: int,
+                  ray_budget: Optional[int] = None) -> List[Tuple[np.ndarray, int]]:
+        return [self._supersample(world, x, y, colors[n], ids[n], threshold, max_samples, ray_budget)
+                for n, x in enumerate(xs)]
+
+    def _supersample(self, world: World, x: int, y: int,
+                     color: np.ndarray, obj_id: Optional[str],
+                     threshold: float, max_samples: int,
+                     ray_budget: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        # take n x n stratified samples with n = 2, 3, ... while the samples
+        # disagree and the total stays under max_samples
+        total: np.ndarray = color.copy()
+        count = 1
+        n = 2
+        while count + n * n <= max_samples:
+            cc = []
+            different = False
+            for i in range(n):
+                for j in range(n):
+                    r = self.ray_for_pixel(x, y, (i + 0.5) / n, (j + 0.5) / n)
+                    c, cmp = world.trace_hit(r, ray_budget)
+                    cc.append(c)
+                    different |= (None if cmp is None else cmp.object.id) != obj_id
+            cc = np.array(cc)
+            total += cc.sum(axis=0)
+            count += n * n
+            if not different and (cc.max(axis=0) - cc.min(axis=0)).max() <= threshold:
+                break
+            n += 1
+
+        return total / count, count
@@ -1,12 +1,20 @@
+import json
+import os
 from os import PathLike
-from typing import Tuple, Union
+from time import perf_counter
+from typing import Iterator, List, Tuple, Union
 
+import numpy as np
 from PIL.Image import Image
+from PIL.Image import fromarray as imageFromArray
 from PIL.Image import new as newImage
 from PIL.PyAccess import PyAccess
 
+from .constants import CANVAS_SAVE_ROWS, CHECKPOINT_INTERVAL, RENDER_TILE_SIZE
 from .protocols import CanvasP, ColorInput, ColorOutput
 
+Tile = Tuple[int, int, int, int]
+
 
 class Canvas(CanvasP):
     def __init__(self, screenSize: Tuple[int, int] = (512, 512)):
@@ -16,10 +24,156 @@ class Canvas(CanvasP):
         self._pixels: PyAccess = self._canvas.load()
 
     def get_pixel(self, x: int, y: int) -> ColorOutput:
-        return self._canvas[x, y]
+        return self._pixels[x, y]
 
     def set_pixel(self, x: int, y: int, color: ColorInput):
         self._pixels[x, y] = color
 
     def save_img(self, file: Union[str, PathLike]):
         self._canvas.save(file)
+
+
+def to_rgb8(colors: np.ndarray) -> np.ndarray:
+    # float colours to bytes the way CanvasP.set_pixelf converts them
+    colors = np.asarray(colors, dtype=np.float64)[..., :3]
+    return np.clip((colors * 255).astype(np.int64), 0, 255).astype(np.uint8)
+
+
+def make_tiles(screenSize: Tuple[int, int], tile_size: int = RENDER_TILE_SIZE) -> List[Tile]:
+    # (x0, y0, x1, y1) of every tile, row by row
+    width, height = screenSize
+    t = tile_size
+    return [(x, y, min(x + t, width), min(y + t, height))
+            for y in range(0, height, t) for x in range(0, width, t)]
+
+
+def _open_memmap(path: str) -> np.memmap:
+    # np.load in r+ mode grows a truncated file with zeros, a read only map
+    # of it raises first
+    np.load(path, mmap_mode='r')
+    return np.load(path, mmap_mode='r+')
+
+
+class TiledCanvas(CanvasP):
+    # the pixels live in the .npy file at path, memory mapped, so only the
+    # pages being written are in memory. <path>.tiles.npy marks the finished
+    # tiles and <path>.json holds the size, the tile size and the hash of
+    # the scene rendered, opening the same path with the same size again
+    # resumes from the finished tiles. Written tiles reach the disk every
+    # checkpoint_interval seconds or on checkpoint()
+
+    def __init__(self, screenSize: Tuple[int, int], path: Union[str, PathLike],
+                 tile_size: int = RENDER_TILE_SIZE,
+                 checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self._screenSize: Tuple[int, int] = tuple(screenSize)
+        self.path: str = os.fspath(path)
+        self.tile_size: int = tile_size
+        self.checkpoint_interval: float = checkpoint_interval
+        self._pending: List[Tuple[int, int]] = []
+        self._last_checkpoint: float = perf_counter()
+        width, height = self._screenSize
+        self.meta: dict = {'size': [width, height], 'tile_size': tile_size, 'scene': None}
+        tiles_shape = (-(-height // tile_size), -(-width // tile_size))
+        stored = self._stored_meta()
+        if stored is not None and all(stored.get(k) == self.meta[k] for k in ('size', 'tile_size')):
+            try:
+                self._canvas: np.memmap = _open_memmap(self.path)
+                self.done: np.memmap = _open_memmap(self.tiles_path)
+            except (OSError, ValueError):
+                # a missing, truncated or corrupt file, nothing to resume
+                pass
+            else:
+                if self._canvas.shape == (height, width, 3) and self.done.shape == tiles_shape \
+                        and self._canvas.dtype == np.uint8 and self.done.dtype == np.uint8:
+                    self.meta['scene'] = stored.get('scene')
+                    return
+        self.reset()
+
+    @property
+    def tiles_path(self) -> str:
+        return self.path + '.tiles.npy'
+
+    @property
+    def meta_path(self) -> str:
+        return self.path + '.json'
+
+    def _stored_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self) -> None:
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def reset(self) -> None:
+        # drops every finished tile and starts a black image
+        width, height = self._screenSize
+        self._canvas = np.lib.format.open_memmap(
+            self.path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+        self.done = np.lib.format.open_memmap(
+            self.tiles_path, mode='w+', dtype=np.uint8,
+            shape=(-(-height // self.tile_size), -(-width // self.tile_size)))
+        self._pending = []
+        self.write_meta()
+
+    def bind(self, scene: str) -> None:
+        # scene is the hash of what is rendered to the canvas, the finished
+        # tiles of another scene are dropped
+        if self.meta['scene'] is not None and self.meta['scene'] != scene:
+            self.reset()
+        if self.meta['scene'] != scene:
+            self.meta['scene'] = scene
+            self.write_meta()
+
+    def get_pixel(self, x: int, y: int) -> ColorOutput:
+        return tuple(int(c) for c in self._canvas[y, x])
+
+    def set_pixel(self, x: int, y: int, color: ColorInput):
+        self._canvas[y, x] = color
+
+    def tiles(self) -> List[Tile]:
+        return make_tiles(self._screenSize, self.tile_size)
+
+    def is_done(self, tile: Tile) -> bool:
+        index = (tile[1] // self.tile_size, tile[0] // self.tile_size)
+        return bool(self.done[index]) or index in self._pending
+
+    def missing_tiles(self) -> List[Tile]:
+        return [tile for tile in self.tiles() if not self.is_done(tile)]
+
+    def write_tile(self, tile: Tile, colors: np.ndarray) -> None:
+        # colors are the (y1 - y0, x1 - x0, 3) float colours of the tile
+        x0, y0, x1, y1 = tile
+        self._canvas[y0:y1, x0:x1] = to_rgb8(colors)
+        self._pending.append((y0 // self.tile_size, x0 // self.tile_size))
+        if perf_counter() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        # the pixels reach the disk before their tiles are marked as finished
+        self._canvas.flush()
+        for index in self._pending:
+            self.done[index] = 1
+        self.done.flush()
+        self._pending = []
+        self._last_checkpoint = perf_counter()
+
+    def rows(self, count: int = CANVAS_SAVE_ROWS) -> Iterator[np.ndarray]:
+        for y in range(0, self.height, count):
+            yield np.ascontiguousarray(self._canvas[y:y + count])
+
+    def save_img(self, file: Union[str, PathLike]):
+        # PPM is streamed a few rows at a time, other formats go through PIL
+        # and need the whole image in memory
+        if os.fspath(file).lower().endswith(('.ppm', '.pnm')):
+            with open(file, 'wb') as f:
+                f.write(b'P6\n%d %d\n255\n' % self._screenSize)
+                for rows in self.rows():
+                    f.write(rows.tobytes())
+        else:
+            imageFromArray(np.asarray(self._canvas), 'RGB').save(file)
@@ -0,0 +1,662 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+# Renderer for a FrozenScene (see fancy_ray_tracer/frozen.py). Everything
+# below render() runs without the GIL, tiles are spread over the OpenMP
+# threads with prange so one process uses every core.
+from cython.parallel cimport parallel, prange
+from libc cimport math
+cimport openmp
+
+import numpy as np
+
+cdef enum:
+    SPHERE = 0
+    PLANE = 1
+    CUBE = 2
+    CYLINDER = 3
+    CONE = 4
+    TRIANGLE = 5
+    PARAMS_SIZE = 18
+    MATERIAL_SIZE = 17
+    STACK_SIZE = 64
+
+ctypedef struct Scene:
+    int n_prims
+    int n_lights
+    int max_depth
+    double epsilon
+    double min_contribution
+    const int* kinds
+    const double* inv
+    const double* params
+    const int* material_ids
+    const double* materials
+    const double* pattern_inv
+    const unsigned char* shadows
+    const int* unbounded
+    const int* trees
+    const double* instance_inv
+    const int* instance_geometry
+    const int* instance_materials
+    const double* instance_patterns
+    const unsigned char* instance_shadows
+    const double* node_min
+    const double* node_max
+    const int* node_left
+    const int* node_right
+    const int* node_start
+    const int* node_count
+    const int* prim_order
+    const double* lights
+
+ctypedef struct Hit:
+    double t
+    double u
+    double v
+    int prim
+    int instance
+
+
+cdef inline bint consider(double t, double u, double v, double tmin, Hit* hit) noexcept nogil:
+    if t >= tmin and t < hit.t:
+        hit.t = t
+        hit.u = u
+        hit.v = v
+        return True
+    return False
+
+
+cdef inline bint cap_hit(double* o, double* d, double t, double r2) noexcept nogil:
+    cdef double x = o[0] + t * d[0]
+    cdef double z = o[2] + t * d[2]
+    return x * x + z * z <= r2
+
+
+cdef bint intersect_prim(Scene* s, int i, double* o, double* d, double tmin, Hit* hit) noexcept nogil:
+    # nearest hit of primitive i with tmin <= t < hit.t, updates hit
+    cdef:
+        const double* m = s.inv + 16 * i
+        const double* p = s.params + PARAMS_SIZE * i
+        double ol[3]
+        double dl[3]
+        double a, b, c, disc, sq, a21, t0, t1, t, y, eps = s.epsilon
+        double tnear, tfar, tn, tf, inv_d
+        double minimum, maximum, r2min, r2max
+        double dce[3]
+        double oce[3]
+        double po[3]
+        double det, f, u, v
+        bint found = False
+        bint closed
+        int k
+
+    if s.kinds[i] == TRIANGLE:
+        # moller trumbore in world space
+        dce[0] = d[1] * p[8] - d[2] * p[7]
+        dce[1] = d[2] * p[6] - d[0] * p[8]
+        dce[2] = d[0] * p[7] - d[1] * p[6]
+        det = p[3] * dce[0] + p[4] * dce[1] + p[5] * dce[2]
+        if math.fabs(det) < eps:
+            return False
+        f = 1.0 / det
+        po[0] = o[0] - p[0]
+        po[1] = o[1] - p[1]
+        po[2] = o[2] - p[2]
+        u = f * (po[0] * dce[0] + po[1] * dce[1] + po[2] * dce[2])
+        if u < 0 or u > 1:
+            return False
+        oce[0] = po[1] * p[5] - po[2] * p[4]
+        oce[1] = po[2] * p[3] - po[0] * p[5]
+        oce[2] = po[0] * p[4] - po[1] * p[3]
+        v = f * (d[0] * oce[0] + d[1] * oce[1] + d[2] * oce[2])
+        if v < 0 or u + v > 1:
+            return False
+        t = f * (p[6] * oce[0] + p[7] * oce[1] + p[8] * oce[2])
+        return consider(t, u, v, tmin, hit)
+
+    for k in range(3):
+        ol[k] = m[4 * k] * o[0] + m[4 * k + 1] * o[1] + m[4 * k + 2] * o[2] + m[4 * k + 3]
+        dl[k] = m[4 * k] * d[0] + m[4 * k + 1] * d[1] + m[4 * k + 2] * d[2]
+
+    if s.kinds[i] == SPHERE:
+        a = dl[0] * dl[0] + dl[1] * dl[1] + dl[2] * dl[2]
+        b = 2.0 * (dl[0] * ol[0] + dl[1] * ol[1] + dl[2] * ol[2])
+        c = ol[0] * ol[0] + ol[1] * ol[1] + ol[2] * ol[2] - 1
+        disc = b * b - 4.0 * a * c
+        if disc < 0:
+            return False
+        sq = math.sqrt(disc)
+        a21 = 1.0 / (2.0 * a)
+        found = consider((-b - sq) * a21, 0, 0, tmin, hit)
+        found = consider((-b + sq) * a21, 0, 0, tmin, hit) or found
+        return found
+
+    if s.kinds[i] == PLANE:
+        if math.fabs(dl[1]) < eps:
+            return False
+        return consider(-ol[1] / dl[1], 0, 0, tmin, hit)
+
+    if s.kinds[i] == CUBE:
+        tnear = -math.INFINITY
+        tfar = math.INFINITY
+        for k in range(3):
+            if math.fabs(dl[k]) >= eps:
+                inv_d = 1 / dl[k]
+            else:
+                inv_d = math.INFINITY
+            tn = (-1 - ol[k]) * inv_d
+            tf = (1 - ol[k]) * inv_d
+            if tn > tf:
+                tn, tf = tf, tn
+            tnear = math.fmax(tnear, tn)
+            tfar = math.fmin(tfar, tf)
+        if tnear > tfar:
+            return False
+        found = consider(tnear, 0, 0, tmin, hit)
+        found = consider(tfar, 0, 0, tmin, hit) or found
+        return found
+
+    minimum = p[0]
+    maximum = p[1]
+    closed = p[2] != 0
+
+    if s.kinds[i] == CYLINDER:
+        a = dl[0] * dl[0] + dl[2] * dl[2]
+        if a >= eps:
+            b = 2 * (ol[0] * dl[0] + ol[2] * dl[2])
+            c = ol[0] * ol[0] + ol[2] * ol[2] - 1
+            disc = b * b - 4 * a * c
+            if disc < 0:
+                return False
+            sq = math.sqrt(disc)
+            a21 = 1 / (2 * a)
+            t0 = (-b - sq) * a21
+            t1 = (-b + sq) * a21
+            y = ol[1] + t0 * dl[1]
+            if minimum < y < maximum:
+                found = consider(t0, 0, 0, tmin, hit)
+            y = ol[1] + t1 * dl[1]
+            if minimum < y < maximum:
+                found = consider(t1, 0, 0, tmin, hit) or found
+        if closed and math.fabs(dl[1]) >= eps:
+            t = (minimum - ol[1]) / dl[1]
+            if cap_hit(ol, dl, t, 1.0):
+                found = consider(t, 0, 0, tmin, hit) or found
+            t = (maximum - ol[1]) / dl[1]
+            if cap_hit(ol, dl, t, 1.0):
+                found = consider(t, 0, 0, tmin, hit) or found
+        return found
+
+    if s.kinds[i] == CONE:
+        a = dl[0] * dl[0] + dl[2] * dl[2] - dl[1] * dl[1]
+        b = 2 * (ol[0] * dl[0] + ol[2] * dl[2] - ol[1] * dl[1])
+        c = ol[0] * ol[0] + ol[2] * ol[2] - ol[1] * ol[1]
+        if math.fabs(a) < eps:
+            if math.fabs(b) >= eps:
+                t1 = -c / (2 * b)
+                y = ol[1] + t1 * dl[1]
+                if minimum < y < maximum:
+                    found = consider(t1, 0, 0, tmin, hit)
+        else:
+            disc = b * b - 4 * a * c
+            if disc >= 0:
+                sq = math.sqrt(disc)
+                a21 = 1 / (2 * a)
+                t0 = (-b - sq) * a21
+                t1 = (-b + sq) * a21
+                y = ol[1] + t0 * dl[1]
+                if minimum < y < maximum:
+                    found = consider(t0, 0, 0, tmin, hit)
+                y = ol[1] + t1 * dl[1]
+                if minimum < y < maximum:
+                    found = consider(t1, 0, 0, tmin, hit) or found
+        if closed and math.fabs(dl[1]) >= eps:
+            t = (minimum - ol[1]) / dl[1]
+            if cap_hit(ol, dl, t, minimum * minimum):
+                found = consider(t, 0, 0, tmin, hit) or found
+            t = (maximum - ol[1]) / dl[1]
+            if cap_hit(ol, dl, t, maximum * maximum):
+                found = consider(t, 0, 0, tmin, hit) or found
+        return found
+
+    return False
+
+
+cdef inline bint box_hit(const double* bmin, const double* bmax, double* o, double* inv_d, double tmax) noexcept nogil:
+    cdef double tnear = 0.0, tfar = tmax, t1, t2
+    cdef int k
+    for k in range(3):
+        t1 = (bmin[k] - o[k]) * inv_d[k]
+        t2 = (bmax[k] - o[k]) * inv_d[k]
+        tnear = math.fmax(tnear, math.fmin(t1, t2))
+        tfar = math.fmin(tfar, math.fmax(t1, t2))
+    return tnear <= tfar
+
+
+cdef inline void transform_ray(const double* m, double* o, double* d, double* ol, double* dl) noexcept nogil:
+    cdef int k
+    for k in range(3):
+        ol[k] = m[4 * k] * o[0] + m[4 * k + 1] * o[1] + m[4 * k + 2] * o[2] + m[4 * k + 3]
+        dl[k] = m[4 * k] * d[0] + m[4 * k + 1] * d[1] + m[4 * k + 2] * d[2]
+
+
+cdef bint intersect_item(Scene* s, int item, int instance, double* o, double* d, bint shadow,
+                         Hit* hit) noexcept nogil:
+    # items past the primitives are instances, their geometry is tested in
+    # their space where the ray keeps its t
+    cdef:
+        double ol[3]
+        double dl[3]
+        int k
+
+    if item >= s.n_prims:
+        k = item - s.n_prims
+        if shadow and not s.instance_shadows[k]:
+            return False
+        transform_ray(s.instance_inv + 16 * k, o, d, ol, dl)
+        return traverse(s, 1 + s.instance_geometry[k], k, ol, dl, shadow, hit)
+
+    if shadow and not s.shadows[item]:
+        return False
+    if intersect_prim(s, item, o, d, 0.0, hit):
+        hit.prim = item
+        hit.instance = instance
+        return True
+    return False
+
+
+cdef bint traverse(Scene* s, int tree, int instance, double* o, double* d, bint shadow,
+                   Hit* hit) noexcept nogil:
+    # with shadow set the first hit under hit.t ends the traversal
+    cdef:
+        const int* t = s.trees + 4 * tree
+        int stack[STACK_SIZE]
+        int top = 0
+        int node, j
+        double inv_d[3]
+        bint found = False
+
+    for j in range(t[2], t[2] + t[3]):
+        if intersect_item(s, s.unbounded[j], instance, o, d, shadow, hit):
+            found = True
+            if shadow:
+                return True
+
+    if t[1] == 0:
+        return found
+
+    for j in range(3):
+        inv_d[j] = 1.0 / d[j]
+
+    stack[0] = t[0]
+    top = 1
+    while top > 0:
+        top -= 1
+        node = stack[top]
+        if not box_hit(s.node_min + 3 * node, s.node_max + 3 * node, o, inv_d, hit.t):
+            continue
+        if s.node_count[node] > 0:
+            for j in range(s.node_start[node], s.node_start[node] + s.node_count[node]):
+                if intersect_item(s, s.prim_order[j], instance, o, d, shadow, hit):
+                    found = True
+                    if shadow:
+                        return True
+        elif top + 2 <= STACK_SIZE:
+            stack[top] = s.node_left[node]
+            stack[top + 1] = s.node_right[node]
+            top += 2
+
+    return found
+
+
+cdef bint closest_hit(Scene* s, double* o, double* d, double tmax, bint shadow, Hit* hit) noexcept nogil:
+    # with shadow set only shadow casting primitives count and the first
+    # hit under tmax ends the traversal
+    hit.t = tmax
+    hit.prim = -1
+    hit.instance = -1
+    return traverse(s, 0, -1, o, d, shadow, hit)
+
+
+cdef void prim_normal(Scene* s, Hit* hit, double* point, double* n) noexcept nogil:
+    # normal of the primitive in the space it is stored in, not normalized
+    cdef:
+        int i = hit.prim
+        const double* m = s.inv + 16 * i
+        const double* p = s.params + PARAMS_SIZE * i
+        double op[3]
+        double on[3]
+        double dist, maxc, w, eps = s.epsilon
+        int k
+
+    if s.kinds[i] == TRIANGLE:
+        # same weights as SmoothTriangle.normal_at
+        w = 1 - hit.u - hit.v
+        for k in range(3):
+            n[k] = hit.u * p[9 + k] + hit.v * p[12 + k] + w * p[15 + k]
+    else:
+        for k in range(3):
+            op[k] = m[4 * k] * point[0] + m[4 * k + 1] * point[1] + m[4 * k + 2] * point[2] + m[4 * k + 3]
+        on[0] = 0
+        on[1] = 0
+        on[2] = 0
+        if s.kinds[i] == SPHERE:
+            on[0] = op[0]
+            on[1] = op[1]
+            on[2] = op[2]
+        elif s.kinds[i] == PLANE:
+            on[1] = 1
+        elif s.kinds[i] == CUBE:
+            maxc = math.fmax(math.fabs(op[0]), math.fmax(math.fabs(op[1]), math.fabs(op[2])))
+            if math.fabs(math.fabs(op[0]) - maxc) < eps:
+                on[0] = op[0]
+            elif math.fabs(math.fabs(op[1]) - maxc) < eps:
+                on[1] = op[1]
+            else:
+                on[2] = op[2]
+        else:
+            dist = op[0] * op[0] + op[2] * op[2]
+            on[0] = op[0]
+            on[2] = op[2]
+            if s.kinds[i] == CYLINDER:
+                if dist < 1 and op[1] > p[1] - eps:
+                    on[0] = 0
+                    on[1] = 1
+                    on[2] = 0
+                elif dist < 1 and op[1] < p[0] + eps:
+                    on[0] = 0
+                    on[1] = -1
+                    on[2] = 0
+            else:
+                if dist < p[1] * p[1] and op[1] > p[1] - eps:
+                    on[0] = 0
+                    on[1] = 1
+                    on[2] = 0
+                elif dist < p[0] * p[0] and op[1] < p[0] + eps:
+                    on[0] = 0
+                    on[1] = -1
+                    on[2] = 0
+                elif op[1] > 0:
+                    on[1] = -math.sqrt(dist)
+                else:
+                    on[1] = math.sqrt(dist)
+        # the normal goes back with the transposed inverse
+        for k in range(3):
+            n[k] = m[k] * on[0] + m[4 + k] * on[1] + m[8 + k] * on[2]
+
+
+cdef void normal_at(Scene* s, Hit* hit, double* point, double* n) noexcept nogil:
+    cdef:
+        const double* m
+        double lp[3]
+        double ln[3]
+        double nm
+        int k
+
+    if hit.instance < 0:
+        prim_normal(s, hit, point, n)
+    else:
+        m = s.instance_inv + 16 * hit.instance
+        for k in range(3):
+            lp[k] = m[4 * k] * point[0] + m[4 * k + 1] * point[1] + m[4 * k + 2] * point[2] + m[4 * k + 3]
+        prim_normal(s, hit, lp, ln)
+        for k in range(3):
+            n[k] = m[k] * ln[0] + m[4 + k] * ln[1] + m[8 + k] * ln[2]
+
+    nm = math.sqrt(n[0] * n[0] + n[1] * n[1] + n[2] * n[2])
+    for k in range(3):
+        n[k] /= nm
+
+
+cdef const double* surface_color(Scene* s, Hit* hit, double* point, double* color) noexcept nogil:
+    # color at the point and material row of the hit. The material of an
+    # instance has its patterns in the space of the instance, the ones of
+    # its geometry are in the space of the geometry
+    cdef:
+        const double* mat
+        const double* m
+        const double* im
+        double lp[3]
+        double pp[3]
+        int code
+        int k
+        long odd
+
+    if hit.instance >= 0 and s.instance_materials[hit.instance] >= 0:
+        mat = s.materials + MATERIAL_SIZE * s.instance_materials[hit.instance]
+        m = s.instance_patterns + 16 * hit.instance
+    else:
+        mat = s.materials + MATERIAL_SIZE * s.material_ids[hit.prim]
+        m = s.pattern_inv + 16 * hit.prim
+        if hit.instance >= 0:
+            im = s.instance_inv + 16 * hit.instance
+            for k in range(3):
+                lp[k] = im[4 * k] * point[0] + im[4 * k + 1] * point[1] + im[4 * k + 2] * point[2] + im[4 * k + 3]
+            point = lp
+
+    code = <int>mat[10]
+    if code == 0:
+        for k in range(3):
+            color[k] = mat[k]
+        return mat
+
+    for k in range(3):
+        pp[k] = m[4 * k] * point[0] + m[4 * k + 1] * point[1] + m[4 * k + 2] * point[2] + m[4 * k + 3]
+
+    if code == 5:
+        for k in range(3):
+            color[k] = pp[k]
+        return mat
+
+    if code == 2:
+        for k in range(3):
+            color[k] = mat[11 + k] + (mat[14 + k] - mat[11 + k]) * (pp[0] - math.floor(pp[0]))
+        return mat
+
+    if code == 1:
+        odd = (<long>math.floor(pp[0])) & 1
+    elif code == 3:
+        odd = (<long>math.floor(math.sqrt(pp[0] * pp[0] + pp[2] * pp[2]))) & 1
+    else:
+        odd = (<long>math.floor(pp[0]) + <long>math.floor(pp[1]) + <long>math.floor(pp[2])) & 1
+
+    for k in range(3):
+        color[k] = mat[14 + k] if odd else mat[11 + k]
+    return mat
+
+
+cdef void trace(Scene* s, double* origin, double* direction, double* out) noexcept nogil:
+    cdef:
+        Hit hit
+        Hit shadow_hit
+        double o[3]
+        double d[3]
+        double point[3]
+        double over[3]
+        double normal[3]
+        double eyev[3]
+        double lightv[3]
+        double color[3]
+        double eff[3]
+        const double* mat
+        const double* light
+        double throughput = 1.0
+        double dist, ldn, rde, lit, dn
+        int depth, l, k
+
+    for k in range(3):
+        o[k] = origin[k]
+        d[k] = direction[k]
+        out[k] = 0
+
+    for depth in range(s.max_depth + 1):
+        if not closest_hit(s, o, d, math.INFINITY, False, &hit):
+            break
+
+        for k in range(3):
+            point[k] = o[k] + d[k] * hit.t
+            eyev[k] = -d[k]
+        normal_at(s, &hit, point, normal)
+        if normal[0] * eyev[0] + normal[1] * eyev[1] + normal[2] * eyev[2] < 0:
+            for k in range(3):
+                normal[k] = -normal[k]
+        for k in range(3):
+            over[k] = point[k] + normal[k] * s.epsilon
+
+        mat = surface_color(s, &hit, over, color)
+
+        for l in range(s.n_lights):
+            light = s.lights + 6 * l
+            for k in range(3):
+                eff[k] = color[k] * light[3 + k]
+                out[k] += throughput * eff[k] * mat[3]
+                lightv[k] = light[k] - over[k]
+            dist = math.sqrt(lightv[0] * lightv[0] + lightv[1] * lightv[1] + lightv[2] * lightv[2])
+            for k in range(3):
+                lightv[k] /= dist
+            ldn = lightv[0] * normal[0] + lightv[1] * normal[1] + lightv[2] * normal[2]
+            if ldn < 0:
+                continue
+            if closest_hit(s, over, lightv, dist, True, &shadow_hit):
+                continue
+            # reflect(-lightv, normal) . eyev
+            rde = 0
+            for k in range(3):
+                rde += (-lightv[k] + 2 * ldn * normal[k]) * eyev[k]
+            for k in range(3):
+                lit = mat[4] * ldn * eff[k]
+                if rde > 0:
+                    lit += light[3 + k] * mat[5] * math.pow(rde, mat[6])
+                out[k] += throughput * lit
+
+        if mat[7] < s.epsilon or depth == s.max_depth:
+            break
+        throughput *= mat[7]
+        if throughput < s.min_contribution:
+            break
+
+        dn = d[0] * normal[0] + d[1] * normal[1] + d[2] * normal[2]
+        for k in range(3):
+            d[k] = d[k] - 2 * dn * normal[k]
+            o[k] = over[k]
+
+
+cdef void render_tile(Scene* s, double* cam, double half_width, double half_height,
+                      double pixel_size, int x0, int y0, int x1, int y1,
+                      double[:, :, ::1] out) noexcept nogil:
+    cdef:
+        double origin[3]
+        double direction[3]
+        double color[3]
+        double wx, wy, nm
+        int x, y, k
+
+    for k in range(3):
+        origin[k] = cam[4 * k + 3]
+
+    for y in range(y0, y1):
+        wy = half_height - (y + 0.5) * pixel_size
+        for x in range(x0, x1):
+            wx = half_width - (x + 0.5) * pixel_size
+            for k in range(3):
+                direction[k] = cam[4 * k] * wx + cam[4 * k + 1] * wy - cam[4 * k + 2] + cam[4 * k + 3] - origin[k]
+            nm = math.sqrt(direction[0] * direction[0] + direction[1] * direction[1] + direction[2] * direction[2])
+            for k in range(3):
+                direction[k] /= nm
+            trace(s, origin, direction, color)
+            for k in range(3):
+                out[y, x, k] = color[k]
+
+
+cdef const double* _dptr(const double[::1] a):
+    if a.shape[0] == 0:
+        return NULL
+    return &a[0]
+
+
+cdef const int* _iptr(const int[::1] a):
+    if a.shape[0] == 0:
+        return NULL
+    return &a[0]
+
+
+def render(scene, double[:, ::1] camera_inv, double half_width, double half_height,
+           double pixel_size, int hsize, int vsize, int tile_size=16, int max_depth=5,
+           double min_contribution=0.0, double epsilon=1e-5, int num_threads=0):
+    cdef:
+        Scene s
+        int ntx = (hsize + tile_size - 1) // tile_size
+        int nty = (vsize + tile_size - 1) // tile_size
+        int tile, x0, y0
+        double[:, :, ::1] out
+        const double[::1] inv, params, materials, pattern_inv, node_min, node_max, lights
+        const double[::1] instance_inv, instance_patterns
+        const int[::1] kinds, material_ids, unbounded, trees, node_left, node_right, node_start, node_count
+        const int[::1] prim_order, instance_geometry, instance_materials
+        const unsigned char[::1] shadows, instance_shadows
+
+    result = np.zeros((vsize, hsize, 3), dtype=np.float64)
+    out = result
+    if num_threads <= 0:
+        num_threads = openmp.omp_get_max_threads()
+
+    # the flat views keep the arrays alive while the threads read them, a
+    # compiled snapshot is read only and is used without copies
+    kinds = np.ascontiguousarray(scene.kinds, dtype=np.int32)
+    inv = np.ascontiguousarray(scene.inv_transforms, dtype=np.float64).ravel()
+    params = np.ascontiguousarray(scene.params, dtype=np.float64).ravel()
+    material_ids = np.ascontiguousarray(scene.material_ids, dtype=np.int32)
+    materials = np.ascontiguousarray(scene.materials, dtype=np.float64).ravel()
+    pattern_inv = np.ascontiguousarray(scene.pattern_transforms, dtype=np.float64).ravel()
+    shadows = np.ascontiguousarray(scene.shadows, dtype=np.uint8)
+    unbounded = np.ascontiguousarray(scene.unbounded, dtype=np.int32)
+    trees = np.ascontiguousarray(scene.trees, dtype=np.int32).ravel()
+    instance_inv = np.ascontiguousarray(scene.instance_inv, dtype=np.float64).ravel()
+    instance_geometry = np.ascontiguousarray(scene.instance_geometry, dtype=np.int32)
+    instance_materials = np.ascontiguousarray(scene.instance_materials, dtype=np.int32)
+    instance_patterns = np.ascontiguousarray(scene.instance_patterns, dtype=np.float64).ravel()
+    instance_shadows = np.ascontiguousarray(scene.instance_shadows, dtype=np.uint8)
+    node_min = np.ascontiguousarray(scene.node_min, dtype=np.float64).ravel()
+    node_max = np.ascontiguousarray(scene.node_max, dtype=np.float64).ravel()
+    node_left = np.ascontiguousarray(scene.node_left, dtype=np.int32)
+    node_right = np.ascontiguousarray(scene.node_right, dtype=np.int32)
+    node_start = np.ascontiguousarray(scene.node_start, dtype=np.int32)
+    node_count = np.ascontiguousarray(scene.node_count, dtype=np.int32)
+    prim_order = np.ascontiguousarray(scene.prim_order, dtype=np.int32)
+    lights = np.ascontiguousarray(scene.lights, dtype=np.float64).ravel()
+
+    s.n_prims = kinds.shape[0]
+    s.n_lights = lights.shape[0] // 6
+    s.max_depth = max_depth
+    s.epsilon = epsilon
+    s.min_contribution = min_contribution
+    s.kinds = _iptr(kinds)
+    s.inv = _dptr(inv)
+    s.params = _dptr(params)
+    s.material_ids = _iptr(material_ids)
+    s.materials = _dptr(materials)
+    s.pattern_inv = _dptr(pattern_inv)
+    s.shadows = &shadows[0] if shadows.shape[0] != 0 else NULL
+    s.unbounded = _iptr(unbounded)
+    s.trees = _iptr(trees)
+    s.instance_inv = _dptr(instance_inv)
+    s.instance_geometry = _iptr(instance_geometry)
+    s.instance_materials = _iptr(instance_materials)
+    s.instance_patterns = _dptr(instance_patterns)
+    s.instance_shadows = &instance_shadows[0] if instance_shadows.shape[0] != 0 else NULL
+    s.node_min = _dptr(node_min)
+    s.node_max = _dptr(node_max)
+    s.node_left = _iptr(node_left)
+    s.node_right = _iptr(node_right)
+    s.node_start = _iptr(node_start)
+    s.node_count = _iptr(node_count)
+    s.prim_order = _iptr(prim_order)
+    s.lights = _dptr(lights)
+
+    with nogil, parallel(num_threads=num_threads):
+        for tile in prange(ntx * nty, schedule='dynamic'):
+            x0 = (tile % ntx) * tile_size
+            y0 = (tile // ntx) * tile_size
+            render_tile(&s, &camera_inv[0, 0], half_width, half_height, pixel_size,
+                        x0, y0, min(x0 + tile_size, hsize), min(y0 + tile_size, vsize), out)
+
+    return result
@@ -0,0 +1,222 @@
+from cython cimport boundscheck, wraparound, cdivision
+from libc cimport math
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+cpdef tuple sphere_intersect(double[:] origin, double[:] direction):
+    cdef:
+        double a = direction[0]*direction[0]+direction[1]*direction[1]+direction[2]*direction[2]
+        double b = 2.0*(direction[0]*origin[0]+direction[1]*origin[1]+direction[2]*origin[2])
+        double c = origin[0]*origin[0]+origin[1]*origin[1]+origin[2]*origin[2]-1
+        double dc = b*b-4.0*a*c
+        double dcsq
+        double a12
+
+    if dc<0:
+        return ()
+
+    dcsq = math.sqrt(dc)
+    a12 = 1.0/(2.0*a)
+
+    return ((-b-dcsq)*a12, (-b+dcsq)*a12)
+
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+cpdef tuple cylinder_intersect(double[:] origin, double[:] direction, double minimum,
+        double maximum, bint closed, double epsilon):
+    cdef:
+        double a = direction[0]*direction[0]+direction[2]*direction[2]
+        double b
+        double c
+        double disc
+        double sqdc
+        double a21
+        double t0
+        double t1
+        double t
+        double x
+        double z
+        double y
+        double o1 = origin[1]
+        double d1 = direction[1]
+        double d1i
+        double xs[2]
+        int n = 0
+
+    if a<epsilon:
+        if not closed:
+            return ()
+        # perpendicular ray to the caps, hitting one cap means hitting both
+        d1i = 1/d1
+        t0 = (minimum-o1)*d1i
+        x = origin[0]+t0*direction[0]
+        z = origin[2]+t0*direction[2]
+        if x*x+z*z>1.0:
+            return ()
+
+        return (t0, (maximum-o1)*d1i)
+
+    b = 2*(origin[0]*direction[0]+origin[2]*direction[2])
+    c = origin[0]*origin[0]+origin[2]*origin[2]-1
+
+    disc = b*b-4*a*c
+
+    if disc<0:
+        return ()
+
+    sqdc = math.sqrt(disc)
+    a21 = 1/(2*a)
+    t0 = (-b-sqdc)*a21
+    t1 = (-b+sqdc)*a21
+
+    if t0>t1:
+        t0, t1 = t1, t0
+
+    y = o1+t0*d1
+    if minimum<y<maximum:
+        xs[n] = t0
+        n += 1
+    y = o1+t1*d1
+    if minimum<y<maximum:
+        xs[n] = t1
+        n += 1
+
+    if not closed or n==2 or math.fabs(d1)<epsilon:
+        if n==0:
+            return ()
+        if n==1:
+            return (xs[0],)
+        return (xs[0], xs[1])
+
+    d1i = 1/d1
+    t = (minimum-o1)*d1i
+    x = origin[0]+t*direction[0]
+    z = origin[2]+t*direction[2]
+    if x*x+z*z<=1:
+        xs[n] = t
+        n += 1
+
+    if n==2:
+        return (xs[1], xs[0])
+
+    t = (maximum-o1)*d1i
+    x = origin[0]+t*direction[0]
+    z = origin[2]+t*direction[2]
+    if x*x+z*z<=1:
+        xs[n] = t
+        n += 1
+
+    if n==0:
+        return ()
+    if n==1:
+        return (xs[0],)
+    if xs[0]>xs[1]:
+        return (xs[1], xs[0])
+    return (xs[0], xs[1])
+
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+cpdef tuple cone_intersect(double[:] origin, double[:] direction, double minimum,
+        double maximum, bint closed, double epsilon):
+    cdef:
+        double dy = direction[1]
+        double oy = origin[1]
+        double a = direction[0]*direction[0]+direction[2]*direction[2]-dy*dy
+        double b = 2*(origin[0]*direction[0]+origin[2]*direction[2]-oy*dy)
+        double c = origin[0]*origin[0]+origin[2]*origin[2]-oy*oy
+        double minimum2 = minimum*minimum
+        double maximum2 = maximum*maximum
+        double disc
+        double sqdc
+        double a21
+        double t0
+        double t1
+        double t
+        double x
+        double z
+        double y
+        double dyi
+        double temp
+        double xs[4]
+        int n = 0
+        int i
+        int j
+
+    if math.fabs(a)<epsilon:
+        if math.fabs(b)<epsilon:
+            return ()
+
+        t1 = -c/(2*b)
+
+        if not closed:
+            return (t1,)
+
+        dyi = 1/dy
+        t = (minimum-oy)*dyi
+        x = origin[0]+t*direction[0]
+        z = origin[2]+t*direction[2]
+        if x*x+z*z<=minimum2:
+            if t<t1:
+                return (t, t1)
+            return (t1, t)
+
+        t = (maximum-oy)*dyi
+        x = origin[0]+t*direction[0]
+        z = origin[2]+t*direction[2]
+        if x*x+z*z<=maximum2:
+            if t<t1:
+                return (t, t1)
+            return (t1, t)
+
+        return ()
+
+    disc = b*b-4*a*c
+
+    if disc<0:
+        return ()
+
+    sqdc = math.sqrt(disc)
+    a21 = 1/(2*a)
+    t0 = (-b-sqdc)*a21
+    t1 = (-b+sqdc)*a21
+
+    y = oy+t0*dy
+    if minimum<y<maximum:
+        xs[n] = t0
+        n += 1
+    y = oy+t1*dy
+    if minimum<y<maximum:
+        xs[n] = t1
+        n += 1
+
+    if closed:
+        dyi = 1/dy
+        t = (minimum-oy)*dyi
+        x = origin[0]+t*direction[0]
+        z = origin[2]+t*direction[2]
+        if x*x+z*z<=minimum2:
+            xs[n] = t
+            n += 1
+
+        t = (maximum-oy)*dyi
+        x = origin[0]+t*direction[0]
+        z = origin[2]+t*direction[2]
+        if x*x+z*z<=maximum2:
+            xs[n] = t
+            n += 1
+
+        # insertion sort, at most four values
+        for i in range(1, n):
+            temp = xs[i]
+            j = i-1
+            while j>=0 and xs[j]>temp:
+                xs[j+1] = xs[j]
+                j -= 1
+            xs[j+1] = temp
+
+    return tuple([xs[i] for i in range(n)])
@@ -9,6 +9,43 @@ RTOL: float = 1e-5
 PI: float = _pi
 EPSILON: float = ATOL
 RAY_REFLECTION_LIMIT: int = 5
+# below this accumulated throughput a secondary ray can't change an 8 bit pixel
+RAY_MIN_CONTRIBUTION: float = 1 / 255
+# adaptive supersampling refines pixels whose neighbours differ more than this
+ADAPTIVE_CONTRAST_THRESHOLD: float = 0.1
+ADAPTIVE_MAX_SAMPLES: int = 16
+# pixel spacing of the first pass of a progressive render, a power of two
+PROGRESSIVE_START_STRIDE: int = 8
+# side in pixels of the tiles of a TiledCanvas and of the tiled renders
+RENDER_TILE_SIZE: int = 64
+# seconds between two flushes of the finished tiles of a TiledCanvas
+CHECKPOINT_INTERVAL: float = 5.0
+# rows of a TiledCanvas read at a time when it is saved
+CANVAS_SAVE_ROWS: int = 256
+# seconds a distributed worker has for a tile before it is handed to another
+DISTRIBUTED_TILE_TIMEOUT: float = 60.0
+# jobs waiting in a RenderService before submit() blocks
+RENDER_QUEUE_SIZE: int = 64
+# memory held by the images a RenderService answers repeated jobs with
+RESULT_CACHE_BYTES: int = 64 * 1024 * 1024
+# frames per second of an Animation and of its encoded video
+ANIMATION_FPS: float = 24
+# frames an Animation worker renders in a row when reprojecting, the first
+# of them is traced in full
+REPROJECTION_RUN: int = 16
+# runs an Animation keeps submitted to its pool per worker process, the
+# finished frames wait in memory only until they are taken in order
+ANIMATION_RUNS_PER_PROCESS: int = 2
+# a reprojected sample is reused when it lies within this many pixel
+# footprints of the new hit, and its material has reflective, transparency
+# and specular at most REPROJECTION_VIEW_DEPENDENT
+REPROJECTION_TOLERANCE: float = 0.5
+REPROJECTION_VIEW_DEPENDENT: float = 0.1
+# smallest cosine between ray and surface a texture footprint is stretched
+# for, past it the footprint stops growing
+GRAZING_COS: float = 0.1
+# memory held by the decoded textures shared by all the materials
+TEXTURE_CACHE_BYTES: int = 256 * 1024 * 1024
 BOX_UNITARY_MAX_BOUND: np.ndarray = np.array((1, 1, 1, 1), dtype=np.float64)
 BOX_UNITARY_MIN_BOUND: np.ndarray = np.array((-1, -1, -1, 1), dtype=np.float64)
 INFINITY: float = inf
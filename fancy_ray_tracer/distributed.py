@@ -0,0 +1,278 @@
+import argparse
+import os
+import pickle
+import socket
+import threading
+from collections import deque
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client, Connection, Listener
+from time import monotonic
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import lz4.frame
+import numpy as np
+
+from .camera import Camera
+from .canvas import Tile, TiledCanvas, make_tiles
+from .constants import DISTRIBUTED_TILE_TIMEOUT, RENDER_TILE_SIZE
+from .hashing import scene_hash
+from .protocols import CanvasP
+from .world import World
+
+# Tiles rendered by worker processes that may live on other machines. The
+# coordinator listens, every worker connects and gets the scene once as a
+# lz4 compressed pickle, then it is sent one tile at a time and answers with
+# its colours. The tiles of a dead worker go back to the queue and the tiles
+# of a slow one are handed to another worker too, the first answer wins.
+# The connections are authenticated with authkey but carry pickles, only
+# run it between trusted machines
+#
+#   coordinator: Coordinator(world, camera, canvas, ('0.0.0.0', 7000), key).render()
+#   every node:  python -m fancy_ray_tracer.distributed host:7000 --workers 8
+
+AUTHKEY_ENV = 'FANCY_RAY_TRACER_AUTHKEY'
+# seconds between the checks of a connection waiting for its worker
+_POLL = 0.05
+
+
+def _pack(value) -> bytes:
+    return lz4.frame.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _unpack(data: bytes):
+    return pickle.loads(lz4.frame.decompress(data))
+
+
+class TileBoard:
+    # thread safe bookkeeping of the tiles: pending ones, running ones with
+    # the time they were handed out and the worker that has them, and
+    # finished ones
+    __slots__ = ("timeout", "pending", "running", "owners", "done", "left", "closed", "_cond")
+
+    def __init__(self, tiles: List[Tile], timeout: float = DISTRIBUTED_TILE_TIMEOUT) -> None:
+        self.timeout: float = timeout
+        self.pending: Deque[Tile] = deque(tiles)
+        self.running: Dict[Tile, float] = {}
+        self.owners: Dict[Tile, object] = {}
+        self.done: Set[Tile] = set()
+        self.left: int = len(tiles)
+        self.closed: bool = False
+        self._cond = threading.Condition()
+
+    def take(self, owner: object = None) -> Optional[Tile]:
+        # the next tile to render, None once every tile is finished or the
+        # board is closed
+        with self._cond:
+            while self.left != 0 and not self.closed:
+                now = monotonic()
+                if self.pending:
+                    tile = self.pending.popleft()
+                    self.running[tile] = now
+                    self.owners[tile] = owner
+                    return tile
+                if self.running:
+                    tile, start = min(self.running.items(), key=lambda item: item[1])
+                    if now - start >= self.timeout:
+                        self.running[tile] = now
+                        self.owners[tile] = owner
+                        return tile
+                    self._cond.wait(self.timeout - (now - start))
+                else:
+                    self._cond.wait()
+            return None
+
+    def finish(self, tile: Tile) -> bool:
+        # False when another worker finished the tile first
+        with self._cond:
+            if tile in self.done:
+                return False
+            self.done.add(tile)
+            self.running.pop(tile, None)
+            self.owners.pop(tile, None)
+            self.left -= 1
+            self._cond.notify_all()
+            return True
+
+    def fail(self, tile: Tile, owner: object = None) -> None:
+        # a slow tile handed to another worker stays with that one when the
+        # first worker dies
+        with self._cond:
+            if tile in self.running and self.owners.get(tile) is owner:
+                del self.running[tile]
+                del self.owners[tile]
+                self.pending.appendleft(tile)
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.left == 0, timeout)
+
+
+class Coordinator:
+    # the listener is open from the constructor on, so address (with the
+    # port picked by the system when 0 is given) can be sent to the workers
+    # before render() is called
+    __slots__ = ("world", "camera", "canvas", "ray_budget", "tile_size", "timeout",
+                 "board", "listener", "address", "_authkey", "_payload",
+                 "_canvas_lock", "_threads", "_closing", "workers")
+
+    def __init__(self, world: World, camera: Camera, canvas: CanvasP,
+                 address: Tuple[str, int] = ('127.0.0.1', 0), authkey: Optional[bytes] = None,
+                 ray_budget: Optional[int] = None, tile_size: int = RENDER_TILE_SIZE,
+                 timeout: float = DISTRIBUTED_TILE_TIMEOUT) -> None:
+        self.world: World = world
+        self.camera: Camera = camera
+        self.canvas: CanvasP = canvas
+        self.ray_budget: Optional[int] = ray_budget
+        self.tile_size: int = tile_size
+        self.timeout: float = timeout
+        self._authkey: bytes = authkey if authkey is not None else os.environ[AUTHKEY_ENV].encode()
+        self.listener = Listener(address, authkey=self._authkey)
+        self.address: Tuple[str, int] = self.listener.address
+        self.board: Optional[TileBoard] = None
+        self._payload: Optional[bytes] = None
+        self._canvas_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._closing: bool = False
+        # worker connections served so far
+        self.workers: int = 0
+
+    def render(self, timeout: Optional[float] = None) -> bool:
+        # blocks until every tile is in the canvas, or timeout seconds, and
+        # tells if it finished. A TiledCanvas keeps the finished tiles of
+        # the same scene from earlier runs
+        canvas = self.canvas
+        if isinstance(canvas, TiledCanvas):
+            canvas.bind(scene_hash(self.world, self.camera, canvas.screen_size, self.ray_budget))
+            tiles = canvas.missing_tiles()
+        else:
+            tiles = make_tiles(canvas.screen_size, self.tile_size)
+        self.board = TileBoard(tiles, self.timeout)
+        self._payload = _pack((self.world, self.camera, self.ray_budget))
+        accepter = threading.Thread(target=self._accept, daemon=True)
+        accepter.start()
+        try:
+            finished = self.board.wait(timeout)
+        finally:
+            self.close()
+            accepter.join()
+            for thread in self._threads:
+                thread.join()
+            if isinstance(canvas, TiledCanvas):
+                canvas.checkpoint()
+        return finished
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        if self.board is not None:
+            self.board.close()
+        # accept() doesn't return when the listener is closed under it, a
+        # last connection wakes it up
+        try:
+            socket.create_connection(self.address, timeout=1).close()
+        except OSError:
+            pass
+        self.listener.close()
+
+    def _accept(self) -> None:
+        while not self._closing:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if self._closing:
+                    return
+                # a client with the wrong key or a broken handshake
+                continue
+            if self._closing:
+                conn.close()
+                return
+            self.workers += 1
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _serve(self, conn: Connection) -> None:
+        board = self.board
+        tile = None
+        try:
+            conn.send_bytes(self._payload)
+            while True:
+                tile = board.take(conn)
+                conn.send(tile)
+                if tile is None:
+                    return
+                while not conn.poll(_POLL):
+                    if self._closing:
+                        return
+                done, colors = _unpack(conn.recv_bytes())
+                if board.finish(done):
+                    self._write(done, colors)
+                tile = None
+        except (EOFError, OSError):
+            # the worker died, its tile goes to another one
+            if tile is not None:
+                board.fail(tile, conn)
+        finally:
+            conn.close()
+
+    def _write(self, tile: Tile, colors: np.ndarray) -> None:
+        with self._canvas_lock:
+            if isinstance(self.canvas, TiledCanvas):
+                self.canvas.write_tile(tile, colors)
+                return
+            x0, y0, x1, y1 = tile
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    self.canvas.set_pixelf(x, y, colors[y - y0, x - x0])
+
+
+def run_worker(address: Tuple[str, int], authkey: Optional[bytes] = None) -> int:
+    # renders the tiles of one coordinator until it is done, returns how
+    # many tiles this worker rendered
+    authkey = authkey if authkey is not None else os.environ[AUTHKEY_ENV].encode()
+    conn = Client(address, authkey=authkey)
+    rendered = 0
+    try:
+        world, camera, ray_budget = _unpack(conn.recv_bytes())
+        while True:
+            tile = conn.recv()
+            if tile is None:
+                return rendered
+            colors = camera._render_tile(world, tile, ray_budget)
+            conn.send_bytes(_pack((tile, colors)))
+            rendered += 1
+    except (EOFError, OSError):
+        # the coordinator finished without saying goodbye or the connection
+        # broke
+        return rendered
+    finally:
+        conn.close()
+
+
+def start_workers(address: Tuple[str, int], n: int, authkey: Optional[bytes] = None) -> List[Process]:
+    processes = [Process(target=run_worker, args=(address, authkey), daemon=True) for _ in range(n)]
+    for p in processes:
+        p.start()
+    return processes
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='fancy_ray_tracer render worker')
+    parser.add_argument('address', help='host:port of the coordinator')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='worker processes started on this node')
+    args = parser.parse_args(argv)
+    host, port = args.address.rsplit(':', 1)
+    for p in start_workers((host, int(port)), args.workers):
+        p.join()
+
+
+if __name__ == '__main__':
+    main()
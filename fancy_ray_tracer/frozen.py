@@ -0,0 +1,545 @@
+from math import sqrt
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .constants import IDENTITY, INFINITY
+from .illumination import Light
+from .materials import (
+    ChessPattern,
+    DefaultPattern,
+    LinearGradient,
+    Material,
+    RingPatter,
+    StripePattern,
+)
+from .protocols import WorldObject
+from .primitives import (
+    BoundingBox,
+    Cone,
+    Cube,
+    Cylinder,
+    Group,
+    Instance,
+    Plane,
+    Sphere,
+    Triangle,
+    TriangleMesh,
+)
+
+# primitive type codes of the flattened scene
+SPHERE = 0
+PLANE = 1
+CUBE = 2
+CYLINDER = 3
+CONE = 4
+TRIANGLE = 5
+
+# pattern codes of the material table
+NO_PATTERN = 0
+STRIPE_PATTERN = 1
+GRADIENT_PATTERN = 2
+RING_PATTERN = 3
+CHESS_PATTERN = 4
+POINT_PATTERN = 5
+
+# columns of the material table
+MATERIAL_FIELDS = ("r", "g", "b", "ambient", "diffuse", "specular", "shininess",
+                   "reflective", "transparency", "refractive_index", "pattern",
+                   "r1", "g1", "b1", "r2", "g2", "b2")
+
+# triangles store p1, e1, e2 and the three vertex normals in world space
+PARAMS_SIZE = 18
+
+BVH_LEAF_SIZE = 4
+# surface area heuristic costs of visiting a node and testing a primitive
+SAH_TRAVERSAL_COST = 1.0
+SAH_INTERSECTION_COST = 1.5
+# a refitted BVH is rebuilt once its cost grows past this times the cost it
+# had when it was built
+BVH_REBUILD_RATIO = 1.5
+
+
+class FrozenScene:
+    # flat array snapshot of a World for the compiled renderer. Every
+    # primitive has a transform to object space, a material row and bounds,
+    # bounded primitives live in a BVH and unbounded ones (planes, infinite
+    # cylinders and cones) are tested on every ray.
+    # The geometry of instances is stored once: its primitives are in the
+    # space of the instance, rows geometry_prims of the primitive arrays,
+    # with a BVH of their own. The top level tree has the other primitives
+    # and one leaf per instance, item n_prims + k of the bounds and of
+    # prim_order is instance k. Row t of trees is the range of nodes and of
+    # unbounded items of tree t, tree 0 is the top level and tree 1 + g the
+    # one of geometry g
+    __slots__ = ("kinds", "inv_transforms", "params", "material_ids", "materials",
+                 "pattern_transforms", "shadows", "bounds_min", "bounds_max",
+                 "geometry_prims", "instance_inv", "instance_geometry",
+                 "instance_materials", "instance_patterns", "instance_shadows",
+                 "unbounded", "trees", "node_min", "node_max", "node_left", "node_right",
+                 "node_start", "node_count", "prim_order", "lights",
+                 "cost", "build_cost", "refits")
+
+    def __init__(self, kinds: np.ndarray, inv_transforms: np.ndarray, params: np.ndarray,
+                 material_ids: np.ndarray, materials: np.ndarray, pattern_transforms: np.ndarray,
+                 shadows: np.ndarray, bounds_min: np.ndarray, bounds_max: np.ndarray,
+                 lights: np.ndarray, geometry_prims: np.ndarray, instance_inv: np.ndarray,
+                 instance_geometry: np.ndarray, instance_materials: np.ndarray,
+                 instance_patterns: np.ndarray, instance_shadows: np.ndarray,
+                 previous: Optional['FrozenScene'] = None) -> None:
+        # bounds_min and bounds_max have a row per primitive and then one
+        # per instance. With previous the BVH topology of that snapshot is
+        # kept and only its bounds are recomputed, unless the primitives
+        # changed or the trees got too slow
+        self.kinds: np.ndarray = kinds
+        self.inv_transforms: np.ndarray = inv_transforms
+        self.params: np.ndarray = params
+        self.material_ids: np.ndarray = material_ids
+        self.materials: np.ndarray = materials
+        self.pattern_transforms: np.ndarray = pattern_transforms
+        self.shadows: np.ndarray = shadows
+        self.bounds_min: np.ndarray = bounds_min
+        self.bounds_max: np.ndarray = bounds_max
+        self.lights: np.ndarray = lights
+        self.geometry_prims: np.ndarray = geometry_prims
+        self.instance_inv: np.ndarray = instance_inv
+        self.instance_geometry: np.ndarray = instance_geometry
+        self.instance_materials: np.ndarray = instance_materials
+        self.instance_patterns: np.ndarray = instance_patterns
+        self.instance_shadows: np.ndarray = instance_shadows
+
+        finite = np.isfinite(bounds_min).all(axis=1) & np.isfinite(
+            bounds_max).all(axis=1)
+        top = np.ones(len(finite), dtype=bool)
+        for first, count in geometry_prims:
+            top[first:first + count] = False
+        # the items of every tree, the top level first
+        items = [np.flatnonzero(top)] + [np.arange(first, first + count)
+                                         for first, count in geometry_prims]
+        unbounded = [tree[~finite[tree]] for tree in items]
+        self.unbounded: np.ndarray = np.concatenate(unbounded).astype(np.int32)
+        refit = previous is not None and np.array_equal(previous.kinds, kinds) \
+            and np.array_equal(previous.unbounded, self.unbounded) \
+            and np.array_equal(previous.geometry_prims, geometry_prims) \
+            and np.array_equal(previous.instance_geometry, instance_geometry)
+        if refit:
+            self.trees = previous.trees
+            self.node_left = previous.node_left
+            self.node_right = previous.node_right
+            self.node_start = previous.node_start
+            self.node_count = previous.node_count
+            self.prim_order = previous.prim_order
+            self.node_min, self.node_max = refit_bvh(
+                bounds_min, bounds_max, self.node_left, self.node_right,
+                self.node_start, self.node_count, self.prim_order)
+            self.cost: float = trees_cost(self.node_min, self.node_max, self.node_count, self.trees)
+            self.build_cost: float = previous.build_cost
+            self.refits: int = previous.refits + 1
+        if not refit or self.cost > BVH_REBUILD_RATIO * self.build_cost:
+            nodes = []
+            for tree in items:
+                nodes.append(build_bvh(bounds_min, bounds_max, tree[finite[tree]]))
+            (self.node_min, self.node_max, self.node_left, self.node_right,
+             self.node_start, self.node_count, self.prim_order) = merge_bvhs(nodes)
+            trees = np.zeros((len(items), 4), dtype=np.int32)
+            trees[:, 1] = [len(tree[0]) for tree in nodes]
+            trees[1:, 0] = np.cumsum(trees[:-1, 1])
+            trees[:, 3] = [len(tree) for tree in unbounded]
+            trees[1:, 2] = np.cumsum(trees[:-1, 3])
+            self.trees: np.ndarray = trees
+            self.cost = trees_cost(self.node_min, self.node_max, self.node_count, self.trees)
+            self.build_cost = self.cost
+            self.refits = 0
+
+        # the snapshot is shared by every renderer, nothing may write to it
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+
+def build_bvh(bounds_min: np.ndarray, bounds_max: np.ndarray, prims: np.ndarray,
+              leaf_size: int = BVH_LEAF_SIZE) -> Tuple[np.ndarray, ...]:
+    # median split on the widest axis of the centroids. Leaves reference
+    # the range [start, start + count) of prim_order, inner nodes have
+    # count = 0 and two children
+    node_min: List[np.ndarray] = []
+    node_max: List[np.ndarray] = []
+    node_left: List[int] = []
+    node_right: List[int] = []
+    node_start: List[int] = []
+    node_count: List[int] = []
+    order: List[int] = []
+
+    def node(items: np.ndarray) -> int:
+        index = len(node_min)
+        node_min.append(bounds_min[items].min(axis=0))
+        node_max.append(bounds_max[items].max(axis=0))
+        node_left.append(-1)
+        node_right.append(-1)
+        node_start.append(len(order))
+        node_count.append(0)
+        if len(items) <= leaf_size:
+            order.extend(items.tolist())
+            node_count[index] = len(items)
+            return index
+
+        c = (bounds_min[items] + bounds_max[items]) * 0.5
+        axis = int(np.argmax(c.max(axis=0) - c.min(axis=0)))
+        items = items[np.argsort(c[:, axis], kind='stable')]
+        half = len(items) // 2
+        left = node(items[:half])
+        right = node(items[half:])
+        node_left[index] = left
+        node_right[index] = right
+        return index
+
+    if len(prims) != 0:
+        node(np.asarray(prims, dtype=np.int64))
+
+    return (np.array(node_min, dtype=np.float64).reshape(-1, 3),
+            np.array(node_max, dtype=np.float64).reshape(-1, 3),
+            np.array(node_left, dtype=np.int32),
+            np.array(node_right, dtype=np.int32),
+            np.array(node_start, dtype=np.int32),
+            np.array(node_count, dtype=np.int32),
+            np.array(order, dtype=np.int32))
+
+
+def merge_bvhs(trees: Sequence[Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, ...]:
+    # build_bvh results in one set of arrays, each tree after the previous
+    # ones with its node and prim_order indices moved along
+    merged: List[List[np.ndarray]] = [[] for _ in range(7)]
+    nodes = 0
+    order = 0
+    for tree in trees:
+        node_min, node_max, node_left, node_right, node_start, node_count, prim_order = tree
+        merged[0].append(node_min)
+        merged[1].append(node_max)
+        merged[2].append(np.where(node_left < 0, node_left, node_left + nodes))
+        merged[3].append(np.where(node_right < 0, node_right, node_right + nodes))
+        merged[4].append(node_start + order)
+        merged[5].append(node_count)
+        merged[6].append(prim_order)
+        nodes += len(node_left)
+        order += len(prim_order)
+    return tuple(np.concatenate(arrays).astype(arrays[0].dtype) for arrays in merged)
+
+
+def refit_bvh(bounds_min: np.ndarray, bounds_max: np.ndarray, node_left: np.ndarray,
+              node_right: np.ndarray, node_start: np.ndarray, node_count: np.ndarray,
+              prim_order: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # node bounds of a BVH for new primitive bounds, bottom up. Nodes are
+    # stored parents first and the leaves cover prim_order in node order
+    n = len(node_left)
+    node_min = np.empty((n, 3), dtype=np.float64)
+    node_max = np.empty((n, 3), dtype=np.float64)
+    leaves = np.flatnonzero(node_count > 0)
+    if len(leaves) != 0:
+        starts = node_start[leaves]
+        node_min[leaves] = np.minimum.reduceat(bounds_min[prim_order], starts, axis=0)
+        node_max[leaves] = np.maximum.reduceat(bounds_max[prim_order], starts, axis=0)
+    for index in np.flatnonzero(node_count == 0)[::-1]:
+        left = node_left[index]
+        right = node_right[index]
+        node_min[index] = np.minimum(node_min[left], node_min[right])
+        node_max[index] = np.maximum(node_max[left], node_max[right])
+    return node_min, node_max
+
+
+def bvh_cost(node_min: np.ndarray, node_max: np.ndarray, node_count: np.ndarray) -> float:
+    # expected cost of a ray through the tree by the surface area heuristic
+    if len(node_count) == 0:
+        return 0.0
+    d = node_max - node_min
+    area = 2 * (d[:, 0] * d[:, 1] + d[:, 1] * d[:, 2] + d[:, 2] * d[:, 0])
+    if area[0] <= 0:
+        return 0.0
+    leaf = node_count > 0
+    cost = SAH_TRAVERSAL_COST * area[~leaf].sum() + \
+        SAH_INTERSECTION_COST * (area[leaf] * node_count[leaf]).sum()
+    return float(cost / area[0])
+
+
+def trees_cost(node_min: np.ndarray, node_max: np.ndarray, node_count: np.ndarray,
+               trees: np.ndarray) -> float:
+    cost = 0.0
+    for first, count, _, _ in trees:
+        end = first + count
+        cost += bvh_cost(node_min[first:end], node_max[first:end], node_count[first:end])
+    return cost
+
+
+def _pattern_row(material: Material) -> List[float]:
+    pattern = material.pattern
+    if pattern is None:
+        return [NO_PATTERN, 0, 0, 0, 0, 0, 0]
+    if isinstance(pattern, StripePattern):
+        code = STRIPE_PATTERN
+    elif isinstance(pattern, LinearGradient):
+        code = GRADIENT_PATTERN
+    elif isinstance(pattern, RingPatter):
+        code = RING_PATTERN
+    elif isinstance(pattern, ChessPattern):
+        code = CHESS_PATTERN
+    elif type(pattern) is DefaultPattern:
+        return [POINT_PATTERN, 0, 0, 0, 0, 0, 0]
+    else:
+        raise TypeError(
+            f"pattern {pattern.__class__.__name__} can't be frozen")
+    return [code, *pattern._c1[:3], *pattern._c2[:3]]
+
+
+def _transform_bounds(transform: np.ndarray, bmin: Sequence[float],
+                      bmax: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    corners = np.array([(x, y, z, 1.0) for x in (bmin[0], bmax[0])
+                        for y in (bmin[1], bmax[1]) for z in (bmin[2], bmax[2])])
+    world = corners.dot(transform.T)[:, :3]
+    return world.min(axis=0), world.max(axis=0)
+
+
+class _Freezer:
+    def __init__(self) -> None:
+        self.kinds: List[int] = []
+        self.inv_transforms: List[np.ndarray] = []
+        self.params: List[np.ndarray] = []
+        self.material_ids: List[int] = []
+        self.pattern_transforms: List[np.ndarray] = []
+        self.shadows: List[int] = []
+        self.bounds_min: List[np.ndarray] = []
+        self.bounds_max: List[np.ndarray] = []
+        self.materials: List[List[float]] = []
+        self._material_index: Dict[int, int] = {}
+        # shared geometry by id, with its range of primitive rows
+        self._geometry_index: Dict[int, int] = {}
+        self.geometry_prims: List[Tuple[int, int]] = []
+        self.instance_inv: List[np.ndarray] = []
+        self.instance_geometry: List[int] = []
+        self.instance_materials: List[int] = []
+        self.instance_patterns: List[np.ndarray] = []
+        self.instance_shadows: List[int] = []
+        self.instance_min: List[np.ndarray] = []
+        self.instance_max: List[np.ndarray] = []
+        # inside shared geometry instances are copied, to its primitives
+        # the material of such an instance, the map from the space of the
+        # geometry to the one of the instance and whether it casts shadows
+        self.shared: bool = False
+        self.override: Optional[Material] = None
+        self.space: np.ndarray = IDENTITY
+        self.shadow: bool = True
+
+    def material(self, material: Material) -> int:
+        key = id(material)
+        index = self._material_index.get(key)
+        if index is None:
+            index = len(self.materials)
+            self._material_index[key] = index
+            self.materials.append([*material.color[:3], material.ambient, material.diffuse,
+                                   material.specular, material.shininess, material.reflective,
+                                   material.transparency, material.refractive_index,
+                                   *_pattern_row(material)])
+        return index
+
+    def add(self, kind: int, obj: WorldObject, inv: np.ndarray, params: np.ndarray,
+            bmin: np.ndarray, bmax: np.ndarray) -> None:
+        self.add_many(kind, obj, inv, params[None], bmin[None], bmax[None])
+
+    def add_many(self, kind: int, obj: WorldObject, inv: np.ndarray, params: np.ndarray,
+                 bmin: np.ndarray, bmax: np.ndarray) -> None:
+        # rows of primitives sharing kind, transform and material
+        n = len(params)
+        self.kinds.extend([kind] * n)
+        self.inv_transforms.extend([inv] * n)
+        self.params.extend(params)
+        material = obj.material if self.override is None else self.override
+        self.material_ids.extend([self.material(material)] * n)
+        # Shape.color_at only applies the transform of the shape itself, an
+        # instance gives it points in its own space
+        pattern = material.pattern
+        pattern_inv = IDENTITY if pattern is None else pattern.inv_transform
+        if self.override is None:
+            pattern_inv = pattern_inv.dot(obj.inv_transform)
+        self.pattern_transforms.extend([pattern_inv.dot(self.space)] * n)
+        self.shadows.extend([1 if obj.has_shadow and self.shadow else 0] * n)
+        self.bounds_min.extend(bmin)
+        self.bounds_max.extend(bmax)
+
+    def visit(self, obj: WorldObject, inv: np.ndarray) -> None:
+        # inv maps world space to the space of obj
+        if isinstance(obj, BoundingBox):
+            # the box shares the transform of its shape
+            self.visit(obj.shape, inv)
+            return
+
+        if isinstance(obj, Instance) and not self.shared:
+            self.instance(obj, inv)
+            return
+
+        if isinstance(obj, Instance):
+            # a two level tree only, this one gets its own copy of the geometry
+            outer = (self.override, self.space, self.shadow)
+            if obj.material is not None:
+                self.override = obj.material
+            self.space = inv
+            self.shadow = self.shadow and obj.has_shadow
+            self.visit(obj.geometry, obj.geometry.inv_transform.dot(inv))
+            self.override, self.space, self.shadow = outer
+            return
+
+        if isinstance(obj, Group):
+            for shape in obj.shapes:
+                self.visit(shape, shape.inv_transform.dot(inv))
+            return
+
+        if isinstance(obj, Triangle):
+            self.triangle(obj, inv, obj.p1, obj.p2, obj.p3,
+                          obj.normal, obj.normal, obj.normal)
+            return
+
+        if isinstance(obj, TriangleMesh):
+            # the rows triangle() gives, for every face at once
+            faces = np.asarray(obj.faces_groups, dtype=np.intp).reshape(-1, 3)
+            nn = np.asarray(obj.normals_groups, dtype=np.intp).reshape(-1, 3)
+            w = np.asarray(obj.vertices, dtype=np.float64).dot(np.linalg.inv(inv).T)[:, :3]
+            wn = np.asarray(obj.normals, dtype=np.float64).dot(inv)[:, :3]
+            wn /= np.sqrt((wn * wn).sum(axis=1))[:, None]
+            w1 = w[faces[:, 0]]
+            w2 = w[faces[:, 1]]
+            w3 = w[faces[:, 2]]
+            params = np.empty((len(faces), PARAMS_SIZE))
+            params[:, 0:3] = w1
+            params[:, 3:6] = w2 - w1
+            params[:, 6:9] = w3 - w1
+            for n in range(3):
+                params[:, 9 + 3 * n:12 + 3 * n] = wn[nn[:, n]]
+            self.add_many(TRIANGLE, obj, IDENTITY, params,
+                          np.minimum(np.minimum(w1, w2), w3), np.maximum(np.maximum(w1, w2), w3))
+            return
+
+        params = np.zeros(PARAMS_SIZE)
+        transform = np.linalg.inv(inv)
+        if isinstance(obj, Sphere):
+            kind = SPHERE
+            bmin, bmax = _transform_bounds(transform, (-1, -1, -1), (1, 1, 1))
+        elif isinstance(obj, Cube):
+            kind = CUBE
+            bmin, bmax = _transform_bounds(transform, (-1, -1, -1), (1, 1, 1))
+        elif isinstance(obj, Plane):
+            kind = PLANE
+            bmin = np.full(3, -INFINITY)
+            bmax = np.full(3, INFINITY)
+        elif isinstance(obj, (Cylinder, Cone)):
+            kind = CYLINDER if isinstance(obj, Cylinder) else CONE
+            params[0] = obj.minimum
+            params[1] = obj.maximum
+            params[2] = 1.0 if obj.closed else 0.0
+            radius = 1.0 if kind == CYLINDER else max(
+                abs(obj.minimum), abs(obj.maximum))
+            if np.isfinite(obj.minimum) and np.isfinite(obj.maximum):
+                bmin, bmax = _transform_bounds(transform, (-radius, obj.minimum, -radius),
+                                               (radius, obj.maximum, radius))
+            else:
+                bmin = np.full(3, -INFINITY)
+                bmax = np.full(3, INFINITY)
+        else:
+            raise TypeError(
+                f"{obj.__class__.__name__} can't be frozen, only spheres, planes, cubes, "
+                "cylinders, cones, triangles, meshes, groups, instances and bounding boxes")
+
+        self.add(kind, obj, inv, params, bmin, bmax)
+
+    def instance(self, obj: Instance, inv: np.ndarray) -> None:
+        # the geometry is frozen the first time it is seen, in the space of
+        # the instance
+        geometry = self._geometry_index.get(id(obj.geometry))
+        if geometry is None:
+            first = len(self.kinds)
+            self.shared = True
+            self.visit(obj.geometry, obj.geometry.inv_transform)
+            self.shared = False
+            geometry = len(self.geometry_prims)
+            self._geometry_index[id(obj.geometry)] = geometry
+            self.geometry_prims.append((first, len(self.kinds) - first))
+        first, count = self.geometry_prims[geometry]
+        if count == 0:
+            return
+
+        bmin = np.min(self.bounds_min[first:first + count], axis=0)
+        bmax = np.max(self.bounds_max[first:first + count], axis=0)
+        if np.isfinite(bmin).all() and np.isfinite(bmax).all():
+            bmin, bmax = _transform_bounds(np.linalg.inv(inv), bmin, bmax)
+        else:
+            bmin = np.full(3, -INFINITY)
+            bmax = np.full(3, INFINITY)
+        self.instance_inv.append(inv)
+        self.instance_geometry.append(geometry)
+        # a material of the instance has its patterns in the space of the
+        # instance, like Material.color_at in InstanceHit.color_at
+        material = obj.material
+        if material is None:
+            self.instance_materials.append(-1)
+            self.instance_patterns.append(IDENTITY)
+        else:
+            self.instance_materials.append(self.material(material))
+            pattern = material.pattern
+            pattern_inv = IDENTITY if pattern is None else pattern.inv_transform
+            self.instance_patterns.append(pattern_inv.dot(inv))
+        self.instance_shadows.append(1 if obj.has_shadow else 0)
+        self.instance_min.append(bmin)
+        self.instance_max.append(bmax)
+
+    def triangle(self, obj: WorldObject, inv: np.ndarray, p1: np.ndarray, p2: np.ndarray,
+                 p3: np.ndarray, n1: np.ndarray, n2: np.ndarray, n3: np.ndarray) -> None:
+        # triangles are moved to world space so their transform is the identity
+        transform = np.linalg.inv(inv)
+        w1 = transform.dot(p1)[:3]
+        w2 = transform.dot(p2)[:3]
+        w3 = transform.dot(p3)[:3]
+        params = np.empty(PARAMS_SIZE)
+        params[0:3] = w1
+        params[3:6] = w2 - w1
+        params[6:9] = w3 - w1
+        for n, normal in enumerate((n1, n2, n3)):
+            wn = inv.T.dot(normal)[:3]
+            params[9 + 3 * n:12 + 3 * n] = wn * (1.0 / sqrt(wn.dot(wn)))
+        corners = np.array((w1, w2, w3))
+        self.add(TRIANGLE, obj, IDENTITY, params,
+                 corners.min(axis=0), corners.max(axis=0))
+
+
+def freeze(world, previous: Optional[FrozenScene] = None) -> FrozenScene:
+    # previous is an older snapshot of the same world whose BVH is refitted
+    freezer = _Freezer()
+    for obj in world.objects:
+        freezer.visit(obj, obj.inv_transform)
+
+    light: Light
+    lights = np.array([[*light.position[:3], *light.intensity[:3]]
+                       for light in world.light], dtype=np.float64).reshape(-1, 6)
+
+    n = len(freezer.kinds)
+    k = len(freezer.instance_geometry)
+    return FrozenScene(
+        np.array(freezer.kinds, dtype=np.int32),
+        np.array(freezer.inv_transforms, dtype=np.float64).reshape(n, 4, 4),
+        np.array(freezer.params, dtype=np.float64).reshape(n, PARAMS_SIZE),
+        np.array(freezer.material_ids, dtype=np.int32),
+        np.array(freezer.materials, dtype=np.float64).reshape(
+            -1, len(MATERIAL_FIELDS)),
+        np.array(freezer.pattern_transforms,
+                 dtype=np.float64).reshape(n, 4, 4),
+        np.array(freezer.shadows, dtype=np.uint8),
+        np.array(freezer.bounds_min + freezer.instance_min, dtype=np.float64).reshape(n + k, 3),
+        np.array(freezer.bounds_max + freezer.instance_max, dtype=np.float64).reshape(n + k, 3),
+        lights,
+        np.array(freezer.geometry_prims, dtype=np.int32).reshape(-1, 2),
+        np.array(freezer.instance_inv, dtype=np.float64).reshape(k, 4, 4),
+        np.array(freezer.instance_geometry, dtype=np.int32),
+        np.array(freezer.instance_materials, dtype=np.int32),
+        np.array(freezer.instance_patterns, dtype=np.float64).reshape(k, 4, 4),
+        np.array(freezer.instance_shadows, dtype=np.uint8),
+        previous,
+    )
@@ -0,0 +1,107 @@
+import hashlib
+import struct
+from enum import Enum
+from typing import Any, Iterator, Set
+
+import numpy as np
+
+from .textures import ImagePattern
+
+# Canonical hash of a scene: two worlds built the same way hash the same in
+# any process or machine. Objects are walked attribute by attribute in name
+# order, leaving out the random ids, the parent links and the caches
+
+EXCLUDED = frozenset((
+    'id', 'parent', 'cache',
+    # World caches
+    '_objects_ids', '_rays_left', '_occluders',
+    '_shadow_cache_hits', '_shadow_cache_misses', '_compiled',
+))
+_CHUNK = 1024 * 1024
+
+
+def _attributes(obj: Any) -> Iterator[str]:
+    names = set(getattr(obj, '__dict__', ()))
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        names.update((slots,) if isinstance(slots, str) else slots)
+    return iter(sorted(names - EXCLUDED))
+
+
+def _file_digest(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class _Hasher:
+    __slots__ = ("digest", "_stack")
+
+    def __init__(self) -> None:
+        self.digest = hashlib.sha256()
+        self._stack: Set[int] = set()
+
+    def tag(self, tag: str) -> None:
+        self.digest.update(tag.encode('utf-8') + b'\0')
+
+    def add(self, value: Any) -> None:
+        update = self.digest.update
+        if value is None or isinstance(value, (bool, str)):
+            self.tag(f'{type(value).__name__}:{value}')
+        elif isinstance(value, (int, np.integer)):
+            self.tag(f'int:{int(value)}')
+        elif isinstance(value, (float, np.floating)):
+            self.tag('float')
+            update(struct.pack('<d', float(value)))
+        elif isinstance(value, np.ndarray):
+            self.tag(f'array:{value.dtype.str}:{value.shape}')
+            update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, Enum):
+            self.tag(f'enum:{type(value).__qualname__}.{value.name}')
+        elif isinstance(value, (list, tuple)):
+            self.tag(f'{type(value).__name__}:{len(value)}')
+            for item in value:
+                self.add(item)
+        elif isinstance(value, dict):
+            self.tag(f'dict:{len(value)}')
+            for key in sorted(value, key=repr):
+                self.add(key)
+                self.add(value[key])
+        elif callable(value) and hasattr(value, '__qualname__'):
+            self.tag(f'function:{value.__module__}.{value.__qualname__}')
+        else:
+            self.add_object(value)
+
+    def add_object(self, obj: Any) -> None:
+        if id(obj) in self._stack:
+            raise ValueError(f'{type(obj).__name__} refers to itself')
+        self._stack.add(id(obj))
+        self.tag(f'object:{type(obj).__module__}.{type(obj).__qualname__}')
+        if isinstance(obj, ImagePattern):
+            # the pixels count, not where the file is
+            self.digest.update(_file_digest(obj.path))
+        for name in _attributes(obj):
+            if isinstance(obj, ImagePattern) and name == 'path':
+                continue
+            try:
+                value = getattr(obj, name)
+            except AttributeError:
+                continue
+            self.tag(name)
+            self.add(value)
+        self._stack.discard(id(obj))
+
+
+def canonical_hash(*values: Any) -> str:
+    hasher = _Hasher()
+    for value in values:
+        hasher.add(value)
+    return hasher.digest.hexdigest()
+
+
+def scene_hash(world: Any, camera: Any, *extra: Any) -> str:
+    # world and camera plus whatever else changes the image, the canvas
+    # size or the ray budget
+    return canonical_hash(world, camera, *extra)
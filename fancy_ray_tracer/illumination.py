@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from math import pow, sqrt
+from math import ceil, cos, pi, pow, sin, sqrt
 
 import numpy as np
 
 from fancy_ray_tracer.constants import EPSILON
 
+from .bridson_sampling import hash_shift, poisson_disk_samples, spread_order, toroidal_shift
 from .protocols import WorldObject
 from .utils import equal
 
@@ -21,16 +22,124 @@ class Light:
         return equal(self.position, other.position) and equal(self.intensity, other.intensity)
 
 
+def stratified_samples(n: int, seed: int = 0) -> np.ndarray:
+    # one jittered sample per cell of a ceil(sqrt(n)) x ceil(sqrt(n)) grid
+    side = ceil(sqrt(n))
+    rng = np.random.default_rng(seed)
+    ij = np.mgrid[0:side, 0:side].reshape(2, -1).T
+    return (ij + rng.uniform(0, 1, ij.shape)) / side
+
+
+def poisson_samples(n: int, seed: int = 0) -> np.ndarray:
+    # a maximal poisson disk set holds close to 0.7 / radius^2 points
+    return poisson_disk_samples(sqrt(0.5 / n), 12, n, seed)
+
+
+def make_samples(n: int, pattern: str, probes: int) -> np.ndarray:
+    if pattern == 'stratified':
+        return spread_order(stratified_samples(n), probes)
+    if pattern == 'poisson':
+        return poisson_samples(n)
+    raise ValueError(f"unknown sample pattern {pattern}")
+
+
+class AreaLight(Light):
+    # samples are unit square points computed once, the first probes samples
+    # decide if a point is in penumbra and needs the remaining ones
+    # when decorrelate is set every shaded point sees the pattern shifted by
+    # a hash of its position, trading banding for noise at no extra cost
+    __slots__ = ("samples", "probes", "decorrelate")
+
+    def __init__(self, position: np.ndarray, intensity: np.ndarray,
+                 samples: int = 16, probes: int = 4, pattern: str = 'stratified',
+                 decorrelate: bool = True):
+        super().__init__(position, intensity)
+        self.samples: np.ndarray = make_samples(samples, pattern, probes)
+        self.probes: int = min(probes, len(self.samples))
+        self.decorrelate: bool = decorrelate
+
+    def sample_points(self, p: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RectangleLight(AreaLight):
+    __slots__ = ("corner", "uvec", "vvec")
+
+    def __init__(self, corner: np.ndarray, uvec: np.ndarray, vvec: np.ndarray, intensity: np.ndarray,
+                 samples: int = 16, probes: int = 4, pattern: str = 'stratified',
+                 decorrelate: bool = True):
+        super().__init__(corner + uvec * 0.5 + vvec * 0.5,
+                         intensity, samples, probes, pattern, decorrelate)
+        self.corner: np.ndarray = corner
+        self.uvec: np.ndarray = uvec
+        self.vvec: np.ndarray = vvec
+
+    def sample_points(self, p: np.ndarray) -> np.ndarray:
+        samples = self.samples
+        if self.decorrelate:
+            samples = toroidal_shift(samples, hash_shift(p[0], p[1], p[2]))
+        return self.corner + np.outer(samples[:, 0], self.uvec) + np.outer(samples[:, 1], self.vvec)
+
+
+class SphereLight(AreaLight):
+    # a sphere seen from any point is a disk facing that point
+    __slots__ = ("radius", "_disk")
+
+    def __init__(self, center: np.ndarray, radius: float, intensity: np.ndarray,
+                 samples: int = 16, probes: int = 4, pattern: str = 'stratified',
+                 decorrelate: bool = True):
+        super().__init__(center, intensity, samples,
+                         probes, pattern, decorrelate)
+        self.radius: float = radius
+        self._disk: np.ndarray = square_to_disk(self.samples) * radius
+
+    def sample_points(self, p: np.ndarray) -> np.ndarray:
+        direction: np.ndarray = self.position[:3] - p[:3]
+        tangent: np.ndarray = np.cross(direction, (0.0, 1.0, 0.0))
+        if tangent.dot(tangent) < EPSILON:
+            tangent = np.cross(direction, (1.0, 0.0, 0.0))
+        tangent *= 1.0 / sqrt(tangent.dot(tangent))
+        bitangent: np.ndarray = np.cross(tangent, direction)
+        bitangent *= 1.0 / sqrt(bitangent.dot(bitangent))
+        if self.decorrelate:
+            # spin the frame instead of the samples, a rotated disk is
+            # still the same disk
+            angle = 2 * pi * hash_shift(p[0], p[1], p[2])[0]
+            tangent, bitangent = cos(angle) * tangent + sin(angle) * bitangent, \
+                cos(angle) * bitangent - sin(angle) * tangent
+        disk = self._disk
+        points = np.empty((len(disk), 4))
+        points[:, :3] = self.position[:3] + np.outer(disk[:, 0], tangent) + \
+            np.outer(disk[:, 1], bitangent)
+        points[:, 3] = 1.0
+        return points
+
+
+def square_to_disk(samples: np.ndarray) -> np.ndarray:
+    # Shirley concentric mapping, keeps the strata of the samples
+    a = 2 * samples[:, 0] - 1
+    b = 2 * samples[:, 1] - 1
+    use_a = np.abs(a) > np.abs(b)
+    safe_a = np.where(a == 0, 1, a)
+    safe_b = np.where(b == 0, 1, b)
+    r = np.where(use_a, a, b)
+    phi = np.where(use_a, (np.pi / 4) * (b / safe_a),
+                   (np.pi / 2) - (np.pi / 4) * (a / safe_b))
+    return np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+
+
 def reflect(v: np.ndarray, n: np.ndarray) -> np.ndarray:
     return v - (2 * v.dot(n)) * n
 
 
 def lighting(obj: WorldObject, light: Light, point: np.ndarray,
-             eyev: np.ndarray, normalv: np.ndarray, in_shadow: float = 0.0):
-    # combine the surface color with the light's color/intensity
+             eyev: np.ndarray, normalv: np.ndarray, in_shadow: float = 0.0,
+             footprint: float = 0.0):
+    # combine the surface color with the light's color/intensity, footprint
+    # is the width of the ray on the surface
     material = obj.material
     # color = object.color_at(point)
-    effective_color = obj.color_at(point) * light.intensity
+    effective_color = obj.color_at(point, footprint) * light.intensity
 
     # compute the ambient contribution
     ambient = effective_color * material.ambient
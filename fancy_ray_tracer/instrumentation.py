@@ -0,0 +1,287 @@
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from . import primitives
+from .constants import EPSILON
+from .primitives import (
+    BoundingBox,
+    Cone,
+    Cube,
+    Cylinder,
+    Plane,
+    Sphere,
+    Triangle,
+    TriangleMesh,
+)
+from .protocols import WorldObject
+from .ray import IntersectionBuffer, Ray
+from .world import World
+
+# counters are patched over the hot paths by enable() and removed by
+# disable(), the tracer runs the unmodified methods while disabled
+
+PRIMITIVES = (Sphere, Plane, Cube, Cylinder, Cone, Triangle, TriangleMesh)
+RAY_KINDS = ('primary', 'shadow', 'reflected', 'refracted')
+# per object and per type events
+EVENTS = ('intersect_calls', 'intersect_hits', 'bbox_tests', 'bbox_rejects',
+          'primitive_tests', 'primitive_hits')
+
+
+class Stats:
+    # rays, bbox_tests and primitive_tests are running totals, the
+    # dictionaries split them by ray kind, object id and object type
+    __slots__ = ("rays", "bbox_tests", "primitive_tests", "ray_kinds",
+                 "objects", "types", "names")
+
+    def __init__(self) -> None:
+        self.rays: int = 0
+        self.bbox_tests: int = 0
+        self.primitive_tests: int = 0
+        self.ray_kinds: Dict[str, int] = dict.fromkeys(RAY_KINDS, 0)
+        self.objects: Dict[str, Dict[str, int]] = {}
+        self.types: Dict[str, Dict[str, int]] = {}
+        self.names: Dict[str, str] = {}
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def ray(self, kind: str) -> None:
+        self.rays += 1
+        self.ray_kinds[kind] += 1
+
+    def count(self, obj: WorldObject, event: str, n: int = 1) -> None:
+        key = obj.id
+        counters = self.objects.get(key)
+        if counters is None:
+            counters = self.objects[key] = dict.fromkeys(EVENTS, 0)
+            self.names[key] = obj.__class__.__name__
+        counters[event] += n
+        name = self.names[key]
+        counters = self.types.get(name)
+        if counters is None:
+            counters = self.types[name] = dict.fromkeys(EVENTS, 0)
+        counters[event] += n
+
+    def merge(self, other: 'Stats') -> None:
+        self.rays += other.rays
+        self.bbox_tests += other.bbox_tests
+        self.primitive_tests += other.primitive_tests
+        for kind, n in other.ray_kinds.items():
+            self.ray_kinds[kind] += n
+        for table, other_table in ((self.objects, other.objects), (self.types, other.types)):
+            for key, counters in other_table.items():
+                mine = table.setdefault(key, dict.fromkeys(EVENTS, 0))
+                for event, n in counters.items():
+                    mine[event] += n
+        self.names.update(other.names)
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            'rays': {**self.ray_kinds, 'total': self.rays},
+            'types': {name: dict(counters) for name, counters in self.types.items()},
+            'objects': {key: {'type': self.names[key], **counters}
+                        for key, counters in self.objects.items()},
+        }
+
+    def report(self) -> str:
+        lines = ['rays: ' + ', '.join(f'{kind} {n}' for kind, n in self.ray_kinds.items())
+                 + f', total {self.rays}']
+        header = f"{'':<32}" + ''.join(f'{event:>16}' for event in EVENTS)
+        for title, rows in (('type', self.types.items()),
+                            ('object', ((f'{self.names[k]} {k}', c) for k, c in self.objects.items()))):
+            lines.append('')
+            lines.append(f'per {title}')
+            lines.append(header)
+            for name, counters in sorted(rows, key=lambda row: -row[1]['intersect_calls']):
+                lines.append(f'{name[:32]:<32}' + ''.join(f'{counters[event]:>16}' for event in EVENTS))
+        return '\n'.join(lines)
+
+
+STATS = Stats()
+
+_originals: List[Tuple[type, str, Callable]] = []
+# kind of the rays traced by World.color_at right now
+_ray_kind: List[str] = ['primary']
+
+
+def enabled() -> bool:
+    return len(_originals) != 0
+
+
+def _patch(cls: type, name: str, wrapper: Callable) -> None:
+    _originals.append((cls, name, cls.__dict__[name]))
+    setattr(cls, name, wrapper)
+
+
+def _count_primitive(intersect: Callable) -> Callable:
+    def wrapper(self, origin: np.ndarray, direction: np.ndarray):
+        # a mesh tests every face
+        n = len(self.faces_groups) if isinstance(self, TriangleMesh) else 1
+        STATS.primitive_tests += n
+        STATS.count(self, 'primitive_tests', n)
+        xs = intersect(self, origin, direction)
+        if len(xs) != 0:
+            STATS.count(self, 'primitive_hits')
+        return xs
+    return wrapper
+
+
+def _count_primitive_into(intersect_into: Callable) -> Callable:
+    def wrapper(self, origin: np.ndarray, direction: np.ndarray, buffer: IntersectionBuffer):
+        n = len(self.faces_groups) if isinstance(self, TriangleMesh) else 1
+        STATS.primitive_tests += n
+        STATS.count(self, 'primitive_tests', n)
+        size = len(buffer)
+        intersect_into(self, origin, direction, buffer)
+        if len(buffer) != size:
+            STATS.count(self, 'primitive_hits')
+    return wrapper
+
+
+def _bbox_intersect(self: BoundingBox, origin: np.ndarray, direction: np.ndarray):
+    # BoundingBox.intersect with the test and the reject counted apart
+    STATS.bbox_tests += 1
+    STATS.count(self, 'bbox_tests')
+    if primitives.aabb_box_intersect(self.bound_min, self.bound_max, origin, direction, EPSILON) is None:
+        STATS.count(self, 'bbox_rejects')
+        return ()
+    return self.shape.intersect(origin, direction)
+
+
+def _bbox_intersect_into(self: BoundingBox, origin: np.ndarray, direction: np.ndarray,
+                         buffer: IntersectionBuffer) -> None:
+    STATS.bbox_tests += 1
+    STATS.count(self, 'bbox_tests')
+    if primitives.aabb_box_intersect(self.bound_min, self.bound_max, origin, direction, EPSILON) is None:
+        STATS.count(self, 'bbox_rejects')
+        return
+    self.shape.intersect_into(origin, direction, buffer)
+
+
+def _ray_intersect(intersect: Callable) -> Callable:
+    def wrapper(self: Ray, s: WorldObject):
+        STATS.count(s, 'intersect_calls')
+        xs = intersect(self, s)
+        if len(xs) != 0:
+            STATS.count(s, 'intersect_hits')
+        return xs
+    return wrapper
+
+
+def _ray_intersect_into(intersect_into: Callable) -> Callable:
+    def wrapper(self: Ray, s: WorldObject, buffer: IntersectionBuffer):
+        STATS.count(s, 'intersect_calls')
+        size = len(buffer)
+        intersect_into(self, s, buffer)
+        if len(buffer) != size:
+            STATS.count(s, 'intersect_hits')
+    return wrapper
+
+
+def _count_ray(method: Callable, kind: str) -> Callable:
+    def wrapper(self, *args, **kwargs):
+        STATS.ray(kind)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _count_traced(method: Callable) -> Callable:
+    def wrapper(self, *args, **kwargs):
+        STATS.ray(_ray_kind[0])
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _secondary(method: Callable, kind: str) -> Callable:
+    # the rays spawned under method are of the given kind
+    def wrapper(self, *args, **kwargs):
+        outer = _ray_kind[0]
+        _ray_kind[0] = kind
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _ray_kind[0] = outer
+    return wrapper
+
+
+def enable() -> None:
+    if enabled():
+        return
+    for cls in PRIMITIVES:
+        _patch(cls, 'intersect', _count_primitive(cls.__dict__['intersect']))
+        _patch(cls, 'intersect_into', _count_primitive_into(cls.__dict__['intersect_into']))
+    _patch(BoundingBox, 'intersect', _bbox_intersect)
+    _patch(BoundingBox, 'intersect_into', _bbox_intersect_into)
+    _patch(Ray, 'intersect', _ray_intersect(Ray.__dict__['intersect']))
+    _patch(Ray, 'intersect_into', _ray_intersect_into(Ray.__dict__['intersect_into']))
+    # every traced ray goes through color_at or trace_hit, shadow rays
+    # through _is_shadowed
+    _patch(World, 'color_at', _count_traced(World.__dict__['color_at']))
+    _patch(World, 'trace_hit', _count_ray(World.__dict__['trace_hit'], 'primary'))
+    _patch(World, '_is_shadowed', _count_ray(World.__dict__['_is_shadowed'], 'shadow'))
+    _patch(World, 'reflected_color', _secondary(World.__dict__['reflected_color'], 'reflected'))
+    _patch(World, 'refracted_color', _secondary(World.__dict__['refracted_color'], 'refracted'))
+
+
+def disable() -> None:
+    while _originals:
+        cls, name, method = _originals.pop()
+        setattr(cls, name, method)
+    _ray_kind[0] = 'primary'
+
+
+def reset() -> None:
+    STATS.clear()
+
+
+def summary() -> Dict[str, Dict]:
+    return STATS.summary()
+
+
+def report() -> str:
+    return STATS.report()
+
+
+@contextmanager
+def collect() -> Iterator[Stats]:
+    # counts into a fresh Stats while the block runs, used by the render
+    # workers to send their counters back. The previous state is restored
+    global STATS
+    was_enabled = enabled()
+    enable()
+    outer = STATS
+    STATS = Stats()
+    try:
+        yield STATS
+    finally:
+        STATS = outer
+        if not was_enabled:
+            disable()
+
+
+# false colour ramp from black to white through blue, magenta, red and yellow
+_RAMP_STOPS = np.array((0.0, 0.2, 0.4, 0.6, 0.8, 1.0))
+_RAMP_COLORS = np.array(((0, 0, 0), (0, 0, 160), (160, 0, 160),
+                         (230, 30, 30), (255, 210, 0), (255, 255, 255)), dtype=np.float64)
+
+
+def false_color(values: np.ndarray) -> np.ndarray:
+    # (h, w) values to an (h, w, 3) uint8 image scaled by the maximum
+    values = np.asarray(values, dtype=np.float64)
+    top = values.max() if values.size != 0 else 0.0
+    scaled = values / top if top > 0 else np.zeros_like(values)
+    channels = [np.interp(scaled, _RAMP_STOPS, _RAMP_COLORS[:, c]) for c in range(3)]
+    return np.stack(channels, axis=-1).round().astype(np.uint8)
+
+
+def save_heatmaps(maps: Dict[str, np.ndarray], directory: Union[str, os.PathLike]) -> None:
+    # raw counts as <name>.npy next to a <name>.png false colour image
+    os.makedirs(directory, exist_ok=True)
+    for name, values in maps.items():
+        np.save(os.path.join(directory, f'{name}.npy'), values)
+        Image.fromarray(false_color(values), 'RGB').save(
+            os.path.join(directory, f'{name}.png'))
@@ -8,7 +8,7 @@ import numpy as np
 from .constants import EPSILON
 from .matrices import identity
 from .protocols import MaterialP, Pattern
-from .utils import equal
+from .utils import equal, transform_scale
 
 
 class DefaultPattern(Pattern):
@@ -19,9 +19,15 @@ class DefaultPattern(Pattern):
         self.transform: np.ndarray = identity()
         self.inv_transform: np.ndarray = self.transform
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        # footprint is the width of the looked up area in pattern space,
+        # only image textures filter by it
         return point[:3]
 
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        # (N, 4) points in pattern space to (N, 3) colors
+        return np.array(points[:, :3], dtype=np.float64)
+
     def __eq__(self, other: DefaultPattern) -> bool:
         return self.name == other.name
 
@@ -35,12 +41,16 @@ class StripePattern(DefaultPattern):
         self._c1 = color1
         self._c2 = color2
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
         if floor(point[0]) % 2 == 0:
             return self._c1
 
         return self._c2
 
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        even = np.floor(points[:, 0]) % 2 == 0
+        return np.where(even[:, None], self._c1[:3], self._c2[:3])
+
     def __eq__(self, other: StripePattern) -> bool:
         return self.name == other.name and equal(self._c1, other._c1) and equal(self._c2, other._c2)
 
@@ -55,9 +65,13 @@ class LinearGradient(DefaultPattern):
         self._c2 = color2
         self._gap = color2 - color1
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
         return self._c1 + self._gap * (point[0] - floor(point[0]))
 
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        x = points[:, 0]
+        return self._c1[:3] + np.outer(x - np.floor(x), self._gap[:3])
+
     def __eq__(self, other: StripePattern) -> bool:
         return self.name == other.name and equal(self._c1, other._c1) and equal(self._c2, other._c2)
 
@@ -71,12 +85,16 @@ class RingPatter(DefaultPattern):
         self._c1 = color1
         self._c2 = color2
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
         if floor(sqrt(pow(point[0], 2) + pow(point[2], 2))) % 2 == 0:
             return self._c1
 
         return self._c2
 
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        even = np.floor(np.hypot(points[:, 0], points[:, 2])) % 2 == 0
+        return np.where(even[:, None], self._c1[:3], self._c2[:3])
+
     def __eq__(self, other: StripePattern) -> bool:
         return self.name == other.name and equal(self._c1, other._c1) and equal(self._c2, other._c2)
 
@@ -90,12 +108,16 @@ class ChessPattern(DefaultPattern):
         self._c1 = color1
         self._c2 = color2
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
         if (floor(point[0]) + floor(point[1]) + floor(point[2])) % 2 == 0:
             return self._c1
 
         return self._c2
 
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        even = np.floor(points[:, :3]).sum(axis=1) % 2 == 0
+        return np.where(even[:, None], self._c1[:3], self._c2[:3])
+
     def __eq__(self, other: StripePattern) -> bool:
         return self.name == other.name and equal(self._c1, other._c1) and equal(self._c2, other._c2)
 
@@ -118,12 +140,25 @@ class Material(MaterialP):  # pylint: disable=too-few-public-methods,too-many-ar
         self.transparency: float = transparency
         self.refractive_index: float = refractive_index
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
         if self.pattern is None:
             return self.color
 
         point = self.pattern.inv_transform.dot(point)
-        return self.pattern.color_at(point)
+        if footprint > 0:
+            footprint *= transform_scale(self.pattern.inv_transform)
+        return self.pattern.color_at(point, footprint)
+
+    def colors_at(self, points: np.ndarray, object_inv: Optional[np.ndarray] = None) -> np.ndarray:
+        # batch version of color_at, object_inv is folded with the pattern
+        # transform so the points are transformed once
+        if self.pattern is None:
+            return np.tile(self.color[:3], (len(points), 1))
+
+        transform = self.pattern.inv_transform
+        if object_inv is not None:
+            transform = transform.dot(object_inv)
+        return self.pattern.colors_at(points.dot(transform.T))
 
     def __eq__(self, other: Material) -> bool:
         return equal(self.color, other.color) and abs(self.ambient - other.ambient) < EPSILON \
@@ -24,18 +24,17 @@ class WavefrontOBJ:
     def parse(self) -> Group:
         vertices: List[np.ndarray] = []
         normals: List[np.ndarray] = []
-        # textures: List[np.ndarray] = []
+        textures: List[np.ndarray] = []
 
         faces: TriangleFaces = []
         faces_normals: TriangleFaces = []
-        # TODO: uncomment when implement textures
-        # faces_textures: TriangleFaces = []
+        # faces without uvs get (-1, -1, -1) so the list stays aligned
+        faces_textures: TriangleFaces = []
 
         current_group = ""
         faces_groups: Dict[str, TriangleFaces] = {}
         normals_groups: Dict[str, TriangleFaces] = {}
-        # TODO: uncomment when implement textures
-        # texture_groups: Dict[str, TriangleFaces] = {}
+        texture_groups: Dict[str, TriangleFaces] = {}
 
         for line in self.data:
             line = tuple(filter(lambda x: x != '', line.strip().split(' ')))
@@ -54,29 +53,26 @@ class WavefrontOBJ:
                         if other_format:
                             fc = []
                             nm = []
-                            # TODO: uncomment when implement textures
-                            # tx = []
+                            tx = []
                             for i in line[1:]:
                                 vals = i.split('/')
                                 fc.append(int(vals[0]) - 1)
                                 nm.append(int(vals[2]) - 1)
-                                # TODO: uncomment when implement textures
-                                # if vals[1]!='':
-                                #     tx.append(int(vals[1])-1)
+                                if vals[1] != '':
+                                    tx.append(int(vals[1]) - 1)
+                            if len(tx) != len(fc):
+                                tx = [-1] * len(fc)
                             if len(fc) == 3:
                                 faces.append(tuple(fc))
                                 faces_normals.append(tuple(nm))
-                                # TODO: uncomment when implement textures
-                                # if len(tx)!=0:
-                                #     textures.append(tuple)
+                                faces_textures.append(tuple(tx))
                             else:
                                 res = fan_triangulation(fc)
                                 faces.extend(res)
                                 res = fan_triangulation(nm)
                                 faces_normals.extend(res)
-                                # TODO: uncomment when implement textures
-                                # res = fan_triangulation(textures)
-                                # faces_textures.extend(res)
+                                res = fan_triangulation(tx)
+                                faces_textures.extend(res)
 
                         else:
                             vc = tuple(int(i) for i in line[1:])
@@ -89,34 +85,33 @@ class WavefrontOBJ:
                     if len(faces_normals) != 0:
                         normals_groups[current_group] = faces_normals
                         faces_normals = []
-                    # TODO: uncomment when implement textures
-                    # if len(textures) != 0:
-                    #     texture_groups[current_group] = textures
-                    #     textures = []
+                    if len(faces_textures) != 0:
+                        texture_groups[current_group] = faces_textures
+                        faces_textures = []
                     current_group = line[1]
             elif len(line[0]) == 2:
                 if line[0] == 'vn':
                     vn = vector(float(line[1]), float(line[2]), float(line[3]))
                     normals.append(vn)
-                # TODO: uncomment when implement textures
-                # if line[0] == 'vt':
-                #     vn = vector(float(line[1]), float(line[2]), float(line[3]))
-                #     textures.append(vn)
-                pass
+                if line[0] == 'vt':
+                    textures.append(
+                        np.array((float(line[1]), float(line[2])), dtype=np.float64))
 
         if len(faces) != 0:
             faces_groups[current_group] = faces
         if len(faces_normals) != 0:
             normals_groups[current_group] = faces_normals
-        # TODO: uncomment when implement textures
-        # if len(textures) != 0:
-        #     texture_groups[current_group] = textures
+        if len(faces_textures) != 0:
+            texture_groups[current_group] = faces_textures
+        if len(textures) == 0:
+            texture_groups = {}
 
         g = Group()
         if len(faces_groups) == 1:
             if len(normals) != 0:
                 mesh = TriangleMesh(vertices, faces,
-                                    normals, normals_groups[current_group])
+                                    normals, normals_groups[current_group],
+                                    textures, texture_groups.get(current_group))
                 g.add_shape(mesh)
             else:
                 for face in faces:
@@ -130,7 +125,8 @@ class WavefrontOBJ:
         for gname, faces in faces_groups.items():
             if gname in normals_groups:
                 mesh = TriangleMesh(vertices, faces,
-                                    normals, normals_groups[gname])
+                                    normals, normals_groups[gname],
+                                    textures, texture_groups.get(gname))
                 g.add_shape(mesh)
             else:
                 gm = Group()
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from math import fabs, sqrt
-from typing import Dict, List, Optional, Sequence
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 
@@ -15,15 +15,21 @@ from .constants import (
 )
 from .materials import Material, make_material
 from .protocols import TriangleFaces, WorldObject
-from .ray import Intersection
+from .ray import Intersection, IntersectionBuffer, normal_at, world_to_object
+from .textures import ImagePattern
 from .tuples import point, vector
-from .utils import rand_id
+from .utils import rand_id, transform_scale
 
 try:
     from .compiled import _intersection
 except ImportError:
     _intersection = None
 
+try:
+    from .compiled import _shapes
+except ImportError:
+    _shapes = None
+
 AXIS_X_VEC = vector(1, 0, 0)
 AXIS_Y_VEC = vector(0, 1, 0)
 AXIS_Z_VEC = vector(0, 0, 1)
@@ -94,6 +100,197 @@ def aabb_box_intersect_fallback(bound_min: np.ndarray, bound_max: np.ndarray,
 aabb_box_intersect = _intersection.aabb_box_intersect if _intersection is not None else aabb_box_intersect_fallback
 
 
+# the quadric kernels take the ray in object space and return the t values
+# of the hits, the shapes wrap them into intersections
+
+
+def sphere_intersect_fallback(origin: np.ndarray, direction: np.ndarray) -> Tuple[float, ...]:
+    o0 = origin[0]
+    o1 = origin[1]
+    o2 = origin[2]
+    d0 = direction[0]
+    d1 = direction[1]
+    d2 = direction[2]
+    a: float = d0 * d0 + d1 * d1 + d2 * d2
+    b: float = 2.0 * (d0 * o0 + d1 * o1 + d2 * o2)
+    c: float = o0 * o0 + o1 * o1 + o2 * o2 - 1
+    dc = b * b - 4.0 * a * c
+
+    if dc < 0:
+        return ()
+
+    dcsq = sqrt(dc)
+    a12 = 1.0 / (2.0 * a)
+
+    return (-b - dcsq) * a12, (-b + dcsq) * a12
+
+
+def cylinder_intersect_fallback(origin: np.ndarray, direction: np.ndarray, minimum: float,
+                                maximum: float, closed: bool, epsilon: float) -> Tuple[float, ...]:
+    a = direction[0] * direction[0] + direction[2] * direction[2]
+
+    if a < epsilon:
+        if not closed:
+            return ()
+        # here we have a perpendicular ray to the caps
+        # test if the ray hit one of the caps and if so the the second
+        # cap is hit too
+        o1 = origin[1]
+        d1 = direction[1]
+        d1i = 1 / d1
+        t0 = (minimum - o1) * d1i
+        x = origin[0] + t0 * direction[0]
+        z = origin[2] + t0 * direction[2]
+        if x * x + z * z > 1.0:
+            return ()
+
+        return t0, (maximum - o1) * d1i
+
+    b = 2 * (origin[0] * direction[0] + origin[2] * direction[2])
+    c = origin[0] * origin[0] + origin[2] * origin[2] - 1
+
+    disc = b * b - 4 * a * c
+
+    if disc < 0:
+        return ()
+
+    sqdc = sqrt(disc)
+    a21 = 1 / (2 * a)
+    t0 = (-b - sqdc) * a21
+    t1 = (-b + sqdc) * a21
+
+    if t0 > t1:
+        t0, t1 = t1, t0
+
+    xs: List[float] = []
+
+    o1 = origin[1]
+    d1 = direction[1]
+    y = o1 + t0 * d1
+    if minimum < y < maximum:
+        xs.append(t0)
+    y = o1 + t1 * d1
+    if minimum < y < maximum:
+        xs.append(t1)
+
+    # since cylinder is cuadric surfece can only by intrecepted at maximun of two
+    # point at same time
+
+    if not closed or len(xs) == 2 or abs(d1) < epsilon:
+        return tuple(xs)
+
+    d1i = 1 / d1
+    t = (minimum - o1) * d1i
+    x = origin[0] + t * direction[0]
+    z = origin[2] + t * direction[2]
+    if x * x + z * z <= 1:
+        xs.append(t)
+
+    if len(xs) == 2:
+        return xs[1], xs[0]
+
+    t = (maximum - o1) * d1i
+    x = origin[0] + t * direction[0]
+    z = origin[2] + t * direction[2]
+    if x * x + z * z <= 1:
+        xs.append(t)
+
+    if len(xs) == 2 and xs[0] > xs[1]:
+        return xs[1], xs[0]
+
+    return tuple(xs)
+
+
+def cone_intersect_fallback(origin: np.ndarray, direction: np.ndarray, minimum: float,
+                            maximum: float, closed: bool, epsilon: float) -> Tuple[float, ...]:
+    dy = direction[1]
+    oy = origin[1]
+    a = direction[0] * direction[0] + direction[2] * direction[2] - dy * dy
+    b = 2 * (origin[0] * direction[0] + origin[2] * direction[2] - oy * dy)
+    c = origin[0] * origin[0] + origin[2] * origin[2] - oy * oy
+    minimum2 = minimum * minimum
+    maximum2 = maximum * maximum
+
+    if abs(a) < epsilon:
+        if abs(b) < epsilon:
+            return ()
+
+        t1 = -c / (2 * b)
+
+        if not closed:
+            return (t1,)
+
+        dyi = 1 / dy
+        t = (minimum - oy) * dyi
+        x = origin[0] + t * direction[0]
+        z = origin[2] + t * direction[2]
+        if x * x + z * z <= minimum2:
+            if t < t1:
+                return t, t1
+            return t1, t
+
+        t = (maximum - oy) * dyi
+        x = origin[0] + t * direction[0]
+        z = origin[2] + t * direction[2]
+        if x * x + z * z <= maximum2:
+            if t < t1:
+                return t, t1
+            return t1, t
+
+        return ()
+
+    disc = b * b - 4 * a * c
+
+    if disc < 0:
+        return ()
+
+    sqdc = sqrt(disc)
+    a21 = 1 / (2 * a)
+    t0 = (-b - sqdc) * a21
+    t1 = (-b + sqdc) * a21
+
+    xs: List[float] = []
+
+    y = oy + t0 * dy
+    if minimum < y < maximum:
+        xs.append(t0)
+    y = oy + t1 * dy
+    if minimum < y < maximum:
+        xs.append(t1)
+
+    if not closed:
+        return tuple(xs)
+
+    dyi = 1 / dy
+    t = (minimum - oy) * dyi
+    x = origin[0] + t * direction[0]
+    z = origin[2] + t * direction[2]
+    if x * x + z * z <= minimum2:
+        xs.append(t)
+
+    t = (maximum - oy) * dyi
+    x = origin[0] + t * direction[0]
+    z = origin[2] + t * direction[2]
+    if x * x + z * z <= maximum2:
+        xs.append(t)
+
+    if len(xs) < 2:
+        return tuple(xs)
+
+    xs.sort()
+    return tuple(xs)
+
+
+if _shapes is not None:
+    sphere_intersect = _shapes.sphere_intersect
+    cylinder_intersect = _shapes.cylinder_intersect
+    cone_intersect = _shapes.cone_intersect
+else:
+    sphere_intersect = sphere_intersect_fallback
+    cylinder_intersect = cylinder_intersect_fallback
+    cone_intersect = cone_intersect_fallback
+
+
 class Shape(WorldObject):
     __slots__ = ("id", 'transform', 'material', 'inv_transform')
 
@@ -105,9 +302,18 @@ class Shape(WorldObject):
         self.parent: Optional[WorldObject] = None
         self.has_shadow = True
 
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        # footprint is the width of the ray on the surface, in world units
         point = self.inv_transform.dot(point)
-        return self.material.color_at(point)
+        if footprint > 0 and isinstance(self.material.pattern, ImagePattern):
+            footprint *= transform_scale(self.inv_transform)
+        else:
+            # only image textures are filtered
+            footprint = 0.0
+        return self.material.color_at(point, footprint)
+
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        return self.material.colors_at(points, self.inv_transform)
 
     def __eq__(self, other: WorldObject) -> bool:
         return self.id == other.id
@@ -118,6 +324,12 @@ class Shape(WorldObject):
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
         raise NotImplementedError
 
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        # appends the hits to buffer unsorted, shapes that can append the
+        # raw values override it to skip the Intersection objects
+        buffer.extend(self.intersect(origin, direction))
+
     def __contains__(self, x: WorldObject) -> bool:
         if x.id == self.id:
             return True
@@ -133,23 +345,19 @@ class Sphere(Shape):
         return p
 
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
-        origin[3] = 0.0
-
-        a: float = direction.dot(direction)
-        b: float = 2.0 * direction.dot(origin)
-        c: float = origin.dot(origin) - 1
-        dc = b * b - 4.0 * a * c
+        ts = sphere_intersect(origin, direction)
 
-        if dc < 0:
+        if len(ts) == 0:
             return ()
 
-        dcsq = sqrt(dc)
-        a12 = 1.0 / (2.0 * a)
-
-        r1 = (-b - dcsq) * a12
-        r2 = (-b + dcsq) * a12
+        return Intersection(ts[0], self), Intersection(ts[1], self)
 
-        return Intersection(r1, self), Intersection(r2, self)
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        ts = sphere_intersect(origin, direction)
+        if len(ts) != 0:
+            buffer.append(ts[0], self)
+            buffer.append(ts[1], self)
 
 
 class Plane(Shape):
@@ -169,6 +377,11 @@ class Plane(Shape):
         t = -origin[1] / direction[1]
         return [Intersection(t, self)]
 
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        if abs(direction[1]) >= EPSILON:
+            buffer.append(-origin[1] / direction[1], self)
+
 
 def glass_sphere() -> Sphere:
     s = Sphere()
@@ -199,6 +412,14 @@ class Cube(Shape):
             return ()
         return [Intersection(it[0], self), Intersection(it[1], self)]
 
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        it = aabb_box_intersect(
+            BOX_UNITARY_MIN_BOUND, BOX_UNITARY_MAX_BOUND, origin, direction, EPSILON)
+        if it is not None:
+            buffer.append(it[0], self)
+            buffer.append(it[1], self)
+
 
 class Cylinder(Shape):
     __slots__ = ("minimum", "maximum", "closed")
@@ -223,89 +444,14 @@ class Cylinder(Shape):
         return rv
 
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
-        a = direction[0] * direction[0] + direction[2] * direction[2]
-
-        if a < EPSILON:
-            if not self.closed:
-                return ()
-            # here we have a perpendicular ray to the caps
-            # test if the ray hit one of the caps and if so the the second
-            # cap is hit too
-            xs: List[Intersection] = []
-            o1 = origin[1]
-            d1 = direction[1]
-            d1i = 1 / d1
-            t = (self.minimum - o1) * d1i
-            x = origin[0] + t * direction[0]
-            z = origin[2] + t * direction[2]
-            if x * x + z * z <= 1.0:
-                xs.append(Intersection(t, self))
-            else:
-                return ()
-
-            t = (self.maximum - o1) * d1i
-            x = origin[0] + t * direction[0]
-            z = origin[2] + t * direction[2]
-            xs.append(Intersection(t, self))
-
-            return xs
-
-        b = 2 * (origin[0] * direction[0] + origin[2] * direction[2])
-        c = origin[0] * origin[0] + origin[2] * origin[2] - 1
-
-        disc = b * b - 4 * a * c
-
-        if disc < 0:
-            return ()
-
-        sqdc = sqrt(disc)
-        a21 = 1 / (2 * a)
-        t0 = (-b - sqdc) * a21
-        t1 = (-b + sqdc) * a21
-
-        if t0 > t1:
-            t0, t1 = t1, t0
-
-        xs: List[Intersection] = []
-
-        o1 = origin[1]
-        d1 = direction[1]
-        y = o1 + t0 * d1
-        if self.minimum < y < self.maximum:
-            xs.append(Intersection(t0, self))
-        y = o1 + t1 * d1
-        if self.minimum < y < self.maximum:
-            xs.append(Intersection(t1, self))
-
-        # since cylinder is cuadric surfece can only by intrecepted at maximun of two
-        # point at same time
-
-        if not self.closed or len(xs) == 2 or abs(d1) < EPSILON:
-            if len(xs) == 2 and xs[0].t > xs[1].t:
-                return [xs[1], xs[0]]
-
-            return xs
+        return [Intersection(t, self) for t in cylinder_intersect(
+            origin, direction, self.minimum, self.maximum, self.closed, EPSILON)]
 
-        d1i = 1 / d1
-        t = (self.minimum - o1) * d1i
-        x = origin[0] + t * direction[0]
-        z = origin[2] + t * direction[2]
-        if x * x + z * z <= 1:
-            xs.append(Intersection(t, self))
-
-        if len(xs) == 2:
-            return [xs[1], xs[0]]
-
-        t = (self.maximum - o1) * d1i
-        x = origin[0] + t * direction[0]
-        z = origin[2] + t * direction[2]
-        if x * x + z * z <= 1:
-            xs.append(Intersection(t, self))
-
-        if len(xs) == 2 and xs[0].t > xs[1].t:
-            return [xs[1], xs[0]]
-
-        return xs
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        for t in cylinder_intersect(origin, direction, self.minimum, self.maximum,
+                                    self.closed, EPSILON):
+            buffer.append(t, self)
 
 
 class Cone(Shape):
@@ -334,82 +480,14 @@ class Cone(Shape):
         return vector(p[0], sqrt(d), p[2])
 
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
-        dy = direction[1]
-        oy = origin[1]
-        a = direction[0] * direction[0] + direction[2] * direction[2] - dy * dy
-        b = 2 * (origin[0] * direction[0] + origin[2] * direction[2] - oy * dy)
-        c = origin[0] * origin[0] + origin[2] * origin[2] - oy * oy
-
-        if abs(a) < EPSILON:
-            t1 = -c / (2 * b)
-
-            if abs(b) < EPSILON:
-                return ()
-
-            if not self.closed:
-                return [Intersection(t1, self)]
-
-            dyi = 1 / dy
-            t = (self.minimum - oy) * dyi
-            x = origin[0] + t * direction[0]
-            z = origin[2] + t * direction[2]
-            if x * x + z * z <= self.minimum2:
-                if t < t1:
-                    return [Intersection(t, self), Intersection(t1, self)]
-                return [Intersection(t1, self), Intersection(t, self)]
-
-            t = (self.maximum - oy) * dyi
-            x = origin[0] + t * direction[0]
-            z = origin[2] + t * direction[2]
-            if x * x + z * z <= self.maximum2:
-                if t < t1:
-                    return [Intersection(t, self), Intersection(t1, self)]
-                return [Intersection(t1, self), Intersection(t, self)]
-
-            return ()
-
-        disc = b * b - 4 * a * c
-
-        if disc < 0:
-            return ()
-
-        sqdc = sqrt(disc)
-        a21 = 1 / (2 * a)
-        t0 = (-b - sqdc) * a21
-        t1 = (-b + sqdc) * a21
-
-        xs: List[Intersection] = []
-
-        o1 = origin[1]
-        d1 = direction[1]
-        y = o1 + t0 * d1
-        if self.minimum < y < self.maximum:
-            xs.append(Intersection(t0, self))
-        y = o1 + t1 * d1
-        if self.minimum < y < self.maximum:
-            xs.append(Intersection(t1, self))
-
-        if not self.closed:
-            return xs
+        return [Intersection(t, self) for t in cone_intersect(
+            origin, direction, self.minimum, self.maximum, self.closed, EPSILON)]
 
-        dyi = 1 / dy
-        t = (self.minimum - oy) * dyi
-        x = origin[0] + t * direction[0]
-        z = origin[2] + t * direction[2]
-        if x * x + z * z <= self.minimum2:
-            xs.append(Intersection(t, self))
-
-        t = (self.maximum - oy) * dyi
-        x = origin[0] + t * direction[0]
-        z = origin[2] + t * direction[2]
-        if x * x + z * z <= self.maximum2:
-            xs.append(Intersection(t, self))
-
-        if len(xs) < 2:
-            return xs
-
-        xs.sort()
-        return xs
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        for t in cone_intersect(origin, direction, self.minimum, self.maximum,
+                                self.closed, EPSILON):
+            buffer.append(t, self)
 
 
 class Group(Shape):
@@ -448,6 +526,12 @@ class Group(Shape):
 
         return xs
 
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        for shape in self.shapes:
+            iv = shape.inv_transform
+            shape.intersect_into(iv.dot(origin), iv.dot(direction), buffer)
+
     def __contains__(self, x: WorldObject) -> bool:
 
         # traverse the hierarchy up to reach the current object or reach root object
@@ -489,6 +573,11 @@ class BoundingBox(Shape):
             return ()
         return self.shape.intersect(origin, direction)
 
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        if aabb_box_intersect(self.bound_min, self.bound_max, origin, direction, EPSILON) is not None:
+            self.shape.intersect_into(origin, direction, buffer)
+
     def __contains__(self, x: WorldObject) -> bool:
         # traverse the hierarchy up to reach the current object of reach root object
 
@@ -598,6 +687,21 @@ def make_box(shape: WorldObject) -> BoundingBox:
     if isinstance(shape, BoundingBox):
         return shape
 
+    if isinstance(shape, Instance):
+        # the box of the geometry in the space of the instance
+        geometry = shape.geometry
+        b = make_box(geometry)
+        corners = np.array([(x, y, z, 1.0) for x in (b.bound_min[0], b.bound_max[0])
+                            for y in (b.bound_min[1], b.bound_max[1])
+                            for z in (b.bound_min[2], b.bound_max[2])])
+        with np.errstate(invalid='ignore'):
+            corners = corners.dot(geometry.transform.T)
+        if not np.isfinite(corners).all():
+            corners = np.array(((-np.inf,) * 3 + (1,), (np.inf,) * 3 + (1,)))
+        pmin = point(*corners[:, :3].min(axis=0))
+        pmax = point(*corners[:, :3].max(axis=0))
+        return BoundingBox(pmin, pmax, shape)
+
 
 class Triangle(Shape):
     __slots__ = ("p1", "p2", "p3", "e1", "e2", "normal")
@@ -617,12 +721,24 @@ class Triangle(Shape):
         return self.normal
 
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
+        t = self._hit(origin, direction)
+        if t is None:
+            return ()
+        return [Intersection(t, self)]
+
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        t = self._hit(origin, direction)
+        if t is not None:
+            buffer.append(t, self)
+
+    def _hit(self, origin: np.ndarray, direction: np.ndarray) -> Optional[float]:
         direction = direction[:3]
         dir_cross_e2: np.ndarray = np.cross(direction, self.e2[:3])
         det: float = self.e1[:3].dot(dir_cross_e2)
 
         if abs(det) < EPSILON:
-            return ()
+            return None
 
         f: float = 1.0 / det
         p1_to_origin: np.ndarray = origin - self.p1
@@ -630,19 +746,16 @@ class Triangle(Shape):
         u: float = f * p1_to_origin.dot(dir_cross_e2)
 
         if u < 0 or u > 1:
-            return ()
+            return None
 
         origin_cross_e1: np.ndarray = np.cross(p1_to_origin, self.e1[:3])
         v: float = f * direction.dot(origin_cross_e1)
         if v < 0 or (u + v) > 1:
-            return ()
+            return None
 
-        t: float = f * self.e2[:3].dot(origin_cross_e1)
-
-        return [Intersection(t, self)]
+        return f * self.e2[:3].dot(origin_cross_e1)
 
 
-# TODO: Implement textures
 class TriangleMesh(Shape):
     __slots__ = ("vertices", "faces_groups", "normals",
                  "normals_groups", "textures", "texture_groups",
@@ -677,8 +790,56 @@ class TriangleMesh(Shape):
     def normal_at(self, p: np.ndarray, it: Optional[Intersection]) -> np.ndarray:
         raise NotImplementedError
 
+    def uv_at(self, face: int, u: float, v: float) -> Optional[np.ndarray]:
+        # texture coordinate of the barycentric point (u, v) of a face
+        if self.texture_groups is None:
+            return None
+        tt = self.texture_groups[face]
+        if tt[0] < 0:
+            return None
+        textures = self.textures
+        return (1 - u - v) * textures[tt[0]] + u * textures[tt[1]] + v * textures[tt[2]]
+
+    def uv_scale(self, face: int) -> float:
+        # texture units per world unit on a face, from the areas of the face
+        # in uv and in world space
+        tt = self.texture_groups[face]
+        textures = self.textures
+        d1 = textures[tt[1]] - textures[tt[0]]
+        d2 = textures[tt[2]] - textures[tt[0]]
+        uv_area = abs(d1[0] * d2[1] - d1[1] * d2[0])
+        c = np.cross(self.e1[face], self.e2[face])
+        area = sqrt(c.dot(c))
+        if area == 0:
+            return 0.0
+        return sqrt(uv_area / area) * transform_scale(self.inv_transform)
+
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
-        xs: Sequence[Intersection] = []
+        xs: List[Intersection] = [Intersection(t, self._face(n, u, v), u, v)
+                                  for n, t, u, v in self._hits(origin, direction)]
+        if len(xs) < 2:
+            return xs
+
+        xs.sort()
+        return xs
+
+    def intersect_into(self, origin: np.ndarray, direction: np.ndarray,
+                       buffer: IntersectionBuffer) -> None:
+        for n, t, u, v in self._hits(origin, direction):
+            buffer.append(t, self._face(n, u, v), u, v)
+
+    def _face(self, n: int, u: float, v: float) -> SmoothTriangle:
+        # the object of a hit of face n at the barycentric point (u, v)
+        nn = self.normals_groups[n]
+        uv = self.uv_at(n, u, v)
+        return SmoothTriangle(
+            self.normals[nn[0]], self.normals[nn[1]], self.normals[nn[2]], self.material,
+            uv=uv, has_shadow=self.has_shadow,
+            uv_scale=0.0 if uv is None else self.uv_scale(n), mesh=self)
+
+    def _hits(self, origin: np.ndarray, direction: np.ndarray) -> List[Tuple[int, float, float, float]]:
+        # face, t, u and v of every face the ray crosses
+        hits: List[Tuple[int, float, float, float]] = []
 
         direction = direction[:3]
         e1a = self.e1
@@ -713,39 +874,117 @@ class TriangleMesh(Shape):
                 continue
 
             t: float = f * e2.dot(origin_cross_e1)
-            nn = self.normals_groups[n]
-            it = Intersection(t, SmoothTriangle(
-                self.normals[nn[0]], self.normals[nn[1]], self.normals[nn[2]], self.material,), u, v)
+            hits.append((n, t, u, v))
 
-            xs.append(it)
-
-        if len(xs) < 2:
-            return xs
-
-        xs.sort()
-        return xs
+        return hits
 
 
 class SmoothTriangle(Shape):
     """This class is only for intersections with TriangleMesh"""
-    __slots__ = ("n1", "n2", "n3")
+    __slots__ = ("n1", "n2", "n3", "uv", "uv_scale", "mesh")
 
     def __init__(self, n1: np.ndarray, n2: np.ndarray, n3: np.ndarray,
-                 material: Material, shapeId: Optional[str] = None):
+                 material: Material, shapeId: Optional[str] = None, uv: Optional[np.ndarray] = None,
+                 has_shadow: bool = True, uv_scale: float = 0.0, mesh: Optional[TriangleMesh] = None):
         # super().__init__(shapeId=shapeId)
         self.n1 = n1
         self.n2 = n2
         self.n3 = n3
+        # texture coordinate of the hit, None when the mesh has no uvs, and
+        # texture units per world unit around it
+        self.uv = uv
+        self.uv_scale = uv_scale
+        # the mesh the face belongs to, faces are built per hit and have
+        # no id of their own
+        self.mesh = mesh
         self.transform = IDENTITY
         self.inv_transform = IDENTITY
         self.parent = None
         self.material = material
         self.id = shapeId
+        # the mesh decides whether its triangles cast shadows
+        self.has_shadow = has_shadow
 
     def normal_at(self, p: np.ndarray, it: Intersection) -> np.ndarray:
         c = 1 - it.u - it.v
         return it.u * self.n1 + it.v * self.n2 + c * self.n3
 
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        pattern = self.material.pattern
+        if self.uv is not None and isinstance(pattern, ImagePattern):
+            return pattern.uv_color_at(self.uv[0], self.uv[1], footprint * self.uv_scale)
+        return self.material.color_at(point, footprint)
+
+    def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
+        raise NotImplementedError
+
+
+class Instance(Shape):
+    # places shared geometry with its own transform and material, the
+    # geometry and the boxes inside it are never copied so memory grows with
+    # the unique geometry only. With a material of None the geometry keeps
+    # its own materials. make_box sees an instance as a single box
+    __slots__ = ("geometry",)
+
+    def __init__(self, geometry: WorldObject, transform: Optional[np.ndarray] = None,
+                 material: Optional[Material] = None, shapeId: Optional[str] = None):
+        super().__init__(shapeId=shapeId)
+        self.geometry: WorldObject = geometry
+        self.material: Optional[Material] = material
+        if transform is not None:
+            self.set_transform(transform)
+
+    def normal_at(self, p: np.ndarray, it: Optional[Intersection] = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
+        geometry = self.geometry
+        iv = geometry.inv_transform
+        xs = geometry.intersect(iv.dot(origin), iv.dot(direction))
+        return [Intersection(it.t, InstanceHit(self, it), it.u, it.v) for it in xs]
+
+    def __contains__(self, x: WorldObject) -> bool:
+        return x.id == self.id or (isinstance(x, InstanceHit) and x.instance is self)
+
+
+class InstanceHit(Shape):
+    """This class is only for intersections with Instance"""
+    __slots__ = ("instance", "hit")
+
+    def __init__(self, instance: Instance, hit: Intersection):
+        # hit is the intersection with the shared geometry, in the space of
+        # the instance
+        target = hit.object
+        self.instance = instance
+        self.hit = hit
+        self.transform = IDENTITY
+        self.inv_transform = IDENTITY
+        self.parent = instance
+        self.material = target.material if instance.material is None else instance.material
+        self.id = f'{instance.id}:{target.id}'
+        self.has_shadow = instance.has_shadow and target.has_shadow
+
+    def normal_at(self, p: np.ndarray, it: Optional[Intersection] = None) -> np.ndarray:
+        # the geometry hierarchy ends at the instance, its normal is in the
+        # space of the instance
+        return normal_at(self.hit.object, p, self.hit)
+
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        p = world_to_object(self.instance, point)
+        if footprint > 0:
+            footprint *= transform_scale(self.instance.inv_transform)
+        target = self.hit.object
+        material = self.instance.material
+        if material is None:
+            return target.color_at(p, footprint)
+        uv = getattr(target, 'uv', None)
+        if uv is not None and isinstance(material.pattern, ImagePattern):
+            return material.pattern.uv_color_at(uv[0], uv[1], footprint * target.uv_scale)
+        return material.color_at(p, footprint)
+
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
+        return np.array([self.color_at(p) for p in points], dtype=np.float64).reshape(-1, 3)
+
     def intersect(self, origin: np.ndarray, direction: np.ndarray) -> Sequence[Intersection]:
         raise NotImplementedError
 
@@ -776,8 +1015,6 @@ class CSG(Shape):
         if len(xs) >= 2:
             xs.sort()
 
-        print(xs)
-
         inl = False
         inr = False
         res = []
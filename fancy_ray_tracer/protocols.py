@@ -29,7 +29,10 @@ class Transformable(Protocol):
 
 
 class ColorAtPoint(Protocol):
-    def color_at(self, point: np.ndarray) -> np.ndarray:
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        raise NotImplementedError
+
+    def colors_at(self, points: np.ndarray) -> np.ndarray:
         raise NotImplementedError
 
 
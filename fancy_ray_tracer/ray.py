@@ -2,16 +2,19 @@ from __future__ import annotations
 
 from bisect import bisect_left
 from functools import total_ordering
-from math import sqrt
-from typing import List, Optional, Sequence
+from math import nan, sqrt
+from typing import Dict, Iterator, List, Optional, Sequence
 
 import numpy as np
 
-from .constants import EPSILON
+from .constants import EPSILON, GRAZING_COS
 from .protocols import WorldObject
 # from .tuples import normalize, point
 from .utils import equal
 
+_EMPTY_T = np.empty(0, dtype=np.float64)
+_EMPTY_INDEX = np.empty(0, dtype=np.int32)
+
 
 @total_ordering
 class Intersection:
@@ -33,12 +36,125 @@ class Intersection:
         return f"<Intersection t={self.t} obj=<{str(self.object.__class__.__name__)} {self.object.id}>>"
 
 
+class IntersectionBuffer:
+    # structure of arrays for the candidate hits of a ray. The hits are
+    # collected in python lists, one append each, and sort() turns them into
+    # the parallel arrays t, index, u and v with one argsort instead of
+    # python comparisons. index points into objects. Items are Intersection
+    # views built on access and reused until the buffer changes
+    __slots__ = ("t", "index", "u", "v", "objects",
+                 "_t", "_index", "_u", "_v", "_object_index", "_views")
+
+    def __init__(self, capacity: int = 16) -> None:
+        # capacity is kept for the callers, the lists grow as needed
+        self.t: np.ndarray = _EMPTY_T
+        self.index: np.ndarray = _EMPTY_INDEX
+        # nan stands for an intersection without uv
+        self.u: np.ndarray = _EMPTY_T
+        self.v: np.ndarray = _EMPTY_T
+        self.objects: List[WorldObject] = []
+        self._t: List[float] = []
+        self._index: List[int] = []
+        self._u: List[float] = []
+        self._v: List[float] = []
+        self._object_index: Dict[int, int] = {}
+        self._views: List[Optional[Intersection]] = []
+
+    def __len__(self) -> int:
+        return len(self._t)
+
+    def __getitem__(self, i: int) -> Intersection:
+        n = len(self._t)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("intersection index out of range")
+        view = self._views[i]
+        if view is None:
+            u = self._u[i]
+            v = self._v[i]
+            view = Intersection(self._t[i], self.objects[self._index[i]],
+                                None if u != u else u, None if v != v else v)
+            self._views[i] = view
+        return view
+
+    def __iter__(self) -> Iterator[Intersection]:
+        for i in range(len(self._t)):
+            yield self[i]
+
+    def clear(self) -> None:
+        self.t = self.u = self.v = _EMPTY_T
+        self.index = _EMPTY_INDEX
+        self._t.clear()
+        self._index.clear()
+        self._u.clear()
+        self._v.clear()
+        self.objects.clear()
+        self._object_index.clear()
+        self._views.clear()
+
+    def _object(self, obj: WorldObject) -> int:
+        key = id(obj)
+        n = self._object_index.get(key)
+        if n is None:
+            n = len(self.objects)
+            self._object_index[key] = n
+            self.objects.append(obj)
+        return n
+
+    def append(self, t: float, obj: WorldObject, u: Optional[float] = None,
+               v: Optional[float] = None) -> None:
+        self._t.append(t)
+        self._index.append(self._object(obj))
+        self._u.append(nan if u is None else u)
+        self._v.append(nan if v is None else v)
+        self._views.append(None)
+
+    def extend(self, intersections: Sequence[Intersection]) -> None:
+        i: Intersection
+        for i in intersections:
+            self._t.append(i.t)
+            self._index.append(self._object(i.object))
+            self._u.append(nan if i.u is None else i.u)
+            self._v.append(nan if i.v is None else i.v)
+        # the given intersections are the views, so identity checks against
+        # them keep working
+        self._views.extend(intersections)
+
+    def sort(self) -> None:
+        t = np.array(self._t, dtype=np.float64)
+        order = np.argsort(t, kind='stable')
+        self.t = t[order]
+        self.index = np.array(self._index, dtype=np.int32)[order]
+        self.u = np.array(self._u, dtype=np.float64)[order]
+        self.v = np.array(self._v, dtype=np.float64)[order]
+        self._t[:] = self.t.tolist()
+        self._index[:] = self.index.tolist()
+        self._u[:] = self.u.tolist()
+        self._v[:] = self.v.tolist()
+        views = self._views
+        self._views[:] = [views[k] for k in order.tolist()]
+
+    def hit(self) -> Optional[Intersection]:
+        # first non negative t of a sorted buffer
+        i = bisect_left(self._t, 0.0)
+        if i >= len(self._t):
+            return None
+        return self[i]
+
+
 class Ray:
-    __slots__ = ("origin", "direction")
+    # width and spread describe the cone of the ray, its width at the origin
+    # and how much it grows per unit of distance, both 0 for a thin ray.
+    # They only decide the mip level of the image textures
+    __slots__ = ("origin", "direction", "width", "spread")
 
-    def __init__(self, origin: np.ndarray, direction: np.ndarray):
+    def __init__(self, origin: np.ndarray, direction: np.ndarray,
+                 width: float = 0.0, spread: float = 0.0):
         self.origin: np.ndarray = origin
         self.direction: np.ndarray = direction
+        self.width: float = width
+        self.spread: float = spread
 
     def position(self, t: float) -> np.ndarray:
         return self.origin + self.direction * t
@@ -49,7 +165,7 @@ class Ray:
     def transform(self, matrix: np.ndarray) -> Ray:
         orig: np.ndarray = matrix.dot(self.origin)
         direct: np.ndarray = matrix.dot(self.direction)
-        return Ray(orig, direct)
+        return Ray(orig, direct, self.width, self.spread)
 
     def intersect(self, s: WorldObject) -> Sequence[Intersection]:
         # tranform the ray, equivalent to self.transform
@@ -58,11 +174,16 @@ class Ray:
         direction: np.ndarray = invt.dot(self.direction)
         return s.intersect(origin, direction)
 
+    def intersect_into(self, s: WorldObject, buffer: IntersectionBuffer) -> None:
+        invt = s.inv_transform
+        s.intersect_into(invt.dot(self.origin), invt.dot(self.direction), buffer)
+
 
 class Computations:
     __slots__ = ("t", "object", "point", "eyev",
                  "normalv", "inside", "over_point", "reflectv",
-                 "n1", "n2", "under_point")
+                 "n1", "n2", "under_point",
+                 "width", "spread", "footprint")
 
     def __init__(self, intersection: Intersection, ray: Ray, xs: Sequence[Intersection] = ()) -> None:
         self.t: float = intersection.t
@@ -79,34 +200,45 @@ class Computations:
         self.under_point: np.ndarray = self.point - self.normalv * EPSILON
         self.reflectv = ray.direction - \
             (2 * ray.direction.dot(self.normalv)) * self.normalv
+        # the ray cone at the hit, the footprint on the surface is
+        # stretched at grazing angles
+        self.width: float = ray.width + ray.spread * self.t
+        self.spread: float = ray.spread
+        self.footprint: float = self.width / max(abs(self.normalv.dot(self.eyev)), GRAZING_COS)
 
         n1 = 1.0
         n2 = 1.0
-        containers: List[WorldObject] = []
+        # the refractive indices are only read for transparent materials
         i: Intersection
-        isHit: bool = False
-        obj: WorldObject = None
-        for i in xs:
-            isHit = i == intersection
-
-            if isHit:
-                if len(containers) == 0:
-                    n1 = 1.0
+        # a buffer knows its objects without building the intersections
+        objects = xs.objects if isinstance(xs, IntersectionBuffer) else (i.object for i in xs)
+        if any(obj.material.transparency > EPSILON for obj in objects):
+            # insertion ordered dict keyed by object id, works as a stack
+            # that also supports removing from the middle in O(1)
+            containers: Dict[str, WorldObject] = {}
+            hit_id: str = self.object.id
+            t: float = self.t
+            isHit: bool = False
+            obj: WorldObject = None
+            for i in xs:
+                obj = i.object
+                isHit = i is intersection or (
+                    obj.id == hit_id and abs(i.t - t) < EPSILON)
+
+                if isHit and len(containers) != 0:
+                    n1 = next(reversed(containers.values())
+                              ).material.refractive_index
+
+                if obj.id in containers:
+                    del containers[obj.id]
                 else:
-                    n1 = containers[-1].material.refractive_index
-
-            obj = i.object
-            if obj in containers:
-                containers.remove(obj)
-            else:
-                containers.append(obj)
+                    containers[obj.id] = obj
 
-            if isHit:
-                if len(containers) == 0:
-                    n2 = 1.0
-                else:
-                    n2 = containers[-1].material.refractive_index
-                break
+                if isHit:
+                    if len(containers) != 0:
+                        n2 = next(reversed(containers.values())
+                                  ).material.refractive_index
+                    break
 
         self.n1 = n1
         self.n2 = n2
@@ -131,6 +263,9 @@ def hit_sorted(intersections: Sequence[Intersection]) -> Optional[Intersection]:
     if intersections is None or len(intersections) == 0:
         return None
 
+    if isinstance(intersections, IntersectionBuffer):
+        return intersections.hit()
+
     temp = Intersection(0, None)
 
     index = bisect_left(intersections, temp)
@@ -155,7 +290,7 @@ def normal_at(obj: WorldObject, p: np.ndarray, it: Optional[Intersection] = None
         return world_normal
 
     object_point = world_to_object(obj, p)
-    object_normal: np.ndarray = obj.normal_at(object_point)
+    object_normal: np.ndarray = obj.normal_at(object_point, it)
     world_normal = normal_to_world(obj, object_normal)
     return world_normal
 
@@ -0,0 +1,110 @@
+from math import floor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .camera import Camera
+from .constants import REPROJECTION_TOLERANCE, REPROJECTION_VIEW_DEPENDENT
+from .materials import Material
+from .primitives import InstanceHit, SmoothTriangle
+from .protocols import WorldObject
+from .ray import Computations, hit_sorted
+from .world import World
+
+# Temporal reprojection for walkthroughs where only the camera moves. Every
+# pixel keeps the point its colour was shaded at and the object hit there.
+# The next frame still intersects its primary rays, then looks the hit up
+# in the last frame through the last camera: the same object within half
+# a pixel footprint of the same point gives the colour back without shading,
+# which is the lighting, shadow and secondary rays. Disoccluded pixels and
+# view dependent materials are shaded again. Reused samples keep the point
+# they were shaded at, so the error can't build up frame after frame
+#
+#   history = None
+#   for transform in path:
+#       camera.set_transform(transform)
+#       history = render_reprojected(world, camera, history)
+#       frames.append(history.colors)
+
+
+def view_dependent(material: Material, limit: float = REPROJECTION_VIEW_DEPENDENT) -> bool:
+    return material.reflective > limit or material.transparency > limit or material.specular > limit
+
+
+def _object_key(obj: WorldObject) -> str:
+    # the faces of a mesh are built per hit, the mesh is the object
+    if isinstance(obj, SmoothTriangle) and obj.mesh is not None:
+        return obj.mesh.id
+    if isinstance(obj, InstanceHit):
+        return f'{obj.instance.id}:{_object_key(obj.hit.object)}'
+    return obj.id
+
+
+class FrameHistory:
+    # per pixel buffers of a frame, objects holds -1 where nothing was hit
+    __slots__ = ("transform", "hsize", "vsize", "positions", "objects", "colors",
+                 "object_ids", "shaded")
+
+    def __init__(self, camera: Camera, object_ids: Optional[Dict[str, int]] = None) -> None:
+        self.transform: np.ndarray = np.array(camera.transform, dtype=np.float64)
+        self.hsize: int = camera.hsize
+        self.vsize: int = camera.vsize
+        self.positions: np.ndarray = np.zeros((camera.vsize, camera.hsize, 3), dtype=np.float64)
+        self.objects: np.ndarray = np.full((camera.vsize, camera.hsize), -1, dtype=np.int64)
+        self.colors: np.ndarray = np.zeros((camera.vsize, camera.hsize, 3), dtype=np.float64)
+        # the numbers of the objects, shared by the frames of a sequence
+        self.object_ids: Dict[str, int] = {} if object_ids is None else object_ids
+        # pixels shaded by this frame, the others were reused
+        self.shaded: int = 0
+
+    def lookup(self, camera: Camera, p: np.ndarray) -> Optional[Tuple[int, int]]:
+        # pixel of the point p in this frame, None when it is behind the
+        # camera or out of the image
+        x, y, z = self.transform[:3, :3].dot(p) + self.transform[:3, 3]
+        if z >= 0:
+            return None
+        px = floor((camera.half_width + x / z) / camera.pixel_size)
+        py = floor((camera.half_height + y / z) / camera.pixel_size)
+        if 0 <= px < self.hsize and 0 <= py < self.vsize:
+            return px, py
+        return None
+
+
+def render_reprojected(world: World, camera: Camera, history: Optional[FrameHistory] = None,
+                       ray_budget: Optional[int] = None,
+                       tolerance: float = REPROJECTION_TOLERANCE) -> FrameHistory:
+    # renders the frame of camera, reusing what it can of history, the
+    # frame before with the same world. Its colors are the image
+    if history is not None and (history.hsize, history.vsize) != (camera.hsize, camera.vsize):
+        history = None
+    frame = FrameHistory(camera, None if history is None else history.object_ids)
+    object_ids = frame.object_ids
+    footprint = tolerance * camera.pixel_size
+    for y in range(camera.vsize):
+        for x in range(camera.hsize):
+            ray = camera.ray_for_pixel(x, y)
+            xs = world.intersec(ray)
+            it = hit_sorted(xs)
+            if it is None:
+                continue
+            obj = it.object
+            number = object_ids.setdefault(_object_key(obj), len(object_ids))
+            frame.objects[y, x] = number
+            p = (ray.origin + ray.direction * it.t)[:3]
+
+            if history is not None and not view_dependent(obj.material):
+                pixel = history.lookup(camera, p)
+                if pixel is not None:
+                    px, py = pixel
+                    q = history.positions[py, px]
+                    d = p - q
+                    # within the footprint of a pixel at the distance of the hit
+                    if history.objects[py, px] == number and d.dot(d) <= (footprint * it.t) ** 2:
+                        frame.positions[y, x] = q
+                        frame.colors[y, x] = history.colors[py, px]
+                        continue
+
+            frame.positions[y, x] = p
+            frame.colors[y, x] = world.shade_primary(Computations(it, ray, xs), ray_budget)[:3]
+            frame.shaded += 1
+    return frame
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import lz4.frame
+import numpy as np
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+from . import __version__
+from .camera import Camera
+from .constants import PI, CSGOperation
+from .illumination import Light, RectangleLight, SphereLight
+from .materials import (
+    ChessPattern,
+    DefaultPattern,
+    LinearGradient,
+    Material,
+    RingPatter,
+    StripePattern,
+    make_material,
+)
+from .matrices import rotX, rotY, rotZ, scaling, sharing, translation, view_transform
+from .parsers import WavefrontOBJ
+from .primitives import (
+    Cone,
+    Cube,
+    Cylinder,
+    Group,
+    Instance,
+    Plane,
+    Sphere,
+    Triangle,
+    make_box,
+    make_csg,
+)
+from .protocols import WorldObject
+from .textures import ImagePattern, cylindrical_map, planar_map, spherical_map
+from .tuples import make_color, point, vector
+from .utils import cache_directory, chain_ops
+from .world import World
+
+# Scenes as JSON or YAML files (YAML needs pyyaml):
+#
+#   camera: {width: 320, height: 200, field_of_view: 1.047,
+#            from: [0, 1.5, -5], to: [0, 1, 0], up: [0, 1, 0]}
+#   lights:
+#     - {type: point, position: [-10, 10, -10], intensity: [1, 1, 1]}
+#   materials:
+#     red: {color: [1, 0, 0], specular: 0.3}
+#   objects:
+#     - type: sphere
+#       material: red
+#       transform: [[translate, 0, 1, 0], [scale, 0.5, 0.5, 0.5]]
+#     - {type: mesh, path: teapot.obj, bounded: true}
+#     - {type: instance, of: teapot, transform: [[translate, 2, 0, 0]]}
+#   geometry:
+#     teapot: {type: mesh, path: teapot.obj, bounded: true}
+#
+# Transforms are listed like chain_ops takes them, the last one is applied
+# first. Paths are relative to the scene file. load_scene keeps the built
+# world, with its compiled snapshot when the scene has one, in a cache
+# keyed on the file and every file it refers to
+
+SCENE_FORMAT = 1
+
+TRANSFORMS: Dict[str, Callable[..., np.ndarray]] = {
+    'translate': translation,
+    'scale': scaling,
+    'rotate-x': rotX,
+    'rotate-y': rotY,
+    'rotate-z': rotZ,
+    'shear': sharing,
+}
+PATTERNS = {
+    'stripe': StripePattern,
+    'gradient': LinearGradient,
+    'ring': RingPatter,
+    'chess': ChessPattern,
+}
+UV_MAPPINGS = {
+    'spherical': spherical_map,
+    'planar': planar_map,
+    'cylindrical': cylindrical_map,
+}
+MATERIAL_FIELDS = ('ambient', 'diffuse', 'specular', 'shininess',
+                   'reflective', 'transparency', 'refractive_index')
+
+Scene = Tuple[World, Camera]
+
+
+def _transform(ops: List[List[Any]]) -> np.ndarray:
+    matrices = []
+    for op in ops:
+        name, *args = op
+        if name == 'matrix':
+            matrices.append(np.array(args[0], dtype=np.float64).reshape(4, 4))
+            continue
+        if name not in TRANSFORMS:
+            raise ValueError(f"unknown transform {name}")
+        matrices.append(TRANSFORMS[name](*args))
+    return chain_ops(matrices)
+
+
+def _color(value: List[float]) -> np.ndarray:
+    return make_color(*value)
+
+
+class SceneBuilder:
+    # builds the objects of a parsed scene description, base is the
+    # directory the paths are relative to
+    __slots__ = ("base", "materials", "geometry")
+
+    def __init__(self, base: str = '.') -> None:
+        self.base: str = base
+        self.materials: Dict[str, Dict] = {}
+        # shapes built once and shared by the instances
+        self.geometry: Dict[str, WorldObject] = {}
+
+    def path(self, path: str) -> str:
+        return os.path.normpath(os.path.join(self.base, path))
+
+    def build(self, data: Dict) -> Scene:
+        self.materials = dict(data.get('materials', {}))
+        self.geometry = {name: self.shape(shape) for name, shape in data.get('geometry', {}).items()}
+        lights = [self.light(light) for light in data.get('lights', [])]
+        world = World(lights, [self.shape(obj) for obj in data.get('objects', [])])
+        return world, self.camera(data.get('camera', {}))
+
+    def camera(self, data: Dict) -> Camera:
+        c = Camera(data.get('width', 320), data.get('height', 200),
+                   data.get('field_of_view', PI / 3))
+        if 'transform' in data:
+            c.set_transform(_transform(data['transform']))
+        elif 'from' in data:
+            c.set_transform(view_transform(point(*data['from']), point(*data.get('to', (0, 0, 0))),
+                                           vector(*data.get('up', (0, 1, 0)))))
+        return c
+
+    def light(self, data: Dict) -> Light:
+        kind = data.get('type', 'point')
+        intensity = _color(data.get('intensity', (1, 1, 1)))
+        sampling = {key: data[key] for key in ('samples', 'probes', 'pattern', 'decorrelate') if key in data}
+        if kind == 'point':
+            return Light(point(*data['position']), intensity)
+        if kind == 'rectangle':
+            return RectangleLight(point(*data['corner']), vector(*data['uvec']),
+                                  vector(*data['vvec']), intensity, **sampling)
+        if kind == 'sphere':
+            return SphereLight(point(*data['center']), data['radius'], intensity, **sampling)
+        raise ValueError(f"unknown light {kind}")
+
+    def material(self, data: Union[str, Dict, None]) -> Material:
+        if isinstance(data, str):
+            if data not in self.materials:
+                raise ValueError(f"unknown material {data}")
+            data = self.materials[data]
+        m = make_material()
+        if data is None:
+            return m
+        if 'extends' in data:
+            m = self.material(data['extends'])
+        if 'color' in data:
+            m.color = _color(data['color'])
+        for field in MATERIAL_FIELDS:
+            if field in data:
+                setattr(m, field, float(data[field]))
+        if 'pattern' in data:
+            m.pattern = self.pattern(data['pattern'])
+        return m
+
+    def pattern(self, data: Dict) -> DefaultPattern:
+        kind = data['type']
+        if kind == 'image':
+            mapping = data.get('mapping', 'spherical')
+            if mapping not in UV_MAPPINGS:
+                raise ValueError(f"unknown uv mapping {mapping}")
+            p = ImagePattern(self.path(data['path']), UV_MAPPINGS[mapping])
+        elif kind in PATTERNS:
+            c1, c2 = data['colors']
+            p = PATTERNS[kind](_color(c1), _color(c2))
+        else:
+            raise ValueError(f"unknown pattern {kind}")
+        if 'transform' in data:
+            p.set_transform(_transform(data['transform']))
+        return p
+
+    def shape(self, data: Dict) -> WorldObject:
+        kind = data['type']
+        if kind == 'sphere':
+            s = Sphere()
+        elif kind == 'plane':
+            s = Plane()
+        elif kind == 'cube':
+            s = Cube()
+        elif kind == 'cylinder':
+            s = Cylinder(data.get('minimum', -np.inf), data.get('maximum', np.inf),
+                         closed=data.get('closed', False))
+        elif kind == 'cone':
+            s = Cone(data.get('minimum', -np.inf), data.get('maximum', np.inf),
+                     closed=data.get('closed', False))
+        elif kind == 'triangle':
+            s = Triangle(point(*data['p1']), point(*data['p2']), point(*data['p3']))
+        elif kind == 'group':
+            s = Group([self.shape(child) for child in data.get('children', [])])
+        elif kind == 'csg':
+            s = make_csg(CSGOperation[data['operation']],
+                         self.shape(data['left']), self.shape(data['right']))
+        elif kind == 'mesh':
+            with open(self.path(data['path'])) as f:
+                s = WavefrontOBJ(f).parse()
+        elif kind == 'instance':
+            if data['of'] not in self.geometry:
+                raise ValueError(f"unknown geometry {data['of']}")
+            s = Instance(self.geometry[data['of']])
+        else:
+            raise ValueError(f"unknown object {kind}")
+
+        if 'material' in data:
+            material = self.material(data['material'])
+            if kind == 'mesh':
+                # the shapes of the file share the material
+                _set_material(s, material)
+            else:
+                s.material = material
+        if 'shadow' in data:
+            s.has_shadow = bool(data['shadow'])
+        if 'transform' in data:
+            s.set_transform(_transform(data['transform']))
+        if data.get('bounded', False):
+            s = make_box(s)
+        return s
+
+
+def _set_material(shape: WorldObject, material: Material) -> None:
+    if isinstance(shape, Group):
+        for child in shape.shapes:
+            _set_material(child, material)
+    else:
+        shape.material = material
+
+
+def read_scene(path: Union[str, os.PathLike]) -> Dict:
+    path = os.fspath(path)
+    with open(path) as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError("YAML scenes need pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def build_scene(data: Dict, base: Union[str, os.PathLike] = '.') -> Scene:
+    return SceneBuilder(os.fspath(base)).build(data)
+
+
+def referenced_files(data: Any, base: str) -> List[str]:
+    # meshes and images the scene reads
+    files = []
+    if isinstance(data, dict):
+        if data.get('type') in ('mesh', 'image') and 'path' in data:
+            files.append(os.path.normpath(os.path.join(base, data['path'])))
+        for value in data.values():
+            files.extend(referenced_files(value, base))
+    elif isinstance(data, list):
+        for value in data:
+            files.extend(referenced_files(value, base))
+    return files
+
+
+def scene_key(path: str, data: Dict) -> str:
+    # a new release may pickle its objects differently
+    digest = hashlib.sha256(f'{SCENE_FORMAT}:{__version__}'.encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    for name in sorted(set(referenced_files(data, os.path.dirname(path)))):
+        stat = os.stat(name)
+        digest.update(f'{name}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()[:32]
+
+
+def load_scene(path: Union[str, os.PathLike], cache: bool = True,
+               directory: Optional[Union[str, os.PathLike]] = None) -> Scene:
+    # world and camera of a scene file, the world is compiled when its
+    # objects allow it. With cache the result is kept on disk and an
+    # unchanged scene is read back instead of built again
+    path = os.path.abspath(os.fspath(path))
+    data = read_scene(path)
+    if not cache:
+        return _build(data, path)
+
+    directory = cache_directory('scenes') if directory is None else os.fspath(directory)
+    cached = os.path.join(directory, f'{scene_key(path, data)}.pickle.lz4')
+    try:
+        with open(cached, 'rb') as f:
+            return pickle.loads(lz4.frame.decompress(f.read()))
+    except Exception:  # pylint: disable=broad-except
+        # missing, truncated or written by code whose classes changed, a
+        # stale pickle can fail in many ways and is simply built again
+        pass
+
+    scene = _build(data, path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp = f'{cached}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(lz4.frame.compress(pickle.dumps(scene, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, cached)
+    except OSError:
+        pass
+    return scene
+
+
+def _build(data: Dict, path: str) -> Scene:
+    world, camera = build_scene(data, os.path.dirname(path))
+    try:
+        world.compile()
+    except TypeError:
+        # CSG has no compiled form
+        pass
+    return world, camera
@@ -0,0 +1,233 @@
+import asyncio
+import io
+import itertools
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+
+from .camera import Camera
+from .canvas import Canvas
+from .constants import RENDER_QUEUE_SIZE, RESULT_CACHE_BYTES
+from .hashing import scene_hash
+from .world import World
+
+# asyncio front of the tracer for a server: jobs wait in a bounded priority
+# queue, a pool of processes renders them and the PNG images are kept in a
+# cache addressed by the canonical hash of world, camera and image size, so
+# a repeated job is answered without rendering
+#
+#   async with RenderService(processes=4) as service:
+#       png = await service.render(world, camera, priority=1)
+
+
+def render_png(world: World, camera: Camera) -> bytes:
+    canvas = Canvas((camera.hsize, camera.vsize))
+    camera.render_sequential(world, canvas)
+    data = io.BytesIO()
+    canvas.canvas.save(data, format='PNG')
+    return data.getvalue()
+
+
+class ResultCache:
+    # least recently used images are dropped once capacity bytes are in
+    # use, with a directory the images are also kept as <key>.png there
+    __slots__ = ("capacity", "directory", "_images", "_nbytes")
+
+    def __init__(self, capacity: int = RESULT_CACHE_BYTES,
+                 directory: Optional[Union[str, os.PathLike]] = None) -> None:
+        self.capacity: int = capacity
+        self.directory: Optional[str] = None if directory is None else os.fspath(directory)
+        self._images: OrderedDict[str, bytes] = OrderedDict()
+        self._nbytes: int = 0
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._images.get(key)
+        if data is not None:
+            self._images.move_to_end(key)
+            return data
+        if self.directory is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, f'{key}.png'), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._keep(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if key in self._images:
+            return
+        self._keep(key, data)
+        if self.directory is not None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = os.path.join(self.directory, f'{key}.{os.getpid()}.tmp')
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, os.path.join(self.directory, f'{key}.png'))
+            except OSError:
+                pass
+
+    def _keep(self, key: str, data: bytes) -> None:
+        self._images[key] = data
+        self._nbytes += len(data)
+        while self._nbytes > self.capacity and len(self._images) > 1:
+            _, old = self._images.popitem(last=False)
+            self._nbytes -= len(old)
+
+
+class RenderJob:
+    # one job for every different image, the clients asking for the same
+    # image share it and it is only cancelled when all of them cancel
+    __slots__ = ("key", "priority", "world", "camera", "future", "waiters")
+
+    def __init__(self, key: str, priority: int, world: World, camera: Camera,
+                 future: asyncio.Future) -> None:
+        self.key: str = key
+        self.priority: int = priority
+        self.world: Optional[World] = world
+        self.camera: Optional[Camera] = camera
+        self.future: asyncio.Future = future
+        self.waiters: int = 1
+
+    def __await__(self):
+        return asyncio.shield(self.future).__await__()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancelled(self) -> bool:
+        return self.future.cancelled()
+
+
+class RenderService:
+    __slots__ = ("processes", "max_queue", "cache", "rendered", "hits",
+                 "_queue", "_jobs", "_pool", "_tasks", "_counter")
+
+    def __init__(self, processes: Optional[int] = None, max_queue: int = RENDER_QUEUE_SIZE,
+                 cache: Optional[ResultCache] = None) -> None:
+        self.processes: int = processes if processes is not None else os.cpu_count()
+        self.max_queue: int = max_queue
+        self.cache: ResultCache = ResultCache() if cache is None else cache
+        # jobs rendered and jobs answered from the cache
+        self.rendered: int = 0
+        self.hits: int = 0
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        # queued and running jobs by key
+        self._jobs: Dict[str, RenderJob] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        # ties in priority go first in first out
+        self._counter = itertools.count()
+
+    async def __aenter__(self) -> 'RenderService':
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_queue)
+        self._pool = ProcessPoolExecutor(self.processes)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.processes)]
+
+    async def close(self) -> None:
+        # the jobs still queued or running are cancelled
+        for job in self._jobs.values():
+            job.future.cancel()
+        self._jobs.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            # cancelling the tasks cancelled the calls still waiting in the
+            # pool, only the running ones are waited for
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def submit(self, world: World, camera: Camera, priority: int = 0) -> RenderJob:
+        # higher priorities render first, waits while the queue is full
+        key = scene_hash(world, camera, (camera.hsize, camera.vsize))
+        loop = asyncio.get_running_loop()
+        data = self.cache.get(key)
+        if data is not None:
+            self.hits += 1
+            future = loop.create_future()
+            future.set_result(data)
+            return RenderJob(key, priority, None, None, future)
+        job = self._jobs.get(key)
+        if job is not None:
+            job.waiters += 1
+            return job
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_queue)
+        job = RenderJob(key, priority, world, camera, loop.create_future())
+        # registered once queued, a submitter cancelled while the queue is
+        # full leaves no job behind for the next ones to wait on
+        await self._queue.put((-priority, next(self._counter), job))
+        self._jobs[key] = job
+        return job
+
+    async def render(self, world: World, camera: Camera, priority: int = 0) -> bytes:
+        job = await self.submit(world, camera, priority)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+
+    def cancel(self, job: RenderJob) -> None:
+        # a queued job is dropped, a running one is left to finish in its
+        # process and its image goes to the cache
+        if job.done():
+            return
+        job.waiters -= 1
+        if job.waiters <= 0:
+            job.future.cancel()
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def pending(self) -> int:
+        return 0 if self._queue is None else self._queue.qsize()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.cancelled():
+                    continue
+                world, camera = job.world, job.camera
+                # the scene isn't needed once it is sent to the process
+                job.world = job.camera = None
+                try:
+                    data = await loop.run_in_executor(self._pool, render_png, world, camera)
+                except Exception as e:  # pylint: disable=broad-except
+                    if not job.done():
+                        job.future.set_exception(e)
+                    continue
+                self.rendered += 1
+                self.cache.put(job.key, data)
+                if not job.done():
+                    job.future.set_result(data)
+            finally:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                self._queue.task_done()
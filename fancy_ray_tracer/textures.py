@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from collections import OrderedDict
+from math import log2
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .constants import PI, TEXTURE_CACHE_BYTES
+from .materials import DefaultPattern
+from .utils import cache_directory
+
+MipLevels = List[np.ndarray]
+UVMapping = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+def spherical_map(p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # works on a single point or on (N, 4) points, u grows eastwards and
+    # v from the south to the north pole
+    x = p[..., 0]
+    y = p[..., 1]
+    z = p[..., 2]
+    theta = np.arctan2(x, z)
+    radius = np.sqrt(x * x + y * y + z * z)
+    phi = np.arccos(np.clip(y / np.maximum(radius, 1e-300), -1, 1))
+    u = 1 - (theta / (2 * PI) + 0.5)
+    v = 1 - phi / PI
+    return u, v
+
+
+def planar_map(p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the texture repeats every unit on the xz plane
+    return np.mod(p[..., 0], 1.0), np.mod(p[..., 2], 1.0)
+
+
+def cylindrical_map(p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    theta = np.arctan2(p[..., 0], p[..., 2])
+    return 1 - (theta / (2 * PI) + 0.5), np.mod(p[..., 1], 1.0)
+
+
+def mip_level_count(height: int, width: int) -> int:
+    # levels build_mip_levels makes for an image of that size
+    count = 1
+    while height > 1 or width > 1:
+        height = (height + 1) // 2
+        width = (width + 1) // 2
+        count += 1
+    return count
+
+
+def build_mip_levels(image: np.ndarray) -> MipLevels:
+    # 2x2 box filtered pyramid down to a single texel, odd sizes repeat
+    # their last row or column
+    levels = [image]
+    while image.shape[0] > 1 or image.shape[1] > 1:
+        if image.shape[0] % 2 == 1 and image.shape[0] > 1:
+            image = np.concatenate((image, image[-1:]), axis=0)
+        if image.shape[1] % 2 == 1 and image.shape[1] > 1:
+            image = np.concatenate((image, image[:, -1:]), axis=1)
+        h = max(image.shape[0] // 2, 1)
+        w = max(image.shape[1] // 2, 1)
+        image = image.reshape(h, image.shape[0] // h, w, image.shape[1] // w, 3).mean(axis=(1, 3),
+                                                                                      dtype=np.float32)
+        levels.append(image)
+    return levels
+
+
+class TextureCache:
+    # mip pyramids shared by every material of the process, least recently
+    # used textures are dropped once capacity bytes are in use. The pyramids
+    # are also written as .npy files and memory mapped, so worker processes
+    # share them through the page cache instead of decoding the image again
+    __slots__ = ("directory", "capacity", "_textures", "_nbytes")
+
+    def __init__(self, capacity: int = TEXTURE_CACHE_BYTES,
+                 directory: Optional[Union[str, os.PathLike]] = None) -> None:
+        if directory is None:
+            directory = cache_directory('textures')
+        self.directory: str = os.fspath(directory)
+        self.capacity: int = capacity
+        self._textures: OrderedDict[str, MipLevels] = OrderedDict()
+        self._nbytes: int = 0
+
+    def __reduce__(self):
+        # processes get an empty cache, the textures are found on disk
+        return (TextureCache, (self.capacity, self.directory))
+
+    def __len__(self) -> int:
+        return len(self._textures)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, path: Union[str, os.PathLike]) -> MipLevels:
+        path = os.path.abspath(os.fspath(path))
+        levels = self._textures.get(path)
+        if levels is not None:
+            self._textures.move_to_end(path)
+            return levels
+
+        levels = self._load(path)
+        self._textures[path] = levels
+        self._nbytes += sum(level.nbytes for level in levels)
+        while self._nbytes > self.capacity and len(self._textures) > 1:
+            _, old = self._textures.popitem(last=False)
+            self._nbytes -= sum(level.nbytes for level in old)
+        return levels
+
+    def _key(self, path: str) -> str:
+        stat = os.stat(path)
+        return hashlib.sha1(f'{path}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()[:20]
+
+    def _load(self, path: str) -> MipLevels:
+        key = self._key(path)
+        prefix = os.path.join(self.directory, key)
+        try:
+            levels = [np.load(f'{prefix}_0.npy', mmap_mode='r')]
+            count = mip_level_count(*levels[0].shape[:2])
+            for n in range(1, count):
+                levels.append(np.load(f'{prefix}_{n}.npy', mmap_mode='r'))
+            return levels
+        except (OSError, ValueError):
+            pass
+
+        with Image.open(path) as img:
+            image = np.asarray(img.convert('RGB'), dtype=np.float32) / 255
+        levels = build_mip_levels(image)
+        self._save(prefix, levels)
+        for level in levels:
+            level.setflags(write=False)
+        return levels
+
+    def _save(self, prefix: str, levels: MipLevels) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # level 0 goes last, its presence marks a complete pyramid
+            for n in reversed(range(len(levels))):
+                tmp = f'{prefix}_{n}.{os.getpid()}.tmp.npy'
+                np.save(tmp, levels[n])
+                os.replace(tmp, f'{prefix}_{n}.npy')
+        except OSError:
+            # without a writable cache every process decodes the image
+            pass
+
+    def clear(self) -> None:
+        self._textures.clear()
+        self._nbytes = 0
+
+
+TEXTURE_CACHE = TextureCache()
+
+
+# steps along the axes of pattern space the mapping is differentiated with
+_AXES = np.eye(4, dtype=np.float64)[:3]
+_STEP = 1e-3
+
+
+def _bilinear(level: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    h, w = level.shape[:2]
+    # v = 0 is the bottom row of the image
+    x = np.clip(u, 0, 1) * (w - 1)
+    y = (1 - np.clip(v, 0, 1)) * (h - 1)
+    x0 = np.floor(x).astype(np.intp)
+    y0 = np.floor(y).astype(np.intp)
+    x1 = np.minimum(x0 + 1, w - 1)
+    y1 = np.minimum(y0 + 1, h - 1)
+    fx = (x - x0)[..., None]
+    fy = (y - y0)[..., None]
+    top = level[y0, x0] * (1 - fx) + level[y0, x1] * fx
+    bottom = level[y1, x0] * (1 - fx) + level[y1, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+class ImagePattern(DefaultPattern):
+    # image texture looked up through a uv mapping of the pattern space
+    # point, or with the uv carried by a mesh hit. Only the path is kept,
+    # the pixels live in the shared texture cache
+    __slots__ = ()
+
+    def __init__(self, path: Union[str, os.PathLike], mapping: UVMapping = spherical_map,
+                 cache: Optional[TextureCache] = None) -> None:
+        super().__init__()
+        self.name = 'image'
+        self.path: str = os.fspath(path)
+        self.mapping: UVMapping = mapping
+        self.cache: TextureCache = TEXTURE_CACHE if cache is None else cache
+
+    @property
+    def levels(self) -> MipLevels:
+        return self.cache.get(self.path)
+
+    def _sample(self, u: np.ndarray, v: np.ndarray, footprint: float) -> np.ndarray:
+        # footprint is the size of the looked up area in uv units, it picks
+        # the two closest mip levels and blends them
+        levels = self.levels
+        size = max(levels[0].shape[:2])
+        lod = min(max(log2(footprint * size), 0.0), len(levels) - 1) if footprint > 0 else 0.0
+        low = int(lod)
+        color = _bilinear(levels[low], u, v)
+        frac = lod - low
+        if frac > 0:
+            color = color * (1 - frac) + _bilinear(levels[low + 1], u, v) * frac
+        return np.asarray(color, dtype=np.float64)
+
+    def uv_color_at(self, u: float, v: float, footprint: float = 0.0) -> np.ndarray:
+        return self._sample(np.float64(u), np.float64(v), footprint)
+
+    def color_at(self, point: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        # footprint is the width of the looked up area in pattern space, the
+        # mapping around the point gives its size in uv units
+        u, v = self.mapping(point)
+        if footprint > 0:
+            # derivatives of the mapping, a short step keeps the seam of a
+            # wrapping mapping from being taken for a jump
+            step = min(footprint, _STEP)
+            us, vs = self.mapping(point + step * _AXES)
+            du = np.abs(us - u)
+            dv = np.abs(vs - v)
+            du = np.minimum(du, 1 - du)
+            dv = np.minimum(dv, 1 - dv)
+            footprint *= max(du.max(), dv.max()) / step
+        return self._sample(u, v, footprint)
+
+    def colors_at(self, points: np.ndarray, footprint: float = 0.0) -> np.ndarray:
+        u, v = self.mapping(points)
+        return self._sample(u, v, footprint)
+
+    def __eq__(self, other: ImagePattern) -> bool:
+        return self.name == other.name and self.path == other.path and self.mapping is other.mapping
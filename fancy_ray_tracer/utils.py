@@ -1,3 +1,4 @@
+import os
 from base64 import b64encode
 from os import urandom
 from typing import Sequence, Tuple, Union
@@ -25,6 +26,20 @@ def chain(ops: Sequence[np.ndarray], p: np.ndarray) -> np.ndarray:
     return res
 
 
+def cache_directory(name: str) -> str:
+    # $FANCY_RAY_TRACER_CACHE/name, by default under ~/.cache
+    root = os.environ.get('FANCY_RAY_TRACER_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'fancy_ray_tracer'))
+    return os.path.join(root, name)
+
+
+def transform_scale(matrix: np.ndarray) -> float:
+    # mean scale factor of the linear part, the cube root of its volume change
+    (a, b, c), (d, e, f), (g, h, i) = matrix[:3, :3].tolist()
+    det = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+    return abs(det) ** (1 / 3)
+
+
 def rand_id(length: int = 20) -> str:
     return b64encode(urandom(length)).decode('ascii')
 
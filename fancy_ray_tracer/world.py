@@ -1,27 +1,28 @@
 from math import acos, sqrt
+from random import random
 from typing import (
+    Dict,
     Iterable,
     List,
     MutableMapping,
     MutableSequence,
     Optional,
     Sequence,
+    Tuple,
     Union,
 )
 
 import numpy as np
 
-from .bridson_sampling import Bridson_sampling
-from .primitives import AXIS_Y_VEC
-
 try:
     from .compiled import _schlick
 except ImportError:
     _schlick = None
-from .constants import EPSILON, RAY_REFLECTION_LIMIT
-from .illumination import Light, lighting
+from .constants import EPSILON, RAY_MIN_CONTRIBUTION, RAY_REFLECTION_LIMIT
+from .frozen import FrozenScene, freeze
+from .illumination import AreaLight, Light, lighting
 from .protocols import WorldObject
-from .ray import Computations, Intersection, Ray, hit_sorted
+from .ray import Computations, Intersection, IntersectionBuffer, Ray, hit_sorted
 from .tuples import make_color, normalize
 
 _BLACK = make_color(0, 0, 0)
@@ -29,7 +30,10 @@ _WHITE = make_color(1, 1, 1)
 
 
 class World:
-    __slots__ = ("light", 'objects', '_objects_ids')
+    __slots__ = ("light", 'objects', '_objects_ids',
+                 'min_contribution', 'russian_roulette', '_rays_left',
+                 '_occluders', '_shadow_cache_hits', '_shadow_cache_misses',
+                 '_compiled')
 
     def __init__(self, light: Union[Light, Iterable[Light]] = (),
                  objects: Iterable[WorldObject] = ()) -> None:
@@ -40,14 +44,49 @@ class World:
         self.objects: MutableSequence[WorldObject] = list(objects)
         self._objects_ids: MutableMapping[str, WorldObject] = {
             i.id: n for n, i in enumerate(self.objects)}
+        # secondary rays whose accumulated throughput falls below
+        # min_contribution are dropped, or kept at random with russian roulette
+        self.min_contribution: float = RAY_MIN_CONTRIBUTION
+        self.russian_roulette: bool = False
+        self._rays_left: Optional[int] = None
+        # index of the last object that blocked each light, every worker
+        # process owns its copy of the world and so its own cache
+        self._occluders: Dict[int, int] = {}
+        self._shadow_cache_hits: int = 0
+        self._shadow_cache_misses: int = 0
+        self._compiled: Optional[FrozenScene] = None
+
+    def compile(self) -> FrozenScene:
+        # read only array snapshot of the scene, built once and reused until
+        # invalidate() is called. add_light and add_objects invalidate it,
+        # changes made to the objects themselves must call invalidate().
+        # Only Camera.render_native reads it, the python renderers shade
+        # through the objects as the snapshot has no CSG, image textures,
+        # refraction or area lights
+        if self._compiled is None:
+            self._compiled = freeze(self)
+        return self._compiled
+
+    def invalidate(self) -> None:
+        self._compiled = None
+
+    def refit(self) -> FrozenScene:
+        # new snapshot after set_transform calls on the objects, the BVH of
+        # the last one keeps its topology and only its bounds change, it is
+        # built again when objects were added or the tree degraded
+        self._compiled = freeze(self, self._compiled)
+        return self._compiled
 
     def add_light(self, light: Light):
         self.light.append(light)
+        self._compiled = None
 
     def add_object(self, obj: WorldObject) -> None:
         self.objects.append(obj)
+        self._compiled = None
 
     def add_objects(self, objs: Iterable[WorldObject]) -> None:
+        self._compiled = None
         objects = self.objects
         for obj in objs:
             self._objects_ids[obj.id] = len(objects)
@@ -59,9 +98,18 @@ class World:
     def has_object_id(self, obj_id: str):
         return obj_id in self._objects_ids
 
-    def intersec(self, ray: Ray) -> Sequence[Intersection]:
-        intersections: List[Intersection] = []
+    def intersec(self, ray: Ray, buffer: Optional[IntersectionBuffer] = None) -> Sequence[Intersection]:
+        # with a buffer the hits are collected and sorted in it, the buffer
+        # is cleared first and can be reused ray after ray
         obj: WorldObject
+        if buffer is not None:
+            buffer.clear()
+            for obj in self.objects:
+                ray.intersect_into(obj, buffer)
+            buffer.sort()
+            return buffer
+
+        intersections: List[Intersection] = []
         for obj in self.objects:
             intersects = ray.intersect(obj)
             if len(intersects) != 0:
@@ -73,133 +121,201 @@ class World:
         intersections.sort()
         return intersections
 
-    def shade_hit(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT) -> np.ndarray:
-        material = cmp.object.material
-        if len(self.light) == 1:
-            in_shadow = self._is_shadowed(
-                cmp.over_point, self.light[0].position)
-            surface = lighting(cmp.object, self.light[0],
-                               cmp.over_point, cmp.eyev, cmp.normalv, in_shadow)
-            reflected = self.reflected_color(cmp, remaining)
-            refracted = self.refracted_color(cmp, remaining)
-
-            if material.reflective > EPSILON and material.transparency > EPSILON:
-                # reflectance = schlick(cmp)
-                reflectance: float = schlick(
-                    cmp.eyev, cmp.normalv, cmp.n1, cmp.n2)
-                return surface + reflected * reflectance + (1 - reflectance) * refracted
-
-            return surface + reflected + refracted
-
+    def shade_hit(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT,
+                  throughput: float = 1.0) -> np.ndarray:
         if len(self.light) == 0:
             return _BLACK
 
-        reflected = self.reflected_color(cmp, remaining)
-        refracted = self.refracted_color(cmp, remaining)
-        in_shadow = self._is_shadowed(cmp.over_point, self.light[0].position)
+        in_shadow = self.light_shadow(cmp.over_point, self.light[0])
         color = lighting(cmp.object, self.light[0],
-                         cmp.over_point, cmp.eyev, cmp.normalv, in_shadow)
+                         cmp.over_point, cmp.eyev, cmp.normalv, in_shadow, cmp.footprint)
         light: Light
         for light in self.light[1:]:
-            in_shadow = self._is_shadowed(cmp.over_point, light.position)
+            in_shadow = self.light_shadow(cmp.over_point, light)
             color += lighting(cmp.object, light,
-                              cmp.over_point, cmp.eyev, cmp.normalv, in_shadow)
+                              cmp.over_point, cmp.eyev, cmp.normalv, in_shadow, cmp.footprint)
 
+        material = cmp.object.material
         if material.reflective > EPSILON and material.transparency > EPSILON:
             # reflectance = schlick(cmp)
-            reflectance = schlick(
+            reflectance: float = schlick(
                 cmp.eyev, cmp.normalv, cmp.n1, cmp.n2)
+            reflected = self.reflected_color(
+                cmp, remaining, throughput * reflectance)
+            refracted = self.refracted_color(
+                cmp, remaining, throughput * (1 - reflectance))
             return color + reflected * reflectance + (1 - reflectance) * refracted
 
+        reflected = self.reflected_color(cmp, remaining, throughput)
+        refracted = self.refracted_color(cmp, remaining, throughput)
         return color + reflected + refracted
 
-    def color_at(self, ray: Ray, remaining: int = RAY_REFLECTION_LIMIT) -> np.ndarray:
+    def color_at(self, ray: Ray, remaining: int = RAY_REFLECTION_LIMIT,
+                 throughput: float = 1.0) -> np.ndarray:
         intersections: Sequence[Intersection] = self.intersec(ray)
         it: Optional[Intersection] = hit_sorted(intersections)
 
         if it is None:
             return _BLACK
 
-        return self.shade_hit(Computations(it, ray, intersections), remaining)
+        return self.shade_hit(Computations(it, ray, intersections), remaining, throughput)
 
-    def is_shadowed(self, p: np.ndarray) -> float:
-        if len(self.light) == 1:
-            return self._is_shadowed(p, self.light[0].position)
+    def trace(self, ray: Ray, ray_budget: Optional[int] = None) -> np.ndarray:
+        # ray_budget caps the secondary rays spawned by this primary ray,
+        # None means only the depth and contribution limits apply
+        self._rays_left = ray_budget
+        try:
+            return self.color_at(ray)
+        finally:
+            self._rays_left = None
 
+    def trace_hit(self, ray: Ray, ray_budget: Optional[int] = None) -> Tuple[np.ndarray, Optional[Computations]]:
+        # like trace but also returns the computations of the primary hit
+        intersections: Sequence[Intersection] = self.intersec(ray)
+        it: Optional[Intersection] = hit_sorted(intersections)
+
+        if it is None:
+            return _BLACK, None
+
+        cmp = Computations(it, ray, intersections)
+        return self.shade_primary(cmp, ray_budget), cmp
+
+    def shade_primary(self, cmp: Computations, ray_budget: Optional[int] = None) -> np.ndarray:
+        # colour of a primary hit the caller intersected itself, with the
+        # same limits trace applies
+        self._rays_left = ray_budget
+        try:
+            return self.shade_hit(cmp)
+        finally:
+            self._rays_left = None
+
+    def is_shadowed(self, p: np.ndarray) -> float:
         if len(self.light) == 0:
             return 1.0
 
-        in_shadow: float = self._is_shadowed(p, self.light[0].position)
+        in_shadow: float = 0.0
         light: Light
-        for light in self.light[1:]:
-            in_shadow += self._is_shadowed(p, light.position)
+        for light in self.light:
+            in_shadow += self.light_shadow(p, light)
 
         return in_shadow / len(self.light)
 
-    def _is_shadowed(self, p: np.ndarray, light_position: np.ndarray) -> float:
+    def light_shadow(self, p: np.ndarray, light: Light) -> float:
+        if not isinstance(light, AreaLight):
+            return self._is_shadowed(p, light.position, id(light))
+
+        # the probe samples are spread over the light, when all of them agree
+        # the point is fully lit or fully shadowed and we stop there
+        points: np.ndarray = light.sample_points(p)
+        probes: int = light.probes
+        in_shadow: float = 0.0
+        for i in range(probes):
+            in_shadow += self._is_shadowed(p, points[i], id(light))
+
+        if in_shadow == 0.0 or in_shadow == probes:
+            return in_shadow / probes
+
+        for i in range(probes, len(points)):
+            in_shadow += self._is_shadowed(p, points[i], id(light))
+
+        return in_shadow / len(points)
+
+    def _is_shadowed(self, p: np.ndarray, light_position: np.ndarray,
+                     light_key: Optional[int] = None) -> float:
+        # any object that casts shadows between p and the light blocks it,
+        # objects with has_shadow = False let the light through
         direction: np.ndarray = light_position - p
         distance: float = sqrt(direction.dot(direction))
         direction *= (1 / distance)
 
         r = Ray(p, direction)
-        intersects = self.intersec(r)
-        h = hit_sorted(intersects)
-
-        has_shadow = h is not None and h.object.has_shadow and h.t < distance
+        objects = self.objects
+        cached: Optional[int] = None
+        if light_key is not None:
+            # neighbour points are usually blocked by the same object, so try
+            # the last occluder of this light before the whole world
+            cached = self._occluders.get(light_key)
+            if cached is not None and cached < len(objects) \
+                    and self._occludes(r, objects[cached], distance):
+                self._shadow_cache_hits += 1
+                return 1.0
+            self._shadow_cache_misses += 1
 
-        if not has_shadow:
+        obj: WorldObject
+        for n, obj in enumerate(objects):
+            if n != cached and self._occludes(r, obj, distance):
+                if light_key is not None:
+                    self._occluders[light_key] = n
+                return 1.0
+
+        return 0.0
+
+    @staticmethod
+    def _occludes(ray: Ray, obj: WorldObject, distance: float) -> bool:
+        i: Intersection
+        for i in ray.intersect(obj):
+            if 0 <= i.t < distance and i.object.has_shadow:
+                return True
+        return False
+
+    def shadow_cache_stats(self) -> Dict[str, float]:
+        hits = self._shadow_cache_hits
+        total = hits + self._shadow_cache_misses
+        return {"hits": hits, "misses": self._shadow_cache_misses,
+                "hit_rate": hits / total if total != 0 else 0.0}
+
+    def merge_shadow_cache_stats(self, start: Dict[str, float], hits: int, misses: int) -> None:
+        # counters after a render on copies of this world in the worker
+        # processes, start are the stats before it and hits and misses the
+        # sums counted by the copies. A render that ran in this process
+        # counted them here already, so the counters are set, not added to
+        self._shadow_cache_hits = int(start["hits"]) + hits
+        self._shadow_cache_misses = int(start["misses"]) + misses
+
+    def reset_shadow_cache(self) -> None:
+        self._occluders.clear()
+        self._shadow_cache_hits = 0
+        self._shadow_cache_misses = 0
+
+    def _secondary_weight(self, throughput: float) -> float:
+        # weight of a secondary ray whose contribution to the pixel is
+        # throughput, 0 means the ray must not be traced
+        if throughput >= self.min_contribution:
+            weight = 1.0
+        elif self.russian_roulette and throughput > 0:
+            survival: float = throughput / self.min_contribution
+            if random() >= survival:
+                return 0.0
+            weight = 1.0 / survival
+        else:
             return 0.0
 
-        return 1.0
-        # TODO: implement soft shadow with less noise
-        # lightTangent = normalize(np.cross(direction[:3], AXIS_Y_VEC[:3]))
-        # if lightTangent.dot(lightTangent) < EPSILON:
-        #     lightTangent[0] = 1.0
-        # lightBitangent = normalize(np.cross(lightTangent, direction[:3]))
-        # lightTangent = np.append(lightTangent, 0)
-        # lightBitangent = np.append(lightBitangent, 0)
-
-        # nsamples = 16
-        # nshadows = 1
-        # #radius = 1 / 5
-        # #points = Bridson_sampling(radius=radius, k=12)
-        # # points = points[:nsamples]
-        # consecutive_shadow = 0
-        # #nrp: np.ndarray = np.random.uniform(-1, 1, (nsamples - 1, 4))
-        # nrp: np.ndarray = 0.5 * np.random.randn(nsamples - 1, 4)
-        # for i in range(len(nrp)):
-        #     # pp = p + lightTangent * \
-        #     #    points[i, 0] + lightBitangent * points[i, 1]
-        #     pp = p + nrp[i]
-        #     direction: np.ndarray = light_position - pp
-        #     distance: float = sqrt(direction.dot(direction))
-        #     direction *= (1 / distance)
-
-        #     r = Ray(p, direction)
-        #     intersects = self.intersec(r)
-        #     h = hit_sorted(intersects)
-
-        #     has_shadow = h is not None and h.object.has_shadow and h.t < distance
-        #     nshadows += int(has_shadow)
-        #     if not has_shadow:
-        #         consecutive_shadow = 0
-        #     else:
-        #         consecutive_shadow += int(has_shadow)
-        #         if consecutive_shadow >= 4:
-        #             return 1.0
-
-        # return nshadows / (nsamples + 1)
-
-    def reflected_color(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT) -> np.ndarray:
-        if cmp.object.material.reflective < EPSILON or remaining <= 0:
+        if self._rays_left is not None:
+            if self._rays_left <= 0:
+                return 0.0
+            self._rays_left -= 1
+
+        return weight
+
+    def reflected_color(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT,
+                        throughput: float = 1.0) -> np.ndarray:
+        reflective: float = cmp.object.material.reflective
+        if reflective < EPSILON or remaining <= 0:
             return _BLACK
 
-        reflect_ray = Ray(cmp.over_point, cmp.reflectv)
-        color = self.color_at(reflect_ray, remaining - 1)
-        return color * cmp.object.material.reflective
+        throughput *= reflective
+        weight = self._secondary_weight(throughput)
+        if weight == 0.0:
+            return _BLACK
+
+        reflect_ray = Ray(cmp.over_point, cmp.reflectv, cmp.width, cmp.spread)
+        color = self.color_at(reflect_ray, remaining - 1, throughput * weight)
+        return color * (reflective * weight)
 
-    def refracted_color(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT) -> np.ndarray:
-        if cmp.object.material.transparency < EPSILON or remaining <= 0:
+    def refracted_color(self, cmp: Computations, remaining: int = RAY_REFLECTION_LIMIT,
+                        throughput: float = 1.0) -> np.ndarray:
+        transparency: float = cmp.object.material.transparency
+        if transparency < EPSILON or remaining <= 0:
             return _BLACK
 
         n_ratio = cmp.n1 / cmp.n2
@@ -209,12 +325,18 @@ class World:
         if sin2_t > 1:
             return _BLACK
 
+        throughput *= transparency
+        weight = self._secondary_weight(throughput)
+        if weight == 0.0:
+            return _BLACK
+
         cos_t = sqrt(1.0 - sin2_t)
         direction = cmp.normalv * \
             (n_ratio * cos_i - cos_t) - cmp.eyev * n_ratio
-        refract_ray = Ray(cmp.under_point, direction)
+        refract_ray = Ray(cmp.under_point, direction, cmp.width, cmp.spread)
 
-        return self.color_at(refract_ray, remaining - 1) * cmp.object.material.transparency
+        color = self.color_at(refract_ray, remaining - 1, throughput * weight)
+        return color * (transparency * weight)
 
 
 def schlick_fallback(eyev: np.ndarray, normalv: np.ndarray, n1: float, n2: float) -> float:  # reflectance
@@ -0,0 +1,14 @@
+import pytest
+
+from fancy_ray_tracer import bridson_sampling, textures
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path_factory, monkeypatch):
+    # the caches of the tests never reach the user's cache directory
+    root = tmp_path_factory.mktemp('cache')
+    monkeypatch.setenv('FANCY_RAY_TRACER_CACHE', str(root))
+    # the default caches were made when the modules were imported
+    monkeypatch.setattr(bridson_sampling, 'SAMPLE_CACHE', bridson_sampling.PoissonDiskCache())
+    monkeypatch.setattr(textures, 'TEXTURE_CACHE', textures.TextureCache())
+    return root
@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import *
+from fancy_ray_tracer.animation import _bounded_map, ppm_bytes
+from fancy_ray_tracer.canvas import to_rgb8
+from fancy_ray_tracer.constants import PI
+
+
+def scene():
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    floor = Plane()
+    floor.set_transform(translation(0, -1, 0))
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s, floor])
+    c = Camera(10, 8, PI / 3)
+    c.set_transform(view_transform(point(0, 1, -5), point(0, 0, 0), vector(0, 1, 0)))
+    animation = Animation(w, c, frames=4, fps=2)
+    animation.animate(s, Motion(translation, Keyframes([(0, -1), (1.5, 1)]), 0, 0))
+    animation.animate(c, LookAt(Keyframes([(0, (0, 1, -5)), (1.5, (1, 2, -5))]), (0, 0, 0)))
+    return animation
+
+
+def expected(frame):
+    # the frame built by hand
+    t = frame / 2
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    s.set_transform(translation(-1 + 2 * t / 1.5, 0, 0))
+    floor = Plane()
+    floor.set_transform(translation(0, -1, 0))
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s, floor])
+    c = Camera(10, 8, PI / 3)
+    c.set_transform(view_transform(point(t / 1.5, 1 + t / 1.5, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return to_rgb8(c._render_tile(w, (0, 0, 10, 8)))
+
+
+def test_keyframes():
+    k = Keyframes([(1, 10), (0, 0), (2, 0)])
+    assert k(-1) == 0
+    assert k(0.25) == 2.5
+    assert k(1.5) == 5
+    assert k(3) == 0
+    assert Keyframes([(0, 0), (1, 1)], 'step')(0.9) == 0
+    assert Keyframes([(0, 0), (1, 1)], 'smooth')(0.5) == 0.5
+    assert np.allclose(Keyframes([(0, (0, 0, 0)), (1, (2, 4, 6))])(0.5), (1, 2, 3))
+    with pytest.raises(ValueError):
+        Keyframes([(0, 0)], 'bounce')
+
+
+def test_tracks():
+    spin = Motion(rotY, Keyframes([(0, 0), (1, PI)]))
+    assert np.allclose(spin(0.5), rotY(PI / 2))
+    move = Chain(translation(1, 0, 0), spin)
+    assert np.allclose(move(0.5), translation(1, 0, 0).dot(rotY(PI / 2)))
+    look = LookAt((0, 0, -5), Keyframes([(0, (0, 0, 0)), (1, (0, 2, 0))]))
+    assert np.allclose(look(1), view_transform(point(0, 0, -5), point(0, 2, 0), vector(0, 1, 0)))
+
+
+def test_render_frames(tmp_path):
+    animation = scene()
+    pattern = os.path.join(tmp_path, 'frames', '{:03d}.png')
+    frames = {}
+    assert animation.render(pattern, processes=2,
+                            callback=lambda n, image: frames.__setitem__(n, image)) == 4
+    assert sorted(frames) == [0, 1, 2, 3]
+    for n in range(4):
+        assert np.array_equal(frames[n], expected(n))
+        assert os.path.exists(pattern.format(n))
+    # the caller's scene isn't moved
+    assert np.allclose(animation.world.objects[0].transform, np.eye(4))
+
+
+def test_render_resume_and_encoder(tmp_path):
+    animation = scene()
+    pattern = os.path.join(tmp_path, '{:03d}.png')
+    assert animation.render(pattern, processes=1) == 4
+    os.remove(pattern.format(2))
+    video = os.path.join(tmp_path, 'video.ppm')
+    encoder = [sys.executable, '-c',
+               f'import sys; open({video!r}, "wb").write(sys.stdin.buffer.read())']
+    # only the missing frame is rendered, the encoder gets all of them
+    assert animation.render(pattern, encoder=encoder, processes=1) == 1
+    with open(video, 'rb') as f:
+        data = f.read()
+    assert data == b''.join(ppm_bytes(expected(n)) for n in range(4))
+    assert animation.render(pattern) == 0
+
+
+
+class CountingPool(ThreadPoolExecutor):
+    def __init__(self, workers):
+        super().__init__(workers)
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        return super().submit(fn, *args)
+
+
+def test_bounded_map():
+    with CountingPool(2) as pool:
+        results = _bounded_map(pool, pow, range(10), 4, 2)
+        assert next(results) == 0
+        # the window holds the rest back
+        assert pool.submitted == 4
+        assert list(results) == [n * n for n in range(1, 10)]
+
+    release = threading.Event()
+    calls = []
+
+    def call(n):
+        calls.append(n)
+        if n != 0:
+            release.wait()
+        return n
+
+    with CountingPool(1) as pool:
+        results = _bounded_map(pool, call, range(10), 4)
+        assert next(results) == 0
+        # the calls still waiting are cancelled, the running one finishes
+        results.close()
+        release.set()
+    assert pool.submitted == 4
+    assert calls in ([0], [0, 1])
@@ -0,0 +1,114 @@
+from fancy_ray_tracer import (
+    Light,
+    RectangleLight,
+    Sphere,
+    SphereLight,
+    World,
+    equal,
+    make_color,
+    point,
+    scaling,
+    vector,
+)
+from fancy_ray_tracer.illumination import spread_order, stratified_samples
+from fancy_ray_tracer.matrices import translation
+from fancy_ray_tracer.primitives import Plane
+
+
+class ShadowCountingWorld(World):
+    __slots__ = ("shadow_rays",)
+
+    def __init__(self, light=(), objects=()) -> None:
+        super().__init__(light, objects)
+        self.shadow_rays = 0
+
+    def _is_shadowed(self, p, light_position, light_key=None):
+        self.shadow_rays += 1
+        return super()._is_shadowed(p, light_position, light_key)
+
+
+def occluded_world(light):
+    blocker = Sphere()
+    blocker.set_transform(translation(0, 2, 0))
+    return ShadowCountingWorld(light, [blocker])
+
+
+def square_light():
+    return RectangleLight(point(-0.5, 4, -0.5), vector(1, 0, 0), vector(0, 0, 1),
+                          make_color(1, 1, 1), samples=16, probes=4)
+
+
+def test_stratified_samples():
+    samples = stratified_samples(16)
+    assert samples.shape == (16, 2)
+    cells = {(int(x * 4), int(y * 4)) for x, y in samples}
+    assert len(cells) == 16
+
+
+def test_spread_order_keeps_points():
+    samples = stratified_samples(16)
+    ordered = spread_order(samples, 4)
+    assert equal(sorted(map(tuple, samples)), sorted(map(tuple, ordered)))
+    # the probes are far away of each other
+    d = ((ordered[:4, None] - ordered[None, :4])**2).sum(axis=2)
+    assert d[d > 0].min() > 0.25
+
+
+def test_rectangle_light_samples():
+    light = square_light()
+    assert equal(light.position, point(0, 4, 0))
+    points = light.sample_points(point(0, 0, 0))
+    assert points.shape == (16, 4)
+    assert equal(points[:, 1], 4)
+    assert points[:, 0].min() >= -0.5 and points[:, 0].max() <= 0.5
+    assert equal(points[:, 3], 1)
+
+
+def test_sphere_light_samples_face_point():
+    light = SphereLight(point(0, 5, 0), 0.5, make_color(1, 1, 1))
+    points = light.sample_points(point(0, 0, 0))
+    assert equal(points[:, 1], 5)
+    assert (((points[:, :3] - (0, 5, 0))**2).sum(axis=1) <= 0.25 + 1e-9).all()
+
+
+def test_fully_lit_uses_probes_only():
+    w = occluded_world(square_light())
+    assert w.light_shadow(point(10, 0, 0), w.light[0]) == 0.0
+    assert w.shadow_rays == 4
+
+
+def test_fully_shadowed_uses_probes_only():
+    w = occluded_world(square_light())
+    assert w.light_shadow(point(0, 0, 0), w.light[0]) == 1.0
+    assert w.shadow_rays == 4
+
+
+def test_penumbra_is_refined():
+    w = occluded_world(square_light())
+    shadow = w.light_shadow(point(2.2, 0, 0), w.light[0])
+    assert 0.0 < shadow < 1.0
+    assert w.shadow_rays == 16
+
+
+def test_point_light_is_hard():
+    w = occluded_world(Light(point(0, 4, 0), make_color(1, 1, 1)))
+    assert w.light_shadow(point(0, 0, 0), w.light[0]) == 1.0
+    assert w.shadow_rays == 1
+
+
+def test_soft_shadow_shading():
+    floor = Plane()
+    blocker = Sphere()
+    blocker.set_transform(translation(0, 2, 0))
+    light = SphereLight(point(0, 4, 0), 1, make_color(1, 1, 1), samples=25)
+    w = World(light, [floor, blocker])
+    assert w.is_shadowed(point(0, 0.001, 0)) == 1.0
+    assert w.is_shadowed(point(20, 0.001, 0)) == 0.0
+    assert 0.0 < w.is_shadowed(point(1.2, 0.001, 0)) < 1.0
+
+
+def test_poisson_pattern():
+    light = RectangleLight(point(0, 4, 0), vector(1, 0, 0), vector(0, 0, 1),
+                           make_color(1, 1, 1), samples=16, pattern='poisson')
+    assert light.samples.shape == (16, 2)
+    assert light.samples.min() >= 0 and light.samples.max() < 1
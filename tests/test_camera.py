@@ -1,8 +1,23 @@
+import multiprocessing
 from math import sqrt
 
-from fancy_ray_tracer import Camera, equal, point, vector
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import (
+    Camera,
+    Canvas,
+    Light,
+    Sphere,
+    World,
+    equal,
+    make_color,
+    point,
+    vector,
+    view_transform,
+)
 from fancy_ray_tracer.constants import PI
-from fancy_ray_tracer.matrices import rotY, translation
+from fancy_ray_tracer.matrices import rotY, scaling, translation
 from fancy_ray_tracer.utils import chain, chain_ops
 
 
@@ -36,3 +51,96 @@ def test_ray_moved_camera():
     r = c.ray_for_pixel(100, 50)
     assert equal(r.origin, point(0, 2, -5))
     assert equal(r.direction, vector(sqrt(2) / 2, 0, -sqrt(2) / 2))
+
+
+def test_ray_sub_pixel():
+    c = Camera(201, 101, PI / 2)
+    assert c.ray_for_pixel(100, 50, 0.5, 0.5) == c.ray_for_pixel(100, 50)
+    r = c.ray_for_pixel(99, 50, 1.5, 0.5)
+    assert equal(r.direction, vector(0, 0, -1))
+
+
+def adaptive_scene():
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s])
+    c = Camera(11, 11, PI / 3)
+    c.set_transform(view_transform(
+        point(0, 0, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def test_render_adaptive():
+    w, c = adaptive_scene()
+    canvas = Canvas((11, 11))
+    samples = c.render_adaptive(w, canvas, max_samples=16, n_jobs=1)
+    assert samples.shape == (11, 11)
+    # the background far from the sphere needs a single ray
+    assert samples[0, 0] == 1
+    assert samples[10, 10] == 1
+    # the silhouette of the sphere is refined but never over the cap
+    assert samples.max() > 1
+    assert samples.max() <= 16
+    assert canvas.get_pixel(5, 5) != (0, 0, 0)
+
+
+def test_render_adaptive_max_samples():
+    w, c = adaptive_scene()
+    samples = c.render_adaptive(w, Canvas((11, 11)), max_samples=1, n_jobs=1)
+    assert (samples == 1).all()
+
+
+def test_render_merges_shadow_cache_stats(monkeypatch):
+    # two worker processes, each with its own copy of the world
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 4)
+    w, c = adaptive_scene()
+    floor = Sphere()
+    floor.set_transform(chain_ops([translation(0, -101, 0), scaling(100, 100, 100)]))
+    w.add_object(floor)
+    c.render(w, Canvas((11, 11)))
+    stats = w.shadow_cache_stats()
+    # every shadow test looks the cache up once, wherever it ran
+    w.reset_shadow_cache()
+    c.render_sequential(w, Canvas((11, 11)))
+    expected = w.shadow_cache_stats()
+    assert stats["hits"] + stats["misses"] == expected["hits"] + expected["misses"]
+    assert stats["hits"] > 0
+
+
+def test_render_progressive():
+    w, c = adaptive_scene()
+    frames = list(c.render_progressive(w, start_stride=4))
+    # strides 4, 2 and 1
+    assert len(frames) == 3
+    for frame in frames:
+        assert frame.shape == (11, 11, 3)
+    # the first pass fills each 4x4 block with its corner pixel
+    assert np.array_equal(frames[0][0:4, 0:4], np.broadcast_to(frames[0][0, 0], (4, 4, 3)))
+    canvas = Canvas((11, 11))
+    c.render_sequential(w, canvas)
+    expected = np.array([[w.trace(c.ray_for_pixel(x, y)) for x in range(11)] for y in range(11)])
+    assert np.allclose(frames[-1], expected)
+    # the pixels traced in a pass keep their color
+    assert np.allclose(frames[1][::2, ::2], expected[::2, ::2])
+
+
+def test_render_progressive_stride():
+    w, c = adaptive_scene()
+    for stride in (0, -2, 3, 6):
+        with pytest.raises(ValueError):
+            c.render_progressive(w, start_stride=stride)
+    assert len(list(c.render_progressive(w, start_stride=1))) == 1
+
+
+def test_render_passes_cancel():
+    w, c = adaptive_scene()
+    seen = []
+
+    def callback(frame, n):
+        seen.append(n)
+        return n < 1
+
+    canvas = Canvas((11, 11))
+    frame = c.render_passes(w, canvas, callback, start_stride=4)
+    assert seen == [0, 1]
+    assert canvas.get_pixel(5, 5) == tuple(min(int(v * 255), 255) for v in frame[5, 5])
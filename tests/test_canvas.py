@@ -0,0 +1,125 @@
+import numpy as np
+from PIL import Image
+
+from fancy_ray_tracer import (
+    Camera,
+    Canvas,
+    Light,
+    Sphere,
+    TiledCanvas,
+    World,
+    make_color,
+    point,
+    vector,
+    view_transform,
+)
+from fancy_ray_tracer.constants import PI
+
+
+def tiled_scene():
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s])
+    c = Camera(13, 9, PI / 3)
+    c.set_transform(view_transform(point(0, 0, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def test_tiles(tmp_path):
+    canvas = TiledCanvas((13, 9), tmp_path / 'image.npy', tile_size=4)
+    tiles = canvas.tiles()
+    assert len(tiles) == 4 * 3
+    assert tiles[0] == (0, 0, 4, 4)
+    assert tiles[-1] == (12, 8, 13, 9)
+    assert canvas.missing_tiles() == tiles
+
+    canvas.set_pixelf(1, 2, (1, 0.5, 0))
+    assert canvas.get_pixel(1, 2) == (255, 127, 0)
+    canvas.write_tile(tiles[1], np.full((4, 4, 3), 0.5))
+    assert canvas.get_pixel(5, 1) == (127, 127, 127)
+    assert canvas.missing_tiles() == tiles[:1] + tiles[2:]
+
+
+def test_tiled_canvas_resume(tmp_path):
+    path = tmp_path / 'image.npy'
+    canvas = TiledCanvas((13, 9), path, tile_size=4)
+    tile = canvas.tiles()[5]
+    canvas.write_tile(tile, np.ones((4, 4, 3)))
+    assert canvas.is_done(tile)
+    # a crash before the checkpoint loses the tile
+    assert not TiledCanvas((13, 9), path, tile_size=4).is_done(tile)
+    canvas.checkpoint()
+    del canvas
+
+    canvas = TiledCanvas((13, 9), path, tile_size=4)
+    assert canvas.is_done(tile)
+    assert canvas.get_pixel(tile[0], tile[1]) == (255, 255, 255)
+    # another size or tile size starts over
+    canvas = TiledCanvas((13, 9), path, tile_size=3)
+    assert len(canvas.missing_tiles()) == len(canvas.tiles())
+    assert canvas.get_pixel(4, 4) == (0, 0, 0)
+
+
+def test_tiled_canvas_damaged_files(tmp_path):
+    path = tmp_path / 'image.npy'
+    tiles = tmp_path / 'image.npy.tiles.npy'
+    for damage in (lambda: tiles.unlink(),
+                   lambda: tiles.write_bytes(tiles.read_bytes()[:20]),
+                   lambda: path.write_bytes(b'not an array'),
+                   lambda: path.write_bytes(path.read_bytes()[:-10])):
+        canvas = TiledCanvas((13, 9), path, tile_size=4)
+        canvas.write_tile(canvas.tiles()[0], np.ones((4, 4, 3)))
+        canvas.checkpoint()
+        del canvas
+        damage()
+        # the metadata still matches, the canvas starts over
+        canvas = TiledCanvas((13, 9), path, tile_size=4)
+        assert len(canvas.missing_tiles()) == len(canvas.tiles())
+        assert canvas.get_pixel(0, 0) == (0, 0, 0)
+        del canvas
+
+
+def test_render_tiles(tmp_path):
+    w, c = tiled_scene()
+    expected = Canvas((13, 9))
+    c.render_sequential(w, expected)
+
+    canvas = TiledCanvas((13, 9), tmp_path / 'image.npy', tile_size=4)
+    # a render stopped half way only renders what is missing
+    for tile in canvas.tiles()[:6]:
+        canvas.write_tile(tile, c._render_tile(w, tile))
+    c.render_tiles(w, canvas, n_jobs=2, batch=1)
+    assert canvas.missing_tiles() == []
+    for y in range(9):
+        for x in range(13):
+            assert canvas.get_pixel(x, y) == expected.get_pixel(x, y)
+
+    canvas.save_img(tmp_path / 'image.ppm')
+    canvas.save_img(tmp_path / 'image.png')
+    for name in ('image.ppm', 'image.png'):
+        with Image.open(tmp_path / name) as image:
+            assert image.size == (13, 9)
+            assert np.array_equal(np.asarray(image), np.asarray(expected.canvas))
+
+
+def test_render_resumable(tmp_path):
+    w, c = tiled_scene()
+    expected = Canvas((13, 9))
+    c.render_sequential(w, expected)
+    path = tmp_path / 'checkpoint.npy'
+    canvas = Canvas((13, 9))
+    c.render_resumable(w, canvas, path, n_jobs=1, tile_size=4)
+    assert np.array_equal(np.asarray(canvas.canvas), np.asarray(expected.canvas))
+
+    # the same scene built again renders nothing
+    w2, c2 = tiled_scene()
+    tiled = TiledCanvas((13, 9), path, 4)
+    tiled.set_pixel(0, 0, (1, 2, 3))
+    c2.render_tiles(w2, tiled, n_jobs=1)
+    assert tiled.get_pixel(0, 0) == (1, 2, 3)
+
+    # another camera starts over
+    c2.set_transform(view_transform(point(0, 0, -6), point(0, 0, 0), vector(0, 1, 0)))
+    c2.render_tiles(w2, tiled, n_jobs=1)
+    assert tiled.get_pixel(0, 0) != (1, 2, 3)
+    assert tiled.missing_tiles() == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from fancy_ray_tracer.constants import EPSILON
+from fancy_ray_tracer.primitives import (
+    cone_intersect_fallback,
+    cylinder_intersect_fallback,
+    sphere_intersect_fallback,
+)
+
+_shapes = pytest.importorskip("fancy_ray_tracer.compiled._shapes")
+
+RAYS = 2000
+
+
+def random_rays(seed):
+    rng = np.random.default_rng(seed)
+    origins = rng.uniform(-3, 3, (RAYS, 4))
+    origins[:, 3] = 1
+    directions = rng.normal(size=(RAYS, 4))
+    directions[:, 3] = 0
+    # aim half of the rays to the origin so most of them hit something
+    directions[::2, :3] = rng.uniform(-0.5, 0.5, (RAYS // 2, 3)) - origins[::2, :3]
+    # rays parallel to the axis hit the caps and the degenerate branches
+    directions[1::10, [0, 2]] = 0
+    directions[3::10, 1] = np.sqrt(
+        directions[3::10, 0]**2 + directions[3::10, 2]**2)
+    return origins, directions
+
+
+def assert_same(expected, result):
+    assert len(expected) == len(result)
+    assert np.allclose(expected, result, rtol=1e-9, atol=1e-9)
+
+
+def test_sphere_parity():
+    origins, directions = random_rays(0)
+    hits = 0
+    for o, d in zip(origins, directions):
+        expected = sphere_intersect_fallback(o, d)
+        assert_same(expected, _shapes.sphere_intersect(o, d))
+        hits += len(expected) != 0
+    assert hits > RAYS / 4
+
+
+@pytest.mark.parametrize("minimum,maximum,closed", [
+    (-np.inf, np.inf, False), (-1, 1, False), (-1, 1, True), (0, 2, True)])
+def test_cylinder_parity(minimum, maximum, closed):
+    origins, directions = random_rays(1)
+    hits = 0
+    for o, d in zip(origins, directions):
+        expected = cylinder_intersect_fallback(
+            o, d, minimum, maximum, closed, EPSILON)
+        assert_same(expected, _shapes.cylinder_intersect(
+            o, d, minimum, maximum, closed, EPSILON))
+        hits += len(expected) != 0
+    assert hits > RAYS / 4
+
+
+@pytest.mark.parametrize("minimum,maximum,closed", [
+    (-np.inf, np.inf, False), (-1, 1, False), (-1, 1, True), (-0.5, 0.5, True)])
+def test_cone_parity(minimum, maximum, closed):
+    origins, directions = random_rays(2)
+    hits = 0
+    for o, d in zip(origins, directions):
+        expected = cone_intersect_fallback(
+            o, d, minimum, maximum, closed, EPSILON)
+        assert_same(expected, _shapes.cone_intersect(
+            o, d, minimum, maximum, closed, EPSILON))
+        hits += len(expected) != 0
+    assert hits > RAYS / 8
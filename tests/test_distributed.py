@@ -0,0 +1,127 @@
+import time
+from multiprocessing import Process
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from fancy_ray_tracer import (
+    Camera,
+    Canvas,
+    Light,
+    Sphere,
+    TiledCanvas,
+    World,
+    make_color,
+    point,
+    vector,
+    view_transform,
+)
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.distributed import Coordinator, TileBoard, start_workers
+
+AUTHKEY = b'test'
+
+
+def scene():
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s])
+    c = Camera(13, 9, PI / 3)
+    c.set_transform(view_transform(point(0, 0, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def expected_image(w, c):
+    canvas = Canvas((13, 9))
+    c.render_sequential(w, canvas)
+    return np.asarray(canvas.canvas)
+
+
+def dead_worker(address):
+    # takes a tile and dies without an answer
+    conn = Client(address, authkey=AUTHKEY)
+    conn.recv_bytes()
+    conn.recv()
+    conn.close()
+
+
+def stuck_worker(address):
+    conn = Client(address, authkey=AUTHKEY)
+    conn.recv_bytes()
+    conn.recv()
+    time.sleep(60)
+
+
+def stop(processes):
+    for p in processes:
+        p.join(5)
+        if p.is_alive():
+            p.terminate()
+            p.join()
+
+
+def test_tile_board():
+    board = TileBoard([(0, 0, 1, 1), (1, 0, 2, 1)], timeout=0.05)
+    first = board.take()
+    second = board.take()
+    assert first != second
+    board.fail(first)
+    assert board.take() == first
+    assert board.finish(first)
+    # the slow tile is handed out again and finished once
+    assert board.take() == second
+    assert board.finish(second)
+    assert not board.finish(second)
+    assert board.take() is None
+    assert board.wait(0)
+
+
+def test_tile_board_owner():
+    board = TileBoard([(0, 0, 1, 1)], timeout=0.05)
+    tile = board.take('slow')
+    # the slow worker's tile goes to another one, then the slow one dies
+    assert board.take('fast') == tile
+    board.fail(tile, 'slow')
+    assert board.running and not board.pending
+    board.fail(tile, 'fast')
+    assert board.pending[0] == tile and not board.running
+    assert board.take('other') == tile
+    assert board.finish(tile)
+    board.fail(tile, 'other')
+    assert not board.pending
+    assert board.wait(0)
+
+
+def test_distributed_render():
+    w, c = scene()
+    canvas = Canvas((13, 9))
+    coordinator = Coordinator(w, c, canvas, authkey=AUTHKEY, tile_size=4)
+    workers = start_workers(coordinator.address, 2, AUTHKEY)
+    try:
+        assert coordinator.render(timeout=60)
+    finally:
+        stop(workers)
+    assert np.array_equal(np.asarray(canvas.canvas), expected_image(w, c))
+
+
+def test_distributed_reassign(tmp_path):
+    w, c = scene()
+    canvas = TiledCanvas((13, 9), tmp_path / 'image.npy', tile_size=4)
+    coordinator = Coordinator(w, c, canvas, authkey=AUTHKEY, tile_size=4, timeout=0.5)
+    # the broken workers connect first so they get tiles
+    broken = [Process(target=dead_worker, args=(coordinator.address,)),
+              Process(target=stuck_worker, args=(coordinator.address,))]
+    for p in broken:
+        p.start()
+    time.sleep(0.2)
+    workers = start_workers(coordinator.address, 1, AUTHKEY)
+    try:
+        assert coordinator.render(timeout=60)
+    finally:
+        stop(workers)
+        for p in broken:
+            p.terminate()
+            p.join()
+    assert canvas.missing_tiles() == []
+    image = np.array([[canvas.get_pixel(x, y) for x in range(13)] for y in range(9)])
+    assert np.array_equal(image, expected_image(w, c))
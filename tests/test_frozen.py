@@ -0,0 +1,203 @@
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import (
+    Camera,
+    Canvas,
+    Light,
+    Sphere,
+    World,
+    make_color,
+    point,
+    scaling,
+    vector,
+    view_transform,
+)
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.frozen import CONE, CUBE, CYLINDER, PLANE, SPHERE, TRIANGLE, freeze
+from fancy_ray_tracer.materials import ChessPattern, StripePattern
+from fancy_ray_tracer.matrices import rotY, translation
+from fancy_ray_tracer.primitives import (
+    CSG,
+    CSGOperation,
+    Cone,
+    Cube,
+    Cylinder,
+    Group,
+    Plane,
+    Triangle,
+)
+
+
+def frozen_scene():
+    floor = Plane()
+    floor.material.pattern = ChessPattern(
+        make_color(1, 1, 1), make_color(0.2, 0.2, 0.2))
+    floor.material.reflective = 0.3
+    floor.set_transform(translation(0, -1, 0))
+
+    ball = Sphere()
+    ball.material.color = make_color(1, 0.2, 0.2)
+    ball.material.pattern = StripePattern(
+        make_color(1, 0.2, 0.2), make_color(0.2, 0.2, 1))
+    ball.material.pattern.transform = scaling(0.2, 0.2, 0.2)
+    ball.material.pattern.inv_transform = scaling(5, 5, 5)
+    ball.set_transform(translation(-1.5, 0, 0))
+
+    box = Cube()
+    box.material.reflective = 0.5
+    box.set_transform(translation(1.5, -0.5, 1).dot(scaling(0.5, 0.5, 0.5)))
+
+    cylinder = Cylinder(0, 1, True)
+    cylinder.set_transform(translation(0, -1, 2))
+    cone = Cone(-1, 0, True)
+    cone.set_transform(translation(0, 1, 3))
+    triangle = Triangle(point(0, 0, 0), point(1, 0, 0), point(0, 1, 0))
+
+    group = Group([cylinder, cone, triangle])
+    group.set_transform(rotY(PI / 6))
+
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)),
+              [floor, ball, box, group])
+    c = Camera(24, 16, PI / 3)
+    c.set_transform(view_transform(
+        point(0, 1.5, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def test_freeze_kinds():
+    w, _ = frozen_scene()
+    scene = freeze(w)
+    assert len(scene) == 6
+    assert sorted(scene.kinds.tolist()) == sorted(
+        [PLANE, SPHERE, CUBE, CYLINDER, CONE, TRIANGLE])
+    # the plane is the only unbounded primitive
+    assert scene.kinds[scene.unbounded].tolist() == [PLANE]
+    assert len(scene.lights) == 1
+
+
+def test_freeze_group_transform():
+    s = Sphere()
+    s.set_transform(translation(1, 0, 0))
+    g = Group([s])
+    g.set_transform(translation(0, 2, 0))
+    scene = freeze(World(Light(point(0, 10, 0), make_color(1, 1, 1)), [g]))
+    assert np.allclose(scene.bounds_min[0], (0, 1, -1))
+    assert np.allclose(scene.bounds_max[0], (2, 3, 1))
+
+
+def test_freeze_bvh():
+    spheres = []
+    for i in range(20):
+        s = Sphere()
+        s.set_transform(translation(3 * i, (i % 3) * 2, 0))
+        spheres.append(s)
+    scene = freeze(World(Light(point(0, 10, 0), make_color(1, 1, 1)), spheres))
+    assert sorted(scene.prim_order.tolist()) == list(range(20))
+    for n in range(len(scene.node_left)):
+        prims = scene.prim_order[scene.node_start[n]:scene.node_start[n] + scene.node_count[n]]
+        assert (scene.bounds_min[prims] >= scene.node_min[n] - 1e-9).all()
+        assert (scene.bounds_max[prims] <= scene.node_max[n] + 1e-9).all()
+        if scene.node_count[n] == 0:
+            for child in (scene.node_left[n], scene.node_right[n]):
+                assert (scene.node_min[child] >= scene.node_min[n] - 1e-9).all()
+                assert (scene.node_max[child] <= scene.node_max[n] + 1e-9).all()
+
+
+def test_freeze_csg():
+    c = CSG(CSGOperation.union, Sphere(), Cube())
+    with pytest.raises(TypeError):
+        freeze(World(Light(point(0, 10, 0), make_color(1, 1, 1)), [c]))
+
+
+def test_render_native():
+    pytest.importorskip("fancy_ray_tracer.compiled._render")
+    w, c = frozen_scene()
+    colors = c.render_native(w, Canvas((c.hsize, c.vsize)), tile_size=5)
+    expected = np.array([[w.trace(c.ray_for_pixel(x, y))[:3] for x in range(c.hsize)]
+                         for y in range(c.vsize)])
+    assert colors.shape == (c.vsize, c.hsize, 3)
+    assert np.allclose(colors, expected, atol=1e-6)
+
+
+def test_world_compile():
+    w, _ = frozen_scene()
+    scene = w.compile()
+    assert w.compile() is scene
+    assert not scene.inv_transforms.flags.writeable
+    with pytest.raises(ValueError):
+        scene.materials[0, 0] = 0
+    w.add_object(Sphere())
+    assert w.compile() is not scene
+    assert len(w.compile()) == len(scene) + 1
+    scene = w.compile()
+    w.invalidate()
+    assert w.compile() is not scene
+
+
+def bvh_contains(scene):
+    for n in range(len(scene.node_left)):
+        prims = scene.prim_order[scene.node_start[n]:scene.node_start[n] + scene.node_count[n]]
+        if not ((scene.bounds_min[prims] >= scene.node_min[n] - 1e-9).all()
+                and (scene.bounds_max[prims] <= scene.node_max[n] + 1e-9).all()):
+            return False
+        if scene.node_count[n] == 0:
+            for child in (scene.node_left[n], scene.node_right[n]):
+                if not ((scene.node_min[child] >= scene.node_min[n] - 1e-9).all()
+                        and (scene.node_max[child] <= scene.node_max[n] + 1e-9).all()):
+                    return False
+    return True
+
+
+def test_world_refit():
+    spheres = []
+    for i in range(20):
+        s = Sphere()
+        s.set_transform(translation(3 * i, 0, 0))
+        spheres.append(s)
+    w = World(Light(point(0, 10, 0), make_color(1, 1, 1)), spheres + [Plane()])
+    scene = w.compile()
+    assert scene.refits == 0
+
+    # a small move keeps the topology
+    for s in spheres:
+        s.set_transform(translation(s.transform[0, 3], 0.5, 0))
+    refitted = w.refit()
+    assert w.compile() is refitted
+    assert refitted.refits == 1
+    assert refitted.node_left is scene.node_left
+    assert refitted.prim_order is scene.prim_order
+    assert np.allclose(refitted.inv_transforms, freeze(w).inv_transforms)
+    assert np.allclose(refitted.node_min[0], (-1, -0.5, -1))
+    assert bvh_contains(refitted)
+    assert not refitted.node_min.flags.writeable
+
+    # reversing the order makes every node span the whole row
+    for n, s in enumerate(spheres):
+        s.set_transform(translation(3 * (19 - n) if n % 2 else 3 * n, 0, 0))
+    rebuilt = w.refit()
+    assert rebuilt.refits == 0
+    assert rebuilt.cost == rebuilt.build_cost
+    assert bvh_contains(rebuilt)
+
+    # new objects always build a new tree
+    w.add_object(Sphere())
+    assert w.refit().refits == 0
+
+
+def test_world_refit_kind_change():
+    cylinder = Cylinder(0, 1)
+    w = World(Light(point(0, 10, 0), make_color(1, 1, 1)), [Sphere(), cylinder, Sphere()])
+    scene = w.compile()
+    # same number of objects but another kind of primitive
+    w.objects[0] = Cube()
+    rebuilt = w.refit()
+    assert rebuilt.refits == 0
+    assert rebuilt.node_left is not scene.node_left
+    assert rebuilt.kinds[0] == CUBE
+    # a bounded cylinder that becomes infinite moves out of the BVH
+    cylinder.minimum = -np.inf
+    unbounded = w.refit()
+    assert unbounded.refits == 0
+    assert list(unbounded.unbounded) == [1]
+    assert bvh_contains(unbounded)
@@ -0,0 +1,59 @@
+import pytest
+
+from fancy_ray_tracer import (
+    Camera,
+    ChessPattern,
+    Group,
+    Light,
+    Sphere,
+    World,
+    make_color,
+    make_csg,
+    point,
+    translation,
+)
+from fancy_ray_tracer.constants import PI, CSGOperation
+from fancy_ray_tracer.hashing import canonical_hash, scene_hash
+
+
+def build():
+    s = Sphere()
+    s.set_transform(translation(1, 0, 0))
+    s.material.pattern = ChessPattern(make_color(0, 0, 0), make_color(1, 1, 1))
+    g = Group([s, make_csg(CSGOperation.difference, Sphere(), Sphere())])
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [g])
+    return w, Camera(20, 10, PI / 3)
+
+
+def test_scene_hash_ignores_ids():
+    w1, c1 = build()
+    w2, c2 = build()
+    assert w1.objects[0].id != w2.objects[0].id
+    assert scene_hash(w1, c1) == scene_hash(w2, c2)
+
+
+def test_scene_hash_changes():
+    w, c = build()
+    key = scene_hash(w, c)
+    assert scene_hash(w, c, (20, 10)) != key
+    assert scene_hash(w, Camera(20, 11, PI / 3)) != key
+    w.objects[0].shapes[0].material.ambient = 0.5
+    assert scene_hash(w, c) != key
+    w, c = build()
+    w.objects[0].shapes[0].set_transform(translation(2, 0, 0))
+    assert scene_hash(w, c) != key
+
+
+def test_canonical_hash_values():
+    assert canonical_hash(1) != canonical_hash(1.0)
+    assert canonical_hash((1, 2)) != canonical_hash([1, 2])
+    assert canonical_hash({'a': 1, 'b': 2}) == canonical_hash({'b': 2, 'a': 1})
+
+
+def test_canonical_hash_cycle():
+    class Node:
+        def __init__(self):
+            self.next = self
+
+    with pytest.raises(ValueError):
+        canonical_hash(Node())
@@ -0,0 +1,169 @@
+import io
+
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import *
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.frozen import freeze
+from fancy_ray_tracer.parsers import WavefrontOBJ
+from fancy_ray_tracer.primitives import InstanceHit
+
+OBJ = """
+v -1 0 0
+v 1 0 0
+v 0 1 0
+vn 0 0 -1
+vn 0 0 -1
+vn 0 0 -1
+f 1//1 2//2 3//3
+"""
+
+
+def test_instance_intersect():
+    s = Sphere()
+    s.material.color = make_color(1, 0, 0)
+    i = Instance(s, translation(5, 0, 0))
+    r = Ray(point(5, 0, -5), vector(0, 0, 1))
+    xs = r.intersect(i)
+    assert len(xs) == 2
+    assert np.isclose(xs[0].t, 4) and np.isclose(xs[1].t, 6)
+    assert isinstance(xs[0].object, InstanceHit)
+    assert xs[0].object in i
+    assert equal(xs[0].object.color_at(point(5, 0, -1)), make_color(1, 0, 0))
+    assert len(Ray(point(0, 0, -5), vector(0, 0, 1)).intersect(i)) == 0
+
+
+def test_instance_normal_and_material():
+    s = Sphere()
+    s.set_transform(scaling(1, 2, 1))
+    m = make_material()
+    m.color = make_color(0, 1, 0)
+    i = Instance(s, translation(0, 0, 3), m)
+    g = Group([i])
+    g.set_transform(rotY(PI / 2))
+
+    # the same shape without instancing
+    copy = Sphere()
+    copy.set_transform(scaling(1, 2, 1))
+    inner = Group([copy])
+    inner.set_transform(translation(0, 0, 3))
+    expected = Group([inner])
+    expected.set_transform(rotY(PI / 2))
+
+    r = Ray(point(-5, 0.5, 0.2), vector(1, 0, 0))
+    xs = r.intersect(g)
+    ys = r.intersect(expected)
+    assert len(xs) == len(ys) == 2
+    for x, y in zip(xs, ys):
+        assert np.isclose(x.t, y.t)
+        p = r.position(x.t)
+        assert equal(normal_at(x.object, p, x), normal_at(y.object, p, y))
+    assert equal(xs[0].object.color_at(r.position(xs[0].t)), make_color(0, 1, 0))
+
+
+def test_instance_mesh_normals():
+    mesh = WavefrontOBJ(io.StringIO(OBJ)).parse()
+    a = Instance(mesh, translation(-3, 0, 0))
+    b = Instance(mesh, chain_ops([translation(3, 0, 0), rotY(PI)]))
+    assert a.geometry is b.geometry
+    r = Ray(point(-3, 0.25, -5), vector(0, 0, 1))
+    xs = r.intersect(a)
+    assert len(xs) == 1
+    assert equal(normal_at(xs[0].object, r.position(xs[0].t), xs[0]), vector(0, 0, -1))
+    r = Ray(point(3, 0.25, 5), vector(0, 0, -1))
+    xs = r.intersect(b)
+    assert len(xs) == 1
+    assert equal(normal_at(xs[0].object, r.position(xs[0].t), xs[0]), vector(0, 0, 1))
+
+
+def test_instance_box():
+    s = Sphere()
+    s.set_transform(scaling(2, 1, 1))
+    box = make_box(Instance(s, translation(1, 0, 0)))
+    assert equal(box.bound_min, point(-2, -1, -1))
+    assert equal(box.bound_max, point(2, 1, 1))
+    assert equal(box.transform, translation(1, 0, 0))
+
+
+def test_instance_world_and_freeze():
+    teapot = Sphere()
+    teapot.set_transform(scaling(0.5, 0.5, 0.5))
+    red = make_material()
+    red.color = make_color(1, 0, 0)
+    light = Light(point(-10, 10, -10), make_color(1, 1, 1))
+    instances = World(light, [make_box(Instance(teapot, translation(x, 0, 0), red if x > 0 else None))
+                              for x in (-1, 1)])
+    copies = []
+    for x in (-1, 1):
+        s = Sphere()
+        s.set_transform(chain_ops([translation(x, 0, 0), scaling(0.5, 0.5, 0.5)]))
+        if x > 0:
+            s.material = red
+        copies.append(s)
+    copies = World(light, copies)
+
+    c = Camera(12, 8, PI / 3)
+    c.set_transform(view_transform(point(0, 0, -5), point(0, 0, 0), vector(0, 1, 0)))
+    for y in range(8):
+        for x in range(12):
+            r = c.ray_for_pixel(x, y)
+            assert equal(instances.trace(r), copies.trace(r))
+
+    a = freeze(instances)
+    b = freeze(copies)
+    # the geometry is frozen once, in the space of the instances
+    assert len(a) == 1 and len(b) == 2
+    assert np.allclose(a.inv_transforms[0], scaling(2, 2, 2))
+    assert np.allclose(a.instance_inv, [translation(1, 0, 0), translation(-1, 0, 0)])
+    assert a.instance_geometry.tolist() == [0, 0]
+    assert np.allclose(a.bounds_min[1:], b.bounds_min)
+    assert np.allclose(a.bounds_max[1:], b.bounds_max)
+    # the geometry keeps its material and its pattern space, a material of
+    # the instance has its patterns in the space of the instance
+    assert a.instance_materials[0] == -1
+    assert np.allclose(a.materials[a.instance_materials[1]], b.materials[b.material_ids[1]])
+    assert np.allclose(a.pattern_transforms[0], scaling(2, 2, 2))
+    assert np.allclose(a.instance_patterns[1], translation(-1, 0, 0))
+
+
+def test_freeze_shared_mesh():
+    mesh = WavefrontOBJ(io.StringIO(OBJ)).parse()
+    light = Light(point(-10, 10, -10), make_color(1, 1, 1))
+    w = World(light, [Instance(mesh, translation(2 * x, 0, 0)) for x in range(200)])
+    scene = freeze(w)
+    # memory grows with the unique geometry, the top level tree has one
+    # leaf per instance
+    assert len(scene) == 1
+    assert len(scene.instance_inv) == 200
+    top = scene.trees[0]
+    leaves = scene.node_count[top[0]:top[0] + top[1]] > 0
+    starts = scene.node_start[top[0]:top[0] + top[1]][leaves]
+    counts = scene.node_count[top[0]:top[0] + top[1]][leaves]
+    items = np.concatenate([scene.prim_order[s:s + n] for s, n in zip(starts, counts)])
+    assert sorted(items.tolist()) == list(range(1, 201))
+
+
+def test_render_native_instances():
+    pytest.importorskip("fancy_ray_tracer.compiled._render")
+    mesh = WavefrontOBJ(io.StringIO(OBJ)).parse()
+    s = Sphere()
+    s.set_transform(scaling(0.5, 0.5, 0.5))
+    s.material.pattern = StripePattern(make_color(1, 0, 0), make_color(0, 0, 1))
+    s.material.pattern.set_transform(scaling(0.2, 1, 1))
+    floor = Plane()
+    floor.set_transform(translation(0, -1, 0))
+    green = make_material()
+    green.color = make_color(0, 1, 0)
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [
+        floor,
+        Instance(s, translation(-1, 0, 0)),
+        Instance(s, chain_ops([translation(1, 0, 0), rotY(PI / 3)]), green),
+        make_box(Instance(mesh, chain_ops([translation(0, 0, 1), scaling(2, 2, 2)]))),
+    ])
+    c = Camera(16, 12, PI / 3)
+    c.set_transform(view_transform(point(0, 1, -5), point(0, 0, 0), vector(0, 1, 0)))
+    colors = c.render_native(w, Canvas((c.hsize, c.vsize)), tile_size=5)
+    expected = np.array([[w.trace(c.ray_for_pixel(x, y))[:3] for x in range(c.hsize)]
+                         for y in range(c.vsize)])
+    assert np.allclose(colors, expected, atol=1e-6)
@@ -0,0 +1,132 @@
+import numpy as np
+
+from fancy_ray_tracer import (
+    Camera,
+    Canvas,
+    Light,
+    Ray,
+    Sphere,
+    World,
+    make_color,
+    point,
+    vector,
+    view_transform,
+)
+from fancy_ray_tracer import instrumentation
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.primitives import BoundingBox, Plane, make_box
+
+
+def heatmap_scene():
+    s = Sphere()
+    s.material.reflective = 0.5
+    floor = Plane()
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [make_box(s), floor])
+    w.min_contribution = 0
+    c = Camera(9, 9, PI / 3)
+    c.set_transform(view_transform(
+        point(0, 0.5, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def test_heatmap(tmp_path):
+    w, c = heatmap_scene()
+    canvas = Canvas((9, 9))
+    maps = c.render_heatmap(w, canvas, tmp_path)
+    assert set(maps) == {'rays', 'bbox_tests', 'primitive_tests', 'time'}
+    for name, values in maps.items():
+        assert values.shape == (9, 9)
+        assert np.array_equal(np.load(tmp_path / f'{name}.npy'), values)
+        assert (tmp_path / f'{name}.png').exists()
+    # every pixel traces a primary ray and tests the box once per ray
+    assert (maps['rays'] >= 1).all()
+    assert (maps['bbox_tests'] >= 1).all()
+    assert (maps['time'] > 0).all()
+    # the reflective sphere in the center costs more than the floor
+    assert maps['rays'][4, 4] > maps['rays'][8, 0]
+    assert not instrumentation.enabled()
+
+
+def test_disabled_is_unpatched():
+    original = BoundingBox.__dict__['intersect']
+    instrumentation.enable()
+    assert BoundingBox.__dict__['intersect'] is not original
+    instrumentation.disable()
+    assert BoundingBox.__dict__['intersect'] is original
+
+
+def test_false_color():
+    image = instrumentation.false_color(np.array([[0, 1], [2, 4]]))
+    assert image.shape == (2, 2, 3)
+    assert image.dtype == np.uint8
+    assert tuple(image[0, 0]) == (0, 0, 0)
+    assert tuple(image[1, 1]) == (255, 255, 255)
+    assert not instrumentation.false_color(np.zeros((2, 2))).any()
+
+
+def stats_scene():
+    s = Sphere()
+    s.material.reflective = 0.5
+    box = make_box(s)
+    floor = Plane()
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [box, floor])
+    w.min_contribution = 0
+    return w, box, floor
+
+
+def test_stats_counters():
+    w, box, floor = stats_scene()
+    instrumentation.enable()
+    try:
+        instrumentation.reset()
+        w.trace(Ray(point(0, 0, -5), vector(0, 0, 1)))
+        summary = instrumentation.summary()
+        report = instrumentation.report()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    rays = summary['rays']
+    assert rays['primary'] == 1
+    assert rays['reflected'] >= 1
+    assert rays['shadow'] >= 1
+    assert rays['refracted'] == 0
+    assert rays['total'] == rays['primary'] + rays['reflected'] + rays['shadow']
+    objects = summary['objects']
+    assert objects[box.id]['type'] == 'BoundingBox'
+    assert objects[box.id]['intersect_calls'] == rays['total']
+    assert objects[box.id]['intersect_hits'] >= 1
+    assert objects[box.id]['bbox_tests'] == rays['total']
+    assert objects[box.id]['bbox_tests'] - objects[box.id]['bbox_rejects'] \
+        == objects[box.shape.id]['primitive_tests']
+    assert summary['types']['Plane']['primitive_tests'] == objects[floor.id]['primitive_tests']
+    assert 'Sphere' in report
+
+
+def test_stats_merge_render():
+    w, _, _ = stats_scene()
+    c = Camera(6, 6, PI / 3)
+    c.set_transform(view_transform(
+        point(0, 0.5, -5), point(0, 0, 0), vector(0, 1, 0)))
+    instrumentation.enable()
+    try:
+        instrumentation.reset()
+        c.render(w, Canvas((6, 6)))
+        summary = instrumentation.summary()
+        instrumentation.reset()
+        c.render_sequential(w, Canvas((6, 6)))
+        expected = instrumentation.summary()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+    assert summary['rays']['primary'] == 36
+    assert summary == expected
+
+
+def test_collect():
+    w, _, _ = stats_scene()
+    with instrumentation.collect() as stats:
+        w.trace(Ray(point(0, 0, -5), vector(0, 0, 1)))
+    assert stats.rays >= 2
+    assert instrumentation.STATS.rays == 0
+    assert not instrumentation.enabled()
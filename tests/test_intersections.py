@@ -1,10 +1,27 @@
 from math import sqrt
 
-from fancy_ray_tracer import Intersection, Ray, Sphere, point, scaling, vector
+import pytest
+
+from fancy_ray_tracer import (
+    Cone,
+    Cube,
+    Cylinder,
+    Group,
+    Intersection,
+    IntersectionBuffer,
+    Ray,
+    Sphere,
+    Triangle,
+    World,
+    make_box,
+    point,
+    scaling,
+    vector,
+)
 from fancy_ray_tracer.constants import ATOL, EPSILON
 from fancy_ray_tracer.matrices import translation
-from fancy_ray_tracer.primitives import Plane, glass_sphere
-from fancy_ray_tracer.ray import Computations
+from fancy_ray_tracer.primitives import Plane, TriangleMesh, glass_sphere
+from fancy_ray_tracer.ray import Computations, hit_sorted
 from fancy_ray_tracer.utils import equal
 from fancy_ray_tracer.world import schlick
 
@@ -181,6 +198,49 @@ def test_refraction_idex():
         assert cmp.n2 == n2
 
 
+def test_refraction_index_equal_intersection():
+    A = glass_sphere()
+    A.set_transform(scaling(2, 2, 2))
+    B = glass_sphere()
+    B.material.refractive_index = 2.0
+    r = Ray(point(0, 0, -4), vector(0, 0, 1))
+    xs = [Intersection(2, A), Intersection(3, B),
+          Intersection(5, B), Intersection(6, A)]
+    # an equal intersection that is not in the list still finds its place
+    cmp = Computations(Intersection(5, B), r, xs)
+    assert cmp.n1 == 2.0
+    assert cmp.n2 == 1.5
+
+
+def test_refraction_index_nested_bubbles():
+    shells = []
+    for n in range(50):
+        s = glass_sphere()
+        s.set_transform(scaling(50 - n, 50 - n, 50 - n))
+        s.material.refractive_index = 1.0 + n / 100
+        shells.append(s)
+    r = Ray(point(0, 0, -100), vector(0, 0, 1))
+    xs = [Intersection(100 - (50 - n), s) for n, s in enumerate(shells)]
+    xs += [Intersection(100 + (50 - n), s)
+           for n, s in reversed(list(enumerate(shells)))]
+    cmp = Computations(xs[49], r, xs)
+    assert cmp.n1 == 1.48
+    assert cmp.n2 == 1.49
+    cmp = Computations(xs[50], r, xs)
+    assert cmp.n1 == 1.49
+    assert cmp.n2 == 1.48
+
+
+def test_refraction_index_opaque():
+    A = Sphere()
+    A.material.refractive_index = 1.5
+    r = Ray(point(0, 0, -4), vector(0, 0, 1))
+    xs = [Intersection(3, A), Intersection(5, A)]
+    cmp = Computations(xs[0], r, xs)
+    assert cmp.n1 == 1.0
+    assert cmp.n2 == 1.0
+
+
 def test_total_internal_reflection():
     s = glass_sphere()
     r = Ray(point(0, 0, sqrt(2) / 2), vector(0, 1, 0))
@@ -206,3 +266,76 @@ def test_small_view_angle():
     cmp = Computations(xs[0], r, xs)
     reflectance = schlick(cmp.eyev, cmp.normalv, cmp.n1, cmp.n2)
     assert abs(reflectance - 0.48873) < EPSILON
+
+
+def test_intersection_buffer():
+    s = Sphere()
+    xs = IntersectionBuffer(2)
+    xs.append(5, s)
+    xs.append(-3, s)
+    xs.append(1, s, 0.25, 0.5)
+    xs.append(2, Plane())
+    assert len(xs) == 4
+    xs.sort()
+    assert list(xs.t[:len(xs)]) == [-3, 1, 2, 5]
+    assert xs[1].object is s
+    assert xs[1].u == 0.25 and xs[1].v == 0.5
+    assert xs[0].u is None
+    assert xs[1] is xs[1]
+    assert xs.hit() is xs[1]
+    assert hit_sorted(xs) is xs[1]
+    assert len(xs.objects) == 2
+
+
+def test_intersection_buffer_miss():
+    xs = IntersectionBuffer()
+    xs.append(-1, Sphere())
+    assert hit_sorted(xs) is None
+    xs.clear()
+    assert len(xs) == 0
+    assert hit_sorted(xs) is None
+
+
+def test_world_intersection_buffer():
+    s1 = Sphere()
+    s2 = Sphere()
+    s2.set_transform(scaling(0.5, 0.5, 0.5))
+    w = World(objects=[s1, s2])
+    r = Ray(point(0, 0, -5), vector(0, 0, 1))
+    buffer = IntersectionBuffer()
+    xs = w.intersec(r, buffer)
+    assert xs is buffer
+    assert [i.t for i in xs] == pytest.approx([4, 4.5, 5.5, 6])
+    assert [i.object for i in xs] == [s1, s2, s2, s1]
+    comps = Computations(hit_sorted(xs), r, xs)
+    expected = Computations(hit_sorted(w.intersec(r)), r, w.intersec(r))
+    assert comps.t == expected.t
+    assert equal(comps.normalv, expected.normalv)
+    # the buffer is reused by the next ray
+    xs = w.intersec(Ray(point(0, 2, -5), vector(0, 0, 1)), buffer)
+    assert len(xs) == 0
+
+
+def test_shapes_intersect_into(monkeypatch):
+    mesh = TriangleMesh([point(-1, -1, 2), point(1, -1, 2), point(0, 1, 2)], [(0, 1, 2)],
+                        [vector(0, 0, -1)], [(0, 0, 0)])
+    cylinder = Cylinder(-1, 1, True)
+    cylinder.set_transform(translation(0, 0, 4))
+    cone = Cone(-1, 0, True)
+    cone.set_transform(translation(0, 0, 7))
+    cube = Cube()
+    cube.set_transform(translation(0, 0, 10))
+    g = Group([Sphere(), cylinder, cone, cube, make_box(mesh)])
+    w = World(objects=[g, Plane(), Triangle(point(-1, -1, 12), point(1, -1, 12), point(0, 1, 12))])
+    r = Ray(point(0.1, 0, -5), vector(0, 0, 1))
+    expected = w.intersec(r)
+
+    # the shapes append to the buffer without building intersections
+    monkeypatch.setattr(Sphere, 'intersect', None)
+    monkeypatch.setattr(TriangleMesh, 'intersect', None)
+    xs = w.intersec(r, IntersectionBuffer())
+    assert len(xs) == len(expected) == 8
+    for x, y in zip(xs, expected):
+        assert x.t == pytest.approx(y.t)
+        assert x.u == y.u and x.v == y.v
+        assert x.object.id == y.object.id
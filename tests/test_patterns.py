@@ -1,5 +1,13 @@
+import numpy as np
+
 from fancy_ray_tracer import *
-from fancy_ray_tracer.materials import LinearGradient, StripePattern
+from fancy_ray_tracer.materials import (
+    ChessPattern,
+    DefaultPattern,
+    LinearGradient,
+    RingPatter,
+    StripePattern,
+)
 
 BLACK = make_color(0, 0, 0)
 WHITE = make_color(1, 1, 1)
@@ -36,3 +44,32 @@ def linear_gradient():
     assert equal(p.color_at(point(0.25, 0, 0)), make_color(0.75, 0.75, 0.75))
     assert equal(p.color_at(point(0.5, 0, 0)), make_color(0.5, 0.5, 0.5))
     assert equal(p.color_at(point(0.75, 0, 0)), make_color(0.25, 0.25, 0.25))
+
+
+def random_points(n=200):
+    rng = np.random.default_rng(1)
+    points = np.ones((n, 4))
+    points[:, :3] = rng.uniform(-4, 4, (n, 3))
+    return points
+
+
+def test_colors_at_matches_color_at():
+    points = random_points()
+    patterns = [DefaultPattern(), StripePattern(WHITE, BLACK), LinearGradient(WHITE, BLACK),
+                RingPatter(WHITE, BLACK), ChessPattern(WHITE, BLACK)]
+    for p in patterns:
+        colors = p.colors_at(points)
+        assert colors.shape == (len(points), 3)
+        expected = np.array([p.color_at(x)[:3] for x in points])
+        assert np.allclose(colors, expected)
+
+
+def test_shape_colors_at():
+    points = random_points()
+    obj = Sphere()
+    obj.set_transform(scaling(2, 2, 2))
+    assert np.allclose(obj.colors_at(points), np.tile(obj.material.color, (len(points), 1)))
+    obj.material.pattern = StripePattern(WHITE, BLACK)
+    obj.material.pattern.set_transform(translation(0.5, 0, 0))
+    expected = np.array([obj.color_at(x) for x in points])
+    assert np.allclose(obj.colors_at(points), expected)
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import *
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.primitives import TriangleMesh
+from fancy_ray_tracer.reprojection import FrameHistory, render_reprojected, view_dependent
+
+
+def scene():
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    s.material.specular = 0
+    mirror = Sphere()
+    mirror.set_transform(chain_ops([translation(2, 0, 1), scaling(0.5, 0.5, 0.5)]))
+    mirror.material.reflective = 0.8
+    floor = Plane()
+    floor.set_transform(translation(0, -1, 0))
+    floor.material.specular = 0
+    floor.material.pattern = ChessPattern(make_color(1, 1, 1), make_color(0.2, 0.2, 0.2))
+    floor.material.pattern.set_transform(scaling(4, 4, 4))
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s, mirror, floor])
+    return w, s, mirror
+
+
+def camera(x):
+    c = Camera(24, 16, PI / 3)
+    c.set_transform(view_transform(point(x, 1, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return c
+
+
+def full(world, c):
+    return c._render_tile(world, (0, 0, c.hsize, c.vsize))
+
+
+def test_view_dependent():
+    m = make_material()
+    assert view_dependent(m)
+    m.specular = 0
+    assert not view_dependent(m)
+    m.transparency = 0.5
+    assert view_dependent(m)
+
+
+def test_lookup():
+    c = camera(0)
+    history = FrameHistory(c)
+    for x, y in ((0, 0), (5, 7), (23, 15)):
+        r = c.ray_for_pixel(x, y)
+        assert history.lookup(c, r.position(3)[:3]) == (x, y)
+    assert history.lookup(c, np.array((0, 1, -10.0))) is None
+
+
+def test_still_camera_reuses_everything():
+    w, _, mirror = scene()
+    c = camera(0)
+    first = render_reprojected(w, c)
+    assert first.shaded == np.count_nonzero(first.objects >= 0)
+    assert np.allclose(first.colors, full(w, c))
+    second = render_reprojected(w, c, first)
+    # only the mirror is shaded again
+    number = second.object_ids[mirror.id]
+    assert second.shaded == np.count_nonzero(second.objects == number) > 0
+    assert np.array_equal(second.colors, first.colors)
+
+
+def test_camera_move():
+    w, s, mirror = scene()
+    first = render_reprojected(w, camera(0))
+    c = camera(0.05)
+    second = render_reprojected(w, c, first)
+    expected = full(w, c)[..., :3]
+    assert second.shaded < first.shaded / 4
+    # the reused samples are the colour of a point within a pixel
+    assert np.mean(np.abs(second.colors - expected)) < 0.03
+    mirror_pixels = second.objects == second.object_ids[mirror.id]
+    assert np.allclose(second.colors[mirror_pixels], expected[mirror_pixels])
+    background = second.objects < 0
+    assert np.all(second.colors[background] == 0)
+
+
+def test_disocclusion():
+    w, s, _ = scene()
+    c = camera(0)
+    first = render_reprojected(w, c)
+    # the sphere moves away, what was behind it can't be reused
+    s.set_transform(translation(0, 0, 20))
+    second = render_reprojected(w, c, first)
+    was_sphere = first.objects == first.object_ids[s.id]
+    assert np.allclose(second.colors[was_sphere], full(w, c)[was_sphere])
+
+
+def quad(z, half, color):
+    corners = [point(-half, -half, z), point(half, -half, z), point(half, half, z), point(-half, half, z)]
+    mesh = TriangleMesh(corners, [(0, 1, 2), (0, 2, 3)], [vector(0, 0, -1)], [(0, 0, 0), (0, 0, 0)])
+    mesh.material.color = color
+    mesh.material.ambient = 1
+    mesh.material.diffuse = 0
+    mesh.material.specular = 0
+    return mesh
+
+
+def test_mesh_disocclusion():
+    front = quad(-0.001, 0.5, make_color(1, 1, 1))
+    back = quad(0, 2, make_color(1, 0, 0))
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [front, back])
+    c = camera(0)
+    first = render_reprojected(w, c)
+    assert set(first.object_ids) == {front.id, back.id}
+    # the back mesh is at the same depth, only the object tells it apart
+    front.set_transform(translation(0, 0, 20))
+    second = render_reprojected(w, c, first)
+    was_front = first.objects == first.object_ids[front.id]
+    assert np.any(was_front)
+    assert np.allclose(second.colors[was_front], full(w, c)[was_front][..., :3])
+    assert np.allclose(second.colors[was_front], (1, 0, 0))
+
+
+def test_animation_reproject():
+    w, s, _ = scene()
+    c = camera(0)
+    animation = Animation(w, c, frames=3, fps=1)
+    animation.animate(c, LookAt(Keyframes([(0, (0, 1, -5)), (2, (0.1, 1, -5))]), (0, 0, 0)))
+    frames = {}
+    animation.render(processes=1, reproject=True, callback=lambda n, image: frames.__setitem__(n, image))
+    plain = {}
+    animation.render(processes=1, callback=lambda n, image: plain.__setitem__(n, image))
+    assert np.array_equal(frames[0], plain[0])
+    for n in (1, 2):
+        assert np.mean(np.abs(frames[n].astype(float) - plain[n])) < 0.03 * 255
+
+    animation.animate(s, Motion(translation, 0, 1, 0))
+    with pytest.raises(ValueError):
+        animation.render(callback=print, reproject=True)
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from fancy_ray_tracer.bridson_sampling import (
+    SAMPLES_FORMAT,
+    Bridson_sampling,
+    PoissonDiskCache,
+    hash_shift,
+    poisson_disk_samples,
+    rotate,
+    toroidal_shift,
+)
+from fancy_ray_tracer.utils import equal
+
+
+def min_distance(points):
+    d = ((points[:, None] - points[None, :])**2).sum(axis=2)
+    d[np.diag_indices(len(points))] = np.inf
+    return np.sqrt(d.min())
+
+
+def test_bridson_is_poisson_disk():
+    points = Bridson_sampling(radius=0.1, k=12, seed=3)
+    assert len(points) > 20
+    assert min_distance(points) >= 0.1 - 1e-6
+    assert points.min() >= 0 and points.max() < 1
+
+
+def test_bridson_seeded():
+    a = Bridson_sampling(radius=0.1, k=12, seed=3)
+    b = Bridson_sampling(radius=0.1, k=12, seed=3)
+    assert equal(a, b)
+
+
+def test_cache_persists(tmp_path):
+    cache = PoissonDiskCache(tmp_path)
+    points = cache.get(0.1, 12, 16, seed=1)
+    assert points.shape == (16, 2)
+    assert len(os.listdir(tmp_path)) == 1
+    assert cache.get(0.1, 12, 16, seed=1) is points
+
+    other = PoissonDiskCache(tmp_path)
+    assert equal(other.get(0.1, 12, 16, seed=1), points)
+    assert not equal(other.get(0.1, 12, 16, seed=2), points)
+
+
+def test_cache_whole_set(tmp_path):
+    cache = PoissonDiskCache(tmp_path)
+    points = cache.get(0.1, 12, seed=1)
+    assert equal(points, Bridson_sampling(radius=0.1, k=12, seed=1))
+
+
+def test_toroidal_shift():
+    points = Bridson_sampling(radius=0.1, k=12, seed=3)
+    shifted = toroidal_shift(points, hash_shift(1.0, 2.0, 3.0))
+    assert shifted.min() >= 0 and shifted.max() < 1
+    assert not equal(points, shifted)
+    back = toroidal_shift(shifted, np.subtract(
+        1.0, hash_shift(1.0, 2.0, 3.0)))
+    assert equal(back, points)
+
+
+def test_hash_shift_is_deterministic():
+    assert hash_shift(0.25, 1, 2) == hash_shift(0.25, 1, 2)
+    assert hash_shift(0.25, 1, 2) != hash_shift(0.5, 1, 2)
+    u, v = hash_shift(10, 20, 30)
+    assert 0 <= u < 1 and 0 <= v < 1
+
+
+def test_rotate_keeps_distances():
+    points = Bridson_sampling(radius=0.1, k=12, seed=3)
+    rotated = rotate(points, 1.0)
+    assert equal(min_distance(points), min_distance(rotated))
+    assert equal(rotate(rotated, -1.0), points)
+
+
+def test_default_cache_directory(cache_directory):
+    poisson_disk_samples(0.1, 12, 16, seed=1)
+    names = os.listdir(cache_directory / 'samples')
+    assert names == [f'poisson_v{SAMPLES_FORMAT}_r0.1_k12_n16_s1.npy']
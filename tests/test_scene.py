@@ -0,0 +1,181 @@
+import json
+
+import lz4.frame
+import numpy as np
+import pytest
+
+from fancy_ray_tracer import (
+    Camera,
+    ChessPattern,
+    Cube,
+    Group,
+    Light,
+    Plane,
+    Sphere,
+    World,
+    make_color,
+    point,
+    scaling,
+    translation,
+    vector,
+    view_transform,
+)
+from fancy_ray_tracer import scene as scene_module
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.hashing import scene_hash
+from fancy_ray_tracer.primitives import CSG, BoundingBox
+from fancy_ray_tracer.scene import build_scene, load_scene
+from fancy_ray_tracer.utils import chain_ops
+
+OBJ = """
+v 0 0 0
+v 1 0 0
+v 0 1 0
+f 1 2 3
+"""
+
+SCENE = {
+    'camera': {'width': 16, 'height': 10, 'field_of_view': PI / 3,
+               'from': [0, 1.5, -5], 'to': [0, 1, 0], 'up': [0, 1, 0]},
+    'lights': [{'type': 'point', 'position': [-10, 10, -10], 'intensity': [1, 1, 1]}],
+    'materials': {
+        'red': {'color': [1, 0, 0], 'specular': 0.3},
+        'shiny_red': {'extends': 'red', 'reflective': 0.5},
+    },
+    'objects': [
+        {'type': 'plane', 'material': {
+            'pattern': {'type': 'chess', 'colors': [[0, 0, 0], [1, 1, 1]]}}},
+        {'type': 'sphere', 'material': 'shiny_red',
+         'transform': [['translate', 0, 1, 0], ['scale', 0.5, 0.5, 0.5]]},
+        {'type': 'group', 'bounded': True, 'children': [
+            {'type': 'cube', 'transform': [['translate', 2, 0.5, 0]]},
+            {'type': 'mesh', 'path': 'triangle.obj', 'material': 'red'},
+        ]},
+    ],
+}
+
+
+def write_scene(tmp_path, data=SCENE, name='scene.json'):
+    (tmp_path / 'triangle.obj').write_text(OBJ)
+    path = tmp_path / name
+    path.write_text(json.dumps(data))
+    return path
+
+
+def test_build_scene(tmp_path):
+    write_scene(tmp_path)
+    world, camera = build_scene(SCENE, tmp_path)
+    assert (camera.hsize, camera.vsize) == (16, 10)
+    assert np.allclose(camera.transform, view_transform(
+        point(0, 1.5, -5), point(0, 1, 0), vector(0, 1, 0)))
+    assert len(world.light) == 1
+    plane, sphere, box = world.objects
+    assert isinstance(plane, Plane)
+    assert plane.material.pattern == ChessPattern(make_color(0, 0, 0), make_color(1, 1, 1))
+    assert np.allclose(sphere.transform, chain_ops([translation(0, 1, 0), scaling(0.5, 0.5, 0.5)]))
+    assert np.allclose(sphere.material.color, (1, 0, 0))
+    assert sphere.material.specular == 0.3
+    assert sphere.material.reflective == 0.5
+    assert isinstance(box, BoundingBox)
+    cube, meshes = box.shape.shapes
+    assert isinstance(cube, Cube)
+    assert isinstance(meshes, Group)
+    assert np.allclose(meshes.shapes[0].material.color, (1, 0, 0))
+
+
+def test_scene_matches_script(tmp_path):
+    # the same scene built in python renders the same
+    floor = Plane()
+    floor.material.pattern = ChessPattern(make_color(0, 0, 0), make_color(1, 1, 1))
+    s = Sphere()
+    s.set_transform(chain_ops([translation(0, 1, 0), scaling(0.5, 0.5, 0.5)]))
+    s.material.color = make_color(1, 0, 0)
+    s.material.specular = 0.3
+    s.material.reflective = 0.5
+    expected = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [floor, s])
+    c = Camera(16, 10, PI / 3)
+    c.set_transform(view_transform(point(0, 1.5, -5), point(0, 1, 0), vector(0, 1, 0)))
+
+    data = dict(SCENE, objects=SCENE['objects'][:2])
+    world, camera = build_scene(data, tmp_path)
+    assert scene_hash(world, camera) == scene_hash(expected, c)
+
+
+def test_csg_and_errors(tmp_path):
+    world, _ = build_scene({'objects': [{'type': 'csg', 'operation': 'difference',
+                                         'left': {'type': 'sphere'}, 'right': {'type': 'cube'}}]})
+    assert isinstance(world.objects[0], CSG)
+    with pytest.raises(ValueError):
+        build_scene({'objects': [{'type': 'torus'}]})
+    with pytest.raises(ValueError):
+        build_scene({'objects': [{'type': 'sphere', 'material': 'missing'}]})
+    with pytest.raises(ValueError):
+        build_scene({'objects': [{'type': 'sphere', 'transform': [['twist', 1]]}]})
+
+
+def test_load_scene_cache(tmp_path, monkeypatch):
+    path = write_scene(tmp_path)
+    built = []
+    build = scene_module._build
+    monkeypatch.setattr(scene_module, '_build', lambda data, p: built.append(p) or build(data, p))
+    cache = tmp_path / 'cache'
+
+    world, camera = load_scene(path, directory=cache)
+    assert len(built) == 1
+    assert world._compiled is not None
+    again, camera_again = load_scene(path, directory=cache)
+    assert len(built) == 1
+    assert again._compiled is not None
+    assert scene_hash(again, camera_again) == scene_hash(world, camera)
+
+    # a changed mesh builds the scene again
+    (tmp_path / 'triangle.obj').write_text(OBJ + 'v 0 0 1\n')
+    load_scene(path, directory=cache)
+    assert len(built) == 2
+    load_scene(path, cache=False)
+    assert len(built) == 3
+
+    # a pickle of classes that are gone is built again and replaced
+    stale = b'\x80\x04cfancy_ray_tracer.scene\nRemovedScene\n.'
+    for cached in cache.iterdir():
+        cached.write_bytes(lz4.frame.compress(stale))
+    load_scene(path, directory=cache)
+    assert len(built) == 4
+    load_scene(path, directory=cache)
+    assert len(built) == 4
+
+    # and so is one written by another release
+    key = scene_module.scene_key(str(path), scene_module.read_scene(str(path)))
+    monkeypatch.setattr(scene_module, '__version__', 'next')
+    assert scene_module.scene_key(str(path), scene_module.read_scene(str(path))) != key
+
+
+@pytest.mark.skipif(scene_module.yaml is None, reason='pyyaml not installed')
+def test_yaml_scene(tmp_path):
+    path = tmp_path / 'scene.yaml'
+    path.write_text("""
+camera: {width: 8, height: 4}
+lights:
+  - {type: sphere, center: [0, 5, 0], radius: 1, intensity: [1, 1, 1], samples: 4}
+objects:
+  - {type: cylinder, minimum: 0, maximum: 1, closed: true, shadow: false}
+""")
+    world, camera = load_scene(path, cache=False)
+    assert camera.hsize == 8
+    cylinder = world.objects[0]
+    assert cylinder.closed and cylinder.maximum == 1
+    assert not cylinder.has_shadow
+
+
+def test_instances(tmp_path):
+    write_scene(tmp_path)
+    data = {
+        'geometry': {'triangle': {'type': 'mesh', 'path': 'triangle.obj', 'bounded': True}},
+        'objects': [{'type': 'instance', 'of': 'triangle', 'transform': [['translate', x, 0, 0]]}
+                    for x in range(3)],
+    }
+    world, _ = build_scene(data, tmp_path)
+    assert len(world.objects) == 3
+    assert all(obj.geometry is world.objects[0].geometry for obj in world.objects)
+    with pytest.raises(ValueError):
+        build_scene({'objects': [{'type': 'instance', 'of': 'teapot'}]})
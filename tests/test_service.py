@@ -0,0 +1,97 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from fancy_ray_tracer import Camera, Light, Sphere, World, make_color, point, vector, view_transform
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.service import RenderService, ResultCache, render_png
+
+
+def scene(x=0.0):
+    s = Sphere()
+    s.material.color = make_color(1, 0.2, 0.2)
+    w = World(Light(point(-10, 10, -10), make_color(1, 1, 1)), [s])
+    c = Camera(8, 6, PI / 3)
+    c.set_transform(view_transform(point(x, 0, -5), point(0, 0, 0), vector(0, 1, 0)))
+    return w, c
+
+
+def test_render_png():
+    data = render_png(*scene())
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (8, 6)
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(capacity=10, directory=tmp_path)
+    cache.put('a', b'123456')
+    cache.put('b', b'1234567')
+    assert len(cache) == 1
+    # dropped from memory but still on disk
+    assert cache.get('a') == b'123456'
+    assert 'c' not in cache
+
+
+def test_service_cache():
+    async def main():
+        async with RenderService(processes=1) as service:
+            first = await service.render(*scene())
+            # the same scene built again is answered from the cache
+            second = await service.render(*scene())
+            return service, first, second
+
+    service, first, second = asyncio.run(main())
+    assert first == second
+    assert service.rendered == 1
+    assert service.hits == 1
+
+
+def test_service_priority_and_cancel():
+    async def main():
+        service = RenderService(processes=1)
+        # queued before the workers start, so the order is up to priority
+        low = await service.submit(*scene(1), priority=0)
+        dropped = await service.submit(*scene(2), priority=5)
+        high = await service.submit(*scene(3), priority=10)
+        shared = await service.submit(*scene(3), priority=0)
+        assert shared is high
+        assert service.pending() == 3
+        service.cancel(dropped)
+        order = []
+        low.future.add_done_callback(lambda f: order.append('low'))
+        high.future.add_done_callback(lambda f: order.append('high'))
+        service.start()
+        try:
+            await asyncio.wait_for(asyncio.gather(low.future, high.future), 60)
+        finally:
+            await service.close()
+        return service, order, dropped
+
+    service, order, dropped = asyncio.run(main())
+    assert order == ['high', 'low']
+    assert dropped.cancelled()
+    assert service.rendered == 2
+
+
+def test_service_cancel_while_queue_full():
+    async def main():
+        service = RenderService(processes=1, max_queue=1)
+        await service.submit(*scene(1))
+        # the queue is full and nothing consumes it yet
+        waiting = asyncio.create_task(service.submit(*scene(2)))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        service.start()
+        try:
+            return await asyncio.wait_for(service.render(*scene(2)), 60), service
+        finally:
+            await service.close()
+
+    data, service = asyncio.run(main())
+    assert data.startswith(b'\x89PNG')
+    assert service.rendered == 2
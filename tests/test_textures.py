@@ -0,0 +1,165 @@
+import io
+import pickle
+
+import numpy as np
+from PIL import Image
+
+from fancy_ray_tracer import Camera, Light, Ray, World, make_color, point, vector, view_transform
+from fancy_ray_tracer.constants import PI
+from fancy_ray_tracer.parsers import WavefrontOBJ
+from fancy_ray_tracer.primitives import Plane, TriangleMesh
+from fancy_ray_tracer.textures import (
+    ImagePattern,
+    TextureCache,
+    build_mip_levels,
+    mip_level_count,
+    planar_map,
+    spherical_map,
+)
+
+
+def write_image(path, pixels):
+    Image.fromarray(np.asarray(pixels, dtype=np.uint8), 'RGB').save(path)
+    return path
+
+
+def quadrants(size=8):
+    # red top left, green top right, blue bottom left, white bottom right
+    pixels = np.zeros((size, size, 3), dtype=np.uint8)
+    half = size // 2
+    pixels[:half, :half] = (255, 0, 0)
+    pixels[:half, half:] = (0, 255, 0)
+    pixels[half:, :half] = (0, 0, 255)
+    pixels[half:, half:] = (255, 255, 255)
+    return pixels
+
+
+def test_mip_levels():
+    image = np.random.default_rng(0).uniform(size=(5, 3, 3)).astype(np.float32)
+    levels = build_mip_levels(image)
+    assert [level.shape[:2] for level in levels] == [(5, 3), (3, 2), (2, 1), (1, 1)]
+    levels = build_mip_levels(np.ones((4, 4, 3), dtype=np.float32))
+    assert len(levels) == 3
+    assert mip_level_count(5, 3) == 4
+    assert mip_level_count(4, 4) == 3
+    assert np.allclose(levels[-1], 1)
+
+
+def test_uv_mappings():
+    u, v = spherical_map(point(0, 0, 1))
+    assert np.isclose(u, 0.5) and np.isclose(v, 0.5)
+    u, v = spherical_map(point(0, 1, 0))
+    assert np.isclose(v, 1)
+    u, v = planar_map(point(1.25, 0, -0.25))
+    assert np.isclose(u, 0.25) and np.isclose(v, 0.75)
+    points = np.array([point(0, 0, 1), point(1.25, 0, -0.25)])
+    u, v = planar_map(points)
+    assert np.allclose(u, (0, 0.25)) and np.allclose(v, (0, 0.75))
+
+
+def test_image_pattern(tmp_path):
+    path = write_image(tmp_path / 'quadrants.png', quadrants())
+    pattern = ImagePattern(path, planar_map, TextureCache(directory=tmp_path / 'cache'))
+    assert np.allclose(pattern.uv_color_at(0, 1), (1, 0, 0))
+    assert np.allclose(pattern.uv_color_at(1, 1), (0, 1, 0))
+    assert np.allclose(pattern.uv_color_at(0, 0), (0, 0, 1))
+    assert np.allclose(pattern.uv_color_at(1, 0), (1, 1, 1))
+    # the smallest mip level is the average of the image
+    assert np.allclose(pattern.uv_color_at(0, 1, footprint=1), (0.5, 0.5, 0.5))
+
+    plane = Plane()
+    plane.material.pattern = pattern
+    assert np.allclose(plane.color_at(point(0.1, 0, 0.9)), (1, 0, 0))
+    points = np.array([point(0.1, 0, 0.9), point(0.9, 0, 0.1)])
+    assert np.allclose(plane.colors_at(points), ((1, 0, 0), (1, 1, 1)))
+
+
+def test_texture_cache_lru(tmp_path):
+    first = write_image(tmp_path / 'a.png', quadrants(8))
+    second = write_image(tmp_path / 'b.png', quadrants(8))
+    cache = TextureCache(directory=tmp_path / 'cache')
+    size = sum(level.nbytes for level in cache.get(first))
+    cache.capacity = size + size // 2
+    assert cache.get(first) is cache.get(first)
+    cache.get(second)
+    assert len(cache) == 1
+    assert cache.nbytes == size
+
+    # a new process finds the pyramids on disk and maps them
+    other = pickle.loads(pickle.dumps(cache))
+    assert len(other) == 0
+    levels = other.get(first)
+    assert isinstance(levels[0], np.memmap)
+    assert np.allclose(levels[0], cache.get(first)[0])
+
+
+def test_texture_cache_reload_levels(tmp_path):
+    path = write_image(tmp_path / 'odd.png', np.zeros((5, 5, 3)))
+    levels = TextureCache(directory=tmp_path / 'cache').get(path)
+    assert len(levels) == 4
+    # read back from disk by a new cache
+    assert len(TextureCache(directory=tmp_path / 'cache').get(path)) == 4
+
+
+def test_footprint_picks_mip_level(tmp_path):
+    # red and green texels alternate, far away they blend
+    pixels = np.zeros((64, 64, 3), dtype=np.uint8)
+    pixels[...] = (255, 0, 0)
+    pixels[(np.arange(64)[:, None] + np.arange(64)) % 2 == 1] = (0, 255, 0)
+    path = write_image(tmp_path / 'fine.png', pixels)
+    plane = Plane()
+    plane.material.pattern = ImagePattern(path, planar_map, TextureCache(directory=tmp_path / 'cache'))
+    plane.material.ambient = 1
+    plane.material.diffuse = 0
+    plane.material.specular = 0
+    w = World(Light(point(0, 10, 0), make_color(1, 1, 1)), [plane])
+
+    assert np.allclose(plane.color_at(point(0.3, 0, 0.3), footprint=1), (0.5, 0.5, 0))
+    c = Camera(8, 8, PI / 3)
+    c.set_transform(view_transform(point(0, 40, 0), point(0, 0, 0), vector(0, 0, 1)))
+    color = w.trace(c.ray_for_pixel(4, 4))
+    assert np.allclose(color[:3], (0.5, 0.5, 0), atol=0.05)
+    # a ray without a cone gets the full resolution texel
+    r = c.ray_for_pixel(4, 4)
+    color = w.trace(Ray(r.origin, r.direction))
+    assert abs(color[0] - color[1]) > 0.4
+
+
+def test_pickle_image_pattern(tmp_path):
+    path = write_image(tmp_path / 'quadrants.png', quadrants())
+    pattern = ImagePattern(path, planar_map, TextureCache(directory=tmp_path / 'cache'))
+    pattern.levels
+    copy = pickle.loads(pickle.dumps(pattern))
+    assert len(copy.cache) == 0
+    assert copy == pattern
+    assert np.allclose(copy.uv_color_at(0, 1), (1, 0, 0))
+
+
+OBJ = """
+v 0 0 0
+v 1 0 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 0 1
+vn 0 0 1
+f 1/1/1 2/2/1 3/3/1
+"""
+
+
+def test_mesh_uv(tmp_path):
+    g = WavefrontOBJ(io.StringIO(OBJ)).parse()
+    mesh = g.shapes[0]
+    assert isinstance(mesh, TriangleMesh)
+    assert mesh.texture_groups == [(0, 1, 2)]
+    xs = mesh.intersect(point(0.25, 0.5, 1), vector(0, 0, -1))
+    assert len(xs) == 1
+    assert np.allclose(xs[0].object.uv, (0.25, 0.5))
+
+    path = write_image(tmp_path / 'quadrants.png', quadrants())
+    mesh.material.pattern = ImagePattern(path, planar_map, TextureCache(directory=tmp_path / 'cache'))
+    # the uv of the hit wins over the mapping of the point
+    assert np.allclose(xs[0].object.color_at(point(0.25, 0.5, 0)),
+                       mesh.material.pattern.uv_color_at(0.25, 0.5))
+    assert np.isclose(xs[0].object.uv_scale, 1)
+    assert np.allclose(xs[0].object.color_at(point(0.25, 0.5, 0), footprint=8), (0.5, 0.5, 0.5))
@@ -1,6 +1,9 @@
 from math import sqrt
+from random import seed
 from typing import List
 
+import pytest
+
 from fancy_ray_tracer import (
     Light,
     Ray,
@@ -16,7 +19,7 @@ from fancy_ray_tracer.constants import ATOL
 from fancy_ray_tracer.illumination import lighting
 from fancy_ray_tracer.materials import DefaultPattern
 from fancy_ray_tracer.matrices import translation
-from fancy_ray_tracer.primitives import Plane
+from fancy_ray_tracer.primitives import Plane, TriangleMesh
 from fancy_ray_tracer.ray import Computations, Intersection, hit_sorted
 
 SPHERE_CACHE = {}
@@ -285,3 +288,153 @@ def test_refraction_reflection():
     cmp = Computations(xs[0], r, xs)
     color = w.shade_hit(cmp)
     assert equal(color, make_color(0.93391, 0.69643, 0.69243))
+
+
+class CountingWorld(World):
+    __slots__ = ("rays",)
+
+    def __init__(self, light=(), objects=()) -> None:
+        super().__init__(light, objects)
+        self.rays = 0
+
+    def color_at(self, ray, remaining=5, throughput=1.0):
+        self.rays += 1
+        return super().color_at(ray, remaining, throughput)
+
+
+def facing_mirrors(reflective):
+    w = CountingWorld(Light(point(0, 0, 0), make_color(1, 1, 1)))
+    lower = Plane()
+    lower.material.reflective = reflective
+    lower.set_transform(translation(0, -1, 0))
+    w.add_object(lower)
+    upper = Plane()
+    upper.material.reflective = reflective
+    upper.set_transform(translation(0, 1, 0))
+    w.add_object(upper)
+    return w, lower
+
+
+def test_low_contribution_stops_reflection():
+    w, _ = facing_mirrors(0.2)
+    r = Ray(point(0, 0, 0), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    w.color_at(r)
+    # 0.2 ** 4 is below the default 1 / 255 threshold
+    assert w.rays == 4
+
+
+def test_min_contribution_zero_uses_depth_limit():
+    w, _ = facing_mirrors(0.2)
+    w.min_contribution = 0.0
+    r = Ray(point(0, 0, 0), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    w.color_at(r)
+    assert w.rays == 6
+
+
+def test_reflection_below_threshold_is_black():
+    w, lower = facing_mirrors(0.5)
+    w.min_contribution = 0.6
+    r = Ray(point(0, 0, -3), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    xs = [Intersection(sqrt(2), lower)]
+    cmp = Computations(xs[0], r, xs)
+    assert equal(w.reflected_color(cmp), make_color(0, 0, 0))
+    assert w.rays == 0
+
+
+def test_russian_roulette_is_unbiased():
+    w, lower = facing_mirrors(0.5)
+    w.min_contribution = 0.0
+    r = Ray(point(0, 0, -3), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    xs = [Intersection(sqrt(2), lower)]
+    cmp = Computations(xs[0], r, xs)
+    expected = w.reflected_color(cmp, 1)
+
+    w.min_contribution = 1.0
+    w.russian_roulette = True
+    seed(0)
+    colors = [w.reflected_color(cmp, 1) for _ in range(4000)]
+    assert equal(sum(colors) / len(colors), expected, 0.02, 0.02)
+
+
+def test_ray_budget():
+    w, _ = facing_mirrors(1)
+    r = Ray(point(0, 0, 0), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    w.trace(r, 2)
+    assert w.rays == 3
+    w.rays = 0
+    w.trace(r, 0)
+    assert w.rays == 1
+    w.rays = 0
+    w.trace(r)
+    assert w.rays == 6
+
+
+class FailingWorld(CountingWorld):
+    __slots__ = ()
+
+    def color_at(self, ray, remaining=5, throughput=1.0):
+        if self.rays == 1:
+            raise RuntimeError('interrupted')
+        return super().color_at(ray, remaining, throughput)
+
+
+def test_ray_budget_reset_on_error():
+    w = FailingWorld(Light(point(0, 0, 0), make_color(1, 1, 1)), facing_mirrors(1)[0].objects)
+    r = Ray(point(0, 0, 0), vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+    with pytest.raises(RuntimeError):
+        w.trace(r, 2)
+    assert w._rays_left is None
+    w.rays = 0
+    xs = w.intersec(r)
+    with pytest.raises(RuntimeError):
+        w.shade_primary(Computations(hit_sorted(xs), r, xs), 2)
+    assert w._rays_left is None
+
+
+def test_shadow_occluder_cache():
+    w = make_default_world()
+    assert w.is_shadowed(point(10, -10, 10)) == True
+    assert w.shadow_cache_stats()["misses"] == 1
+    assert w.is_shadowed(point(10, -10.1, 10)) == True
+    assert w.is_shadowed(point(10.1, -10, 10)) == True
+    stats = w.shadow_cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert abs(stats["hit_rate"] - 2 / 3) < ATOL
+    # a lit point tests the cached object and then the whole world
+    assert w.is_shadowed(point(-2, 2, -2)) == False
+    assert w.shadow_cache_stats()["misses"] == 2
+    w.reset_shadow_cache()
+    assert w.shadow_cache_stats() == {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
+
+def test_shadow_cache_follows_occluder():
+    w = make_default_world()
+    far = Sphere()
+    far.set_transform(translation(-10, 5, -5))
+    w.add_object(far)
+    assert w.is_shadowed(point(10, -10, 10)) == True
+    assert w.is_shadowed(point(-10, 0, 0)) == True
+    assert w.shadow_cache_stats()["hits"] == 0
+    assert w.is_shadowed(point(-10, -0.1, 0)) == True
+    assert w.shadow_cache_stats()["hits"] == 1
+
+
+def test_no_shadow_object_lets_light_through():
+    w = make_default_world()
+    glass = Plane()
+    glass.set_transform(translation(0, 5, 0))
+    glass.has_shadow = False
+    w.add_object(glass)
+    # the plane is the nearest hit but the spheres still block the light
+    assert w.is_shadowed(point(10, -10, 10)) == True
+    assert w.is_shadowed(point(0, 10, 0)) == False
+
+
+def test_mesh_casts_shadow():
+    mesh = TriangleMesh([point(-5, 5, -5), point(5, 5, -5), point(0, 5, 5)], [(0, 1, 2)],
+                        [vector(0, 1, 0)], [(0, 0, 0)])
+    w = World(Light(point(0, 10, 0), make_color(1, 1, 1)), [mesh])
+    assert w.is_shadowed(point(0, 0, 0))
+    mesh.has_shadow = False
+    assert not w.is_shadowed(point(0, 0, 0))